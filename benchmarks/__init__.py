@@ -0,0 +1,8 @@
+"""
+Benchmarks of the review app.
+
+* `synthetic`: generate corpora, pattern files, and workspaces of any size
+* `suite`: benchmark search, corpus access, annotation storage, and navigation on synthetic
+  corpora (e.g., 10k/100k/1M rows), writing the results as JSON to compare between versions
+* the other modules benchmark a single change against the behavior it replaced
+"""
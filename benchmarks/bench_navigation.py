@@ -0,0 +1,120 @@
+"""
+Benchmark record-to-record navigation latency through the Textual pilot.
+
+Compares updating the snippet's text area in place (current behavior) against remounting a new
+`HighlighterWidget` for every record (the previous behavior).
+
+Usage:
+* `PYTHONPATH=src python benchmarks/bench_navigation.py`
+* `PYTHONPATH=src python benchmarks/bench_navigation.py --records 100`
+"""
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import tomlkit
+from rich.text import Text
+from textual.widgets import Static
+
+from textual_review_app.app import ReviewApp
+from textual_review_app.widgets.highlighter_widget import HighlighterWidget
+from textual_review_app.widgets.snippet_widget import SnippetWidget
+
+EXAMPLE_WKSP = Path(__file__).resolve().parents[1] / 'example' / 'wksp'
+
+
+async def remount_update_entry(self, entry=None, comment=None, marks=None):
+    """`SnippetWidget.update_entry` before in-place updates: a new HighlighterWidget per call."""
+    if entry is not None:
+        self.show_full_text_pre = False
+        self.show_full_text_post = False
+        self.entry = entry
+    if marks is not None:
+        self.marks = marks
+    await self.scroll.query_one('#textfield').remove()
+    patterns = list(self.config.highlights) + list(self._temp_patterns)
+    await self.scroll.mount(
+        HighlighterWidget(
+            self.entry[self.PRETEXT if self.show_full_text_pre else self.PRE],
+            self.entry[self.MATCH],
+            self.entry[self.POSTTEXT if self.show_full_text_post else self.POST],
+            patterns,
+            self.marks,
+            self.config.mark_colors,
+            id='textfield',
+        ) if self.entry is not None else Static(Text('Press next to continue.'), id='textfield'),
+    )
+    if comment is not None:
+        self.comment = comment
+        self.comment_area.text = comment
+
+
+def make_workspace(path: Path, highlights) -> Path:
+    shutil.copy2(EXAMPLE_WKSP / 'corpus.pattern.jsonl', path / 'corpus.pattern.jsonl')
+    config_path = path / 'config.toml'
+    doc = tomlkit.document()
+    doc['title'] = 'Navigation Benchmark'
+    doc['offset'] = 0
+    doc['corpus'] = 'corpus.pattern.jsonl'
+    doc['highlights'] = highlights
+    doc['options'] = ['Relevant', 'Uncertain', 'Not Relevant']
+    doc['first_run'] = False
+    doc['user'] = 'bench'
+    config_path.write_text(tomlkit.dumps(doc), encoding='utf8')
+    return config_path
+
+
+async def time_navigation(config_path: Path, n_records: int) -> list[float]:
+    app = ReviewApp(config_path)
+    timings = []
+    async with app.run_test() as pilot:
+        await pilot.click('#ok')
+        await pilot.pause()
+        for _ in range(n_records):
+            start = time.perf_counter()
+            await pilot.press('ctrl+right')
+            await pilot.pause()
+            timings.append(time.perf_counter() - start)
+    app.annotations.close()
+    app.corpus.close()
+    return timings
+
+
+def run(n_records=50):
+    highlights = [
+        {'regex': r'\bthe\b', 'color': 'yellow'},
+        {'regex': r'\w+ly\b', 'color': 'green'},
+        {'regex': r'\b[A-Z]\w+', 'color': 'cyan'},
+    ]
+    results = {}
+    in_place = SnippetWidget.update_entry
+    for name, update_entry in [('remount', remount_update_entry), ('in_place', in_place)]:
+        SnippetWidget.update_entry = update_entry
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                config_path = make_workspace(Path(tmp), highlights)
+                results[name] = asyncio.run(time_navigation(config_path, n_records))
+        finally:
+            SnippetWidget.update_entry = in_place
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('--records', type=int, default=50, help='Number of Save & Next navigations to time.')
+    args = parser.parse_args()
+
+    print(f'{"mode":>10} {"mean (ms)":>10} {"p50 (ms)":>10} {"p95 (ms)":>10}')
+    for name, timings in run(args.records).items():
+        ms = sorted(t * 1000 for t in timings)
+        print(f'{name:>10} {statistics.mean(ms):>10.1f} {ms[len(ms) // 2]:>10.1f}'
+              f' {ms[min(len(ms) - 1, int(len(ms) * 0.95))]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark how pattern search time scales with the number of categories.
+
+Compares the per-pattern loop (each category's regex runs `finditer` over every text) against
+the literal-prefiltered `PatternMatcher` used by `textual-review-search`.
+
+Usage:
+* `PYTHONPATH=src python benchmarks/bench_search_categories.py`
+* `PYTHONPATH=src python benchmarks/bench_search_categories.py --docs 2000 --max-categories 128`
+"""
+import random
+import time
+
+from search import PatternMatcher
+
+WORDS_PER_CATEGORY = 4
+
+
+def make_vocabulary(rng: random.Random, size: int):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocab = set()
+    while len(vocab) < size:
+        vocab.add(''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    return sorted(vocab)
+
+
+def make_patterns(vocab, n_categories):
+    return [
+        (f'CAT{i}', r'\b(?:' + '|'.join(vocab[i * WORDS_PER_CATEGORY:(i + 1) * WORDS_PER_CATEGORY]) + r')\w*\b')
+        for i in range(n_categories)
+    ]
+
+
+def make_docs(rng: random.Random, vocab, n_docs, words_per_doc, hit_rate):
+    """Documents are mostly filler words; `hit_rate` of the words are drawn from pattern keywords."""
+    filler = vocab[len(vocab) // 2:]
+    keywords = vocab[:len(vocab) // 2]
+    return [
+        ' '.join(
+            rng.choice(keywords) if rng.random() < hit_rate else rng.choice(filler)
+            for _ in range(words_per_doc)
+        )
+        for _ in range(n_docs)
+    ]
+
+
+def time_matcher(matcher, docs):
+    start = time.perf_counter()
+    hits = [list(matcher.finditer(doc)) for doc in docs]
+    return time.perf_counter() - start, hits
+
+
+def run(n_docs=500, words_per_doc=800, hit_rate=0.001, max_categories=64, seed=0):
+    rng = random.Random(seed)
+    vocab = make_vocabulary(rng, max_categories * WORDS_PER_CATEGORY * 2)
+    docs = make_docs(rng, vocab, n_docs, words_per_doc, hit_rate)
+    results = []
+    n_categories = 1
+    while n_categories <= max_categories:
+        patterns = make_patterns(vocab, n_categories)
+        loop_time, expected = time_matcher(PatternMatcher(patterns, prefilter=False), docs)
+        prefiltered_time, actual = time_matcher(PatternMatcher(patterns), docs)
+        if actual != expected:
+            raise AssertionError(f'Prefiltered matcher differs from per-pattern loop at {n_categories} categories')
+        results.append({
+            'categories': n_categories,
+            'hits': sum(len(h) for h in expected),
+            'loop_seconds': loop_time,
+            'prefiltered_seconds': prefiltered_time,
+        })
+        n_categories *= 2
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('--docs', type=int, default=500, help='Number of synthetic documents.')
+    parser.add_argument('--words', type=int, default=800, help='Words per document.')
+    parser.add_argument('--hit-rate', dest='hit_rate', type=float, default=0.001,
+                        help='Fraction of words drawn from pattern keywords.')
+    parser.add_argument('--max-categories', dest='max_categories', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'{"categories":>10} {"hits":>8} {"loop (s)":>10} {"prefiltered (s)":>16} {"speedup":>8}')
+    for r in run(args.docs, args.words, args.hit_rate, args.max_categories, args.seed):
+        print(f'{r["categories"]:>10} {r["hits"]:>8} {r["loop_seconds"]:>10.3f}'
+              f' {r["prefiltered_seconds"]:>16.3f} {r["loop_seconds"] / r["prefiltered_seconds"]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
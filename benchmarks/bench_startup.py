@@ -0,0 +1,103 @@
+"""
+Benchmark app startup: import time, and time to the first frame and to the first record.
+
+* import: `python -X importtime -c "import textual_review_app.app"` in a fresh process (so modals and
+  other modules imported on first use don't count), and the number of modules imported
+* first frame: from creating `ReviewApp` until the first frame is displayed (headless)
+* ready: from creating `ReviewApp` until the first record and the instructions are shown; 'cold' runs
+  build the corpus's offset index first (as on the first launch), 'warm' runs reuse it
+
+Usage:
+* `PYTHONPATH=src python -m benchmarks.bench_startup`
+* `PYTHONPATH=src python -m benchmarks.bench_startup --rows 1000000 --repeats 3`
+"""
+import asyncio
+import inspect
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import make_workspace
+
+REPO = Path(__file__).resolve().parents[1]
+MODULE = 'textual_review_app.app'
+
+
+def time_import(repeats=5) -> dict:
+    """Median cumulative import time (ms) of the app module in a fresh interpreter, and modules imported."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO / 'src'), os.environ.get('PYTHONPATH')])))
+    timings = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import sys, {MODULE}; print(len(sys.modules))'],
+            capture_output=True, text=True, check=True, env=env,
+        )
+        n_modules = int(result.stdout.strip())
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if line.startswith('import time:') and line.rsplit('|', 1)[-1].strip() == MODULE:
+                timings.append(int(line.split('|')[1]) / 1000)
+    return {'import_ms': statistics.median(timings), 'modules': n_modules}
+
+
+async def time_startup(config_path: Path) -> tuple[float, float]:
+    """Seconds until the first frame and until the instructions are shown over the first record."""
+    from textual_review_app.app import ReviewApp
+    from textual_review_app.widgets.info_modal import InfoModal
+
+    first_frame = []
+
+    class TimedApp(ReviewApp):
+        CSS_PATH = Path(inspect.getfile(ReviewApp)).parent / ReviewApp.CSS_PATH
+
+        def on_ready(self):
+            first_frame.append(time.perf_counter())
+
+    start = time.perf_counter()
+    app = TimedApp(config_path)
+    async with app.run_test() as pilot:
+        while not isinstance(app.screen, InfoModal):
+            await pilot.pause(0.001)
+        ready = time.perf_counter()
+    app.annotations.close()
+    app.corpus.close()
+    return first_frame[0] - start, ready - start
+
+
+def run(config_path: Path, repeats=5) -> dict:
+    results = time_import(repeats)
+    corpus_path = config_path.parent / 'corpus.pattern.jsonl'
+    for mode in ('cold', 'warm'):
+        first_frames = []
+        readies = []
+        for _ in range(repeats):
+            if mode == 'cold':
+                corpus_path.with_name(f'{corpus_path.name}.idx').unlink(missing_ok=True)
+            first_frame, ready = asyncio.run(time_startup(config_path))
+            first_frames.append(first_frame * 1000)
+            readies.append(ready * 1000)
+        results[f'{mode}_first_frame_ms'] = statistics.median(first_frames)
+        results[f'{mode}_ready_ms'] = statistics.median(readies)
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('--rows', type=int, default=100_000, help='Number of records in the synthetic corpus.')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of startups to take the median of.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(make_workspace(Path(tmp), args.rows), args.repeats)
+    for metric, value in results.items():
+        print(f'{metric:>20} {value:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
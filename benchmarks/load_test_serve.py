@@ -0,0 +1,175 @@
+"""
+Load test the web server: per-session memory and time-to-first-frame as browser sessions connect.
+
+Starts `serve.py` on the example workspace (or `--config`), opens `--sessions` websocket sessions
+the way the browser does, and reports for each mode:
+* time from opening the websocket to the first frame of the app
+* memory of the server's process tree per session: PSS (proportional set size, which splits pages
+  shared copy-on-write between the processes sharing them) and RSS (which counts them in full)
+
+Linux only (reads `/proc`).
+
+Usage:
+* `python benchmarks/load_test_serve.py`
+* `python benchmarks/load_test_serve.py --sessions 20 --mode fork`
+"""
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE_WKSP = ROOT / 'example' / 'wksp'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def descendants(pid: int) -> list[int]:
+    """`pid` and all of its descendants."""
+    pids = [pid]
+    for p in pids:
+        try:
+            for task in os.listdir(f'/proc/{p}/task'):
+                with open(f'/proc/{p}/task/{task}/children') as fh:
+                    pids.extend(int(child) for child in fh.read().split())
+        except OSError:
+            pass  # exited
+    return pids
+
+
+def memory_kb(pid: int) -> tuple[int, int]:
+    """Total (PSS, RSS) in kB of `pid` and its descendants."""
+    pss = rss = 0
+    for p in descendants(pid):
+        try:
+            with open(f'/proc/{p}/smaps_rollup') as fh:
+                for line in fh:
+                    if line.startswith('Pss:'):
+                        pss += int(line.split()[1])
+                    elif line.startswith('Rss:'):
+                        rss += int(line.split()[1])
+        except OSError:
+            pass
+    return pss, rss
+
+
+def start_server(config_path: Path, port: int, mode: str) -> subprocess.Popen:
+    cmd = [sys.executable, str(ROOT / 'src' / 'serve.py'), str(config_path), '--port', str(port)]
+    if mode == 'fork':
+        cmd.append('--fork')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT / 'src'), os.environ.get('PYTHONPATH')])))
+    # the default command (`python textual_review_app/app.py`) is relative to `src`
+    process = subprocess.Popen(cmd, cwd=ROOT / 'src', env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('localhost', port), timeout=1):
+                return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'Server ({mode}) failed to start.')
+
+
+async def open_session(http: aiohttp.ClientSession, port: int, timeout: float):
+    """Connect as a browser would; return (websocket, seconds until the first frame)."""
+    start = time.perf_counter()
+    ws = await http.ws_connect(f'http://localhost:{port}/ws?width=120&height=40')
+    async with asyncio.timeout(timeout):
+        async for message in ws:
+            if message.type == aiohttp.WSMsgType.BINARY:
+                return ws, time.perf_counter() - start
+            if message.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                break
+    raise RuntimeError('Session closed before its first frame.')
+
+
+async def drain(ws):
+    # keep reading so the app isn't blocked writing to a full socket
+    async for _ in ws:
+        pass
+
+
+async def load_test(server: subprocess.Popen, port: int, n_sessions: int, settle: float, timeout: float):
+    baseline = memory_kb(server.pid)
+    first_frames = []
+    async with aiohttp.ClientSession() as http:
+        sessions = []
+        drains = []
+        for _ in range(n_sessions):
+            ws, elapsed = await open_session(http, port, timeout)
+            sessions.append(ws)
+            drains.append(asyncio.create_task(drain(ws)))
+            first_frames.append(elapsed)
+        await asyncio.sleep(settle)
+        loaded = memory_kb(server.pid)
+        for ws in sessions:
+            await ws.close()
+        for task in drains:
+            task.cancel()
+    return baseline, loaded, first_frames
+
+
+def make_workspace(path: Path, config_path: Path = None) -> Path:
+    if config_path is not None:
+        return config_path
+    for name in ['corpus.pattern.jsonl', 'config.toml']:
+        shutil.copy2(EXAMPLE_WKSP / name, path / name)
+    return path / 'config.toml'
+
+
+def run(modes, n_sessions=10, settle=2.0, timeout=60.0, config_path: Path = None):
+    results = {}
+    for mode in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            config = make_workspace(Path(tmp), config_path)
+            port = free_port()
+            server = start_server(config.resolve(), port, mode)
+            try:
+                results[mode] = asyncio.run(load_test(server, port, n_sessions, settle, timeout))
+            finally:
+                server.terminate()
+                server.wait()
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('--sessions', type=int, default=10, help='Number of concurrent sessions to open.')
+    parser.add_argument('--mode', choices=['subprocess', 'fork', 'both'], default='both',
+                        help='Serve each session in its own interpreter (subprocess), from the fork server, or both.')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Seconds to wait after the last session connects before measuring memory.')
+    parser.add_argument('--config', type=Path, default=None,
+                        help='Workspace config to serve (default: a copy of the example workspace).')
+    args = parser.parse_args()
+
+    modes = ['subprocess', 'fork'] if args.mode == 'both' else [args.mode]
+    print(f'{"mode":>10} {"sessions":>8} {"PSS/session (MB)":>17} {"RSS/session (MB)":>17}'
+          f' {"first frame p50 (ms)":>21} {"p95 (ms)":>9}')
+    for mode, (baseline, loaded, first_frames) in run(modes, args.sessions, args.settle, config_path=args.config).items():
+        ms = sorted(t * 1000 for t in first_frames)
+        pss = (loaded[0] - baseline[0]) / len(ms) / 1024
+        rss = (loaded[1] - baseline[1]) / len(ms) / 1024
+        print(f'{mode:>10} {len(ms):>8} {pss:>17.1f} {rss:>17.1f}'
+              f' {statistics.median(ms):>21.1f} {ms[min(len(ms) - 1, int(len(ms) * 0.95))]:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Stress test record leasing with many concurrent reviewer processes on one `annotations.db`.
+
+Each process is a reviewer (per-user annotations) that repeatedly leases a batch of records
+(`AnnotationStore.acquire_leases`), saves an annotation for each, and leases again, until the
+corpus is exhausted. Reports `acquire_leases` latency and checks that every record was reviewed
+exactly once.
+
+Usage:
+* `PYTHONPATH=src python benchmarks/stress_leases.py`
+* `PYTHONPATH=src python benchmarks/stress_leases.py --reviewers 48 --records 20000 --batch 10`
+* `PYTHONPATH=src python benchmarks/stress_leases.py --reviewers 48 --review-ms 20` (closer to people reviewing)
+"""
+import multiprocessing
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from textual_review_app.annotation_store import Annotation, AnnotationStore
+
+
+def review(args) -> tuple[str, list[int], list[float]]:
+    """Lease and review records as `user` until none are left; return (user, reviewed rowids, lease timings)."""
+    db_path, user, total, batch, write_behind, review_ms = args
+    store = AnnotationStore(db_path, user=user, per_user=True, write_behind=write_behind)
+    reviewed = []
+    timings = []
+    try:
+        while True:
+            start = time.perf_counter()
+            leased = store.acquire_leases(batch, total)
+            timings.append(time.perf_counter() - start)
+            if not leased:
+                break
+            for rowid in leased:
+                if review_ms:
+                    time.sleep(review_ms / 1000)
+                annot = Annotation(rowid)
+                annot.selected = ['Relevant']
+                store.save(rowid, annot)
+                reviewed.append(rowid)
+    finally:
+        store.close()
+    return user, reviewed, timings
+
+
+def run(n_reviewers=24, n_records=5000, batch=20, write_behind=False, review_ms=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'annotations.db'
+        AnnotationStore(db_path).close()  # create the schema before the reviewers race to do so
+        jobs = [(db_path, f'reviewer{i}', n_records, batch, write_behind, review_ms) for i in range(n_reviewers)]
+        start = time.perf_counter()
+        with multiprocessing.get_context('spawn').Pool(n_reviewers) as pool:
+            results = pool.map(review, jobs)
+        elapsed = time.perf_counter() - start
+        store = AnnotationStore(db_path)
+        progress = store.progress()
+        store.close()
+    return results, progress, elapsed
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('--reviewers', type=int, default=24, help='Number of concurrent reviewer processes.')
+    parser.add_argument('--records', type=int, default=5000, help='Number of records in the corpus.')
+    parser.add_argument('--batch', type=int, default=20, help='Records leased at a time.')
+    parser.add_argument('--write-behind', dest='write_behind', action='store_true', default=False,
+                        help='Reviewers save with write-behind (see `AnnotationStore`).')
+    parser.add_argument('--review-ms', dest='review_ms', type=float, default=0,
+                        help='Time each reviewer spends on a record before saving (0: save as fast as possible).')
+    args = parser.parse_args()
+
+    results, progress, elapsed = run(args.reviewers, args.records, args.batch, args.write_behind, args.review_ms)
+    rowids = sorted(rowid for _, reviewed, _ in results for rowid in reviewed)
+    ms = sorted(t * 1000 for _, _, timings in results for t in timings)
+    print(f'{args.reviewers} reviewers reviewed {len(rowids)} / {args.records} records in {elapsed:.1f}s')
+    print(f'acquire_leases: {len(ms)} calls; mean {statistics.mean(ms):.2f} ms; p50 {ms[len(ms) // 2]:.2f} ms;'
+          f' p95 {ms[int(len(ms) * 0.95)]:.2f} ms; p99 {ms[int(len(ms) * 0.99)]:.2f} ms; max {ms[-1]:.2f} ms')
+    per_user = sorted(counts['reviewed'] for user, counts in progress.items() if user)
+    print(f'records per reviewer: min {per_user[0]}, max {per_user[-1]}')
+    if rowids != list(range(args.records)):
+        duplicates = len(rowids) - len(set(rowids))
+        missing = args.records - len(set(rowids))
+        raise SystemExit(f'FAILED: {duplicates} records reviewed more than once; {missing} never reviewed')
+    print('OK: every record was leased to and reviewed by exactly one reviewer')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""
+Benchmark the review app on synthetic corpora of increasing size, and compare results between versions.
+
+For each size (number of records to review), a workspace is generated (see `benchmarks.synthetic`), then:
+* `search`: `textual-review-search` (`search.main`) over the workspace's documents
+* `corpus`: opening `Corpus` with and without its offset index, and random/sequential record access
+* `annotations`: `AnnotationStore` save and get latency, and exporting to jsonlines
+* `navigation`: Save & Next through `ReviewApp.run_test` (headless)
+* `startup`: importing the app, and time to the first frame and to the first record (see `benchmarks.bench_startup`)
+* `clusters`: near-duplicate clustering (`build_clusters`) of the workspace's records
+
+Results are written as JSON: one entry per benchmark and size, along with the version, commit,
+and machine they were measured on.
+
+Usage:
+* `PYTHONPATH=src python -m benchmarks.suite --output results.json`
+* `PYTHONPATH=src python -m benchmarks.suite --rows 10000 100000 1000000 --output results.json`
+* `PYTHONPATH=src python -m benchmarks.suite --benchmarks corpus annotations --baseline old.json --output new.json`
+    * Prints the change in each metric from `old.json`
+"""
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import tomlkit
+
+from benchmarks.synthetic import SyntheticCorpus, make_workspace
+from textual_review_app.annotation_store import Annotation, AnnotationStore
+from textual_review_app.corpus import Corpus
+from textual_review_app.profiling import percentile
+
+REPO = Path(__file__).resolve().parents[1]
+SIZES = (10_000, 100_000)
+BENCHMARKS = ('search', 'corpus', 'annotations', 'navigation', 'startup', 'clusters')
+
+
+def latency(seconds: list[float]) -> dict[str, float]:
+    """Mean and p50/p95/p99/max of `seconds`, in milliseconds."""
+    ordered = sorted(s * 1000 for s in seconds)
+    return {
+        'mean_ms': sum(ordered) / len(ordered),
+        'p50_ms': percentile(ordered, 0.5),
+        'p95_ms': percentile(ordered, 0.95),
+        'p99_ms': percentile(ordered, 0.99),
+        'max_ms': ordered[-1],
+    }
+
+
+def bench_search(wksp: Path, workers=1) -> dict:
+    import search
+
+    corpus_file = wksp / 'corpus.jsonl'
+    argv = sys.argv
+    sys.argv = ['textual-review-search', str(wksp / 'patterns.txt'), str(corpus_file), '--workers', str(workers)]
+    try:
+        start = time.perf_counter()
+        search.main()
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.argv = argv
+    with open(corpus_file.with_suffix('.pattern.manifest.json'), encoding='utf8') as fh:
+        hits = json.load(fh)['rows']
+    docs = search.count_lines(corpus_file)
+    mb = corpus_file.stat().st_size / 1e6
+    return {
+        'seconds': elapsed,
+        'documents': docs,
+        'hits': hits,
+        'docs_per_s': docs / elapsed,
+        'mb_per_s': mb / elapsed,
+    }
+
+
+def bench_corpus(wksp: Path, samples: int, rng: random.Random) -> dict:
+    corpus_path = wksp / 'corpus.pattern.jsonl'
+    corpus_path.with_name(f'{corpus_path.name}.idx').unlink(missing_ok=True)
+    start = time.perf_counter()
+    corpus = Corpus(corpus_path, prefetch=0)
+    build = time.perf_counter() - start
+    corpus.close()
+
+    start = time.perf_counter()
+    corpus = Corpus(corpus_path, prefetch=0)
+    reopen = time.perf_counter() - start
+    try:
+        items = [rng.randrange(len(corpus)) for _ in range(samples)]
+        timings = []
+        for item in items:  # mostly cache misses
+            start = time.perf_counter()
+            corpus[item]
+            timings.append(time.perf_counter() - start)
+        random_get = latency(timings)
+        timings = []
+        for item in range(min(samples, len(corpus))):
+            start = time.perf_counter()
+            corpus[item]
+            timings.append(time.perf_counter() - start)
+        sequential_get = latency(timings)
+        rows = len(corpus)
+    finally:
+        corpus.close()
+    return {
+        'rows': rows,
+        'open_build_index_ms': build * 1000,
+        'open_ms': reopen * 1000,
+        **{f'random_get_{key}': value for key, value in random_get.items()},
+        **{f'sequential_get_{key}': value for key, value in sequential_get.items()},
+    }
+
+
+def bench_annotations(wksp: Path, n_rows: int, samples: int, reviewed: float, rng: random.Random) -> dict:
+    dbpath = wksp / 'bench_annotations.db'
+    for path in wksp.glob(f'{dbpath.name}*'):
+        path.unlink()
+    options = ['Relevant', 'Uncertain', 'Not Relevant']
+    n_reviewed = max(samples, int(n_rows * reviewed))
+    rowids = rng.sample(range(n_rows), min(n_reviewed, n_rows))
+
+    def annotation(rowid):
+        annot = Annotation(rowid)
+        annot.selected = rng.sample(options, rng.randint(1, 2))
+        annot.comment = f'comment {rowid}'
+        annot.add_mark(0, 5, 'abcde', 'mark')
+        return annot
+
+    store = AnnotationStore(dbpath, user='bench')
+    try:
+        timings = []
+        for rowid in rowids[:samples]:
+            start = time.perf_counter()
+            store.save(rowid, annotation(rowid))
+            timings.append(time.perf_counter() - start)
+        save = latency(timings)
+    finally:
+        store.close()
+
+    # the rest are saved in a few large transactions
+    store = AnnotationStore(dbpath, user='bench', write_behind=True, flush_interval_ms=60_000,
+                            flush_max_records=len(rowids))
+    try:
+        start = time.perf_counter()
+        for rowid in rowids[samples:]:
+            store.save(rowid, annotation(rowid))
+        store.flush()
+        bulk_save = time.perf_counter() - start
+    finally:
+        store.close()
+
+    store = AnnotationStore(dbpath, user='bench')
+    try:
+        timings = []
+        for rowid in rng.choices(range(n_rows), k=samples):
+            start = time.perf_counter()
+            store.get(rowid)
+            timings.append(time.perf_counter() - start)
+        get = latency(timings)
+        start = time.perf_counter()
+        out_path = store.export(out_path=wksp / 'bench_export.jsonl')
+        export = time.perf_counter() - start
+        out_path.unlink()
+    finally:
+        store.close()
+    return {
+        'annotations': len(rowids),
+        **{f'save_{key}': value for key, value in save.items()},
+        'bulk_save_per_s': (len(rowids) - samples) / bulk_save if len(rowids) > samples else None,
+        **{f'get_{key}': value for key, value in get.items()},
+        'export_seconds': export,
+        'export_rows_per_s': len(rowids) / export,
+    }
+
+
+def bench_navigation(config_path: Path, navigations: int) -> dict:
+    from benchmarks.bench_navigation import time_navigation
+
+    for path in config_path.parent.glob('annotations.db*'):
+        path.unlink()
+    start = time.perf_counter()
+    timings = asyncio.run(time_navigation(config_path, navigations))
+    return {
+        'navigations': navigations,
+        'seconds': time.perf_counter() - start,
+        **{f'save_next_{key}': value for key, value in latency(timings).items()},
+    }
+
+
+def version_info() -> dict:
+    with open(REPO / 'pyproject.toml', encoding='utf8') as fh:
+        version = tomlkit.load(fh)['project']['version']
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'version': version,
+        'commit': commit,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+    }
+
+
+def bench_clusters(wksp: Path) -> dict:
+    from textual_review_app.clusters import build_clusters
+
+    corpus = Corpus(wksp / 'corpus.pattern.jsonl', prefetch=0)
+    try:
+        start = time.perf_counter()
+        index = build_clusters(corpus)
+        elapsed = time.perf_counter() - start
+    finally:
+        corpus.close()
+    results = {
+        'seconds': elapsed,
+        'rows_per_s': len(index.clusters) / elapsed,
+        'clusters': index.n_multi,
+        'clustered': index.n_clustered,
+    }
+    index.close()
+    return results
+
+
+def run(sizes=SIZES, benchmarks=BENCHMARKS, text_length=1000, hit_density=0.01, highlights=3,
+        samples=1000, reviewed=0.2, navigations=30, startups=3, workers=1, seed=0, workdir: Path = None,
+        near_duplicates=0.1) -> dict:
+    """Run `benchmarks` at each size; return the report (see `main`).
+
+    Args:
+        sizes: numbers of records (pattern hits) to generate
+        text_length/hit_density: see `SyntheticCorpus`
+        highlights: number of highlight regexes (affects navigation)
+        samples: number of timed calls of each operation (e.g., `Corpus.__getitem__`)
+        reviewed: fraction of records annotated before timing `AnnotationStore.get` and export
+        navigations: number of timed Save & Next navigations
+        startups: number of app startups (and imports) to take the median of
+        workers: `--workers` for `textual-review-search`
+        workdir: directory for the generated workspaces (default: a temporary directory)
+        near_duplicates: see `SyntheticCorpus` (clustered by the 'clusters' benchmark)
+    """
+    parameters = {
+        'text_length': text_length, 'hit_density': hit_density, 'highlights': highlights, 'samples': samples,
+        'reviewed': reviewed, 'navigations': navigations, 'startups': startups, 'workers': workers, 'seed': seed,
+        'near_duplicates': near_duplicates,
+    }
+    results = []
+    synthetic = SyntheticCorpus(text_length, hit_density, near_duplicates=near_duplicates, seed=seed)
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n_rows in sizes:
+            wksp = Path(tmp) / str(n_rows)
+            start = time.perf_counter()
+            config_path = make_workspace(wksp, n_rows, highlights, synthetic)
+            print(f'[{n_rows}] generated workspace in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+            rng = random.Random(seed)
+            for benchmark in benchmarks:
+                start = time.perf_counter()
+                if benchmark == 'search':
+                    metrics = bench_search(wksp, workers)
+                elif benchmark == 'corpus':
+                    metrics = bench_corpus(wksp, samples, rng)
+                elif benchmark == 'annotations':
+                    metrics = bench_annotations(wksp, n_rows, samples, reviewed, rng)
+                elif benchmark == 'navigation':
+                    metrics = bench_navigation(config_path, navigations)
+                elif benchmark == 'startup':
+                    from benchmarks import bench_startup
+                    metrics = bench_startup.run(config_path, startups)
+                elif benchmark == 'clusters':
+                    metrics = bench_clusters(wksp)
+                else:
+                    raise ValueError(f'Unknown benchmark: {benchmark}; expected one of {", ".join(BENCHMARKS)}')
+                print(f'[{n_rows}] {benchmark} in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+                results.append({'benchmark': benchmark, 'size': n_rows, 'metrics': metrics})
+    return version_info() | {'parameters': parameters, 'results': results}
+
+
+def compare(baseline: dict, report: dict) -> list[tuple]:
+    """(benchmark, size, metric, baseline value, current value, % change) of each metric in both reports."""
+    previous = {(result['benchmark'], result['size']): result['metrics'] for result in baseline['results']}
+    rows = []
+    for result in report['results']:
+        old_metrics = previous.get((result['benchmark'], result['size']), {})
+        for metric, value in result['metrics'].items():
+            old = old_metrics.get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                change = (value - old) / old * 100 if old else None
+                rows.append((result['benchmark'], result['size'], metric, old, value, change))
+    return rows
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('--rows', type=int, nargs='+', default=list(SIZES),
+                        help='Numbers of records to benchmark with (e.g., 10000 100000 1000000).')
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--output', type=Path, default=None, help='Write results to this JSON file.')
+    parser.add_argument('--baseline', type=Path, default=None,
+                        help='JSON results of a previous run to compare against.')
+    parser.add_argument('--text-length', dest='text_length', type=int, default=1000,
+                        help='Approximate number of characters in each document.')
+    parser.add_argument('--hit-density', dest='hit_density', type=float, default=0.01,
+                        help='Fraction of words in each document that are pattern keywords.')
+    parser.add_argument('--highlights', type=int, default=3, help='Number of highlight regexes.')
+    parser.add_argument('--samples', type=int, default=1000, help='Number of timed calls of each operation.')
+    parser.add_argument('--reviewed', type=float, default=0.2,
+                        help='Fraction of records annotated before timing annotation lookups and export.')
+    parser.add_argument('--navigations', type=int, default=30, help='Number of timed Save & Next navigations.')
+    parser.add_argument('--startups', type=int, default=3, help='Number of app startups to take the median of.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes to search with.')
+    parser.add_argument('--near-duplicates', dest='near_duplicates', type=float, default=0.1,
+                        help='Fraction of documents that are edited copies of a recent document.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', type=Path, default=None,
+                        help='Directory to generate workspaces in (needs space for the largest corpus).')
+    args = parser.parse_args()
+
+    report = run(args.rows, args.benchmarks, args.text_length, args.hit_density, args.highlights, args.samples,
+                 args.reviewed, args.navigations, args.startups, args.workers, args.seed, args.workdir,
+                 args.near_duplicates)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as out:
+            json.dump(report, out, indent=2)
+        print(f'Wrote {args.output}', file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf8') as fh:
+            baseline = json.load(fh)
+        print(f'{baseline.get("commit")} -> {report.get("commit")}')
+        print(f'{"benchmark":>12} {"size":>9} {"metric":>28} {"baseline":>12} {"current":>12} {"change":>8}')
+        for benchmark, size, metric, old, value, change in compare(baseline, report):
+            change = f'{change:+.1f}%' if change is not None else ''
+            print(f'{benchmark:>12} {size:>9} {metric:>28} {old:>12.3f} {value:>12.3f} {change:>8}')
+    else:
+        print(f'{"benchmark":>12} {"size":>9} {"metric":>28} {"value":>12}')
+        for result in report['results']:
+            for metric, value in result['metrics'].items():
+                if isinstance(value, (int, float)):
+                    print(f'{result["benchmark"]:>12} {result["size"]:>9} {metric:>28} {value:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Generate synthetic corpora, patterns, and review workspaces for benchmarks.
+
+Documents are random filler words with pattern keywords mixed in at `hit_density` (fraction of
+words). Keywords are distinct from filler words and from each other, so the hits of the patterns
+are known without searching: `write_hits` writes the same rows (in the same order) as running
+`textual-review-search` on the documents it consumed. A fraction (`near_duplicates`) of documents
+are copies of a recent document with a few filler words replaced, like templated or copied-forward
+notes, so their hits are near-duplicates (see `textual_review_app.clusters`).
+
+Usage:
+* `PYTHONPATH=src python -m benchmarks.synthetic /path/to/wksp --rows 100000`
+    * Writes corpus.jsonl, patterns.txt, corpus.pattern.jsonl (100000 rows), and config.toml
+* `PYTHONPATH=src python -m benchmarks.synthetic /path/to/wksp --rows 1000000 --text-length 2000 --highlights 10`
+"""
+import json
+import random
+from collections import deque
+from itertools import accumulate
+from pathlib import Path
+
+import tomlkit
+
+from textual_review_app.corpus import make_hit
+
+LETTERS = 'abcdefghijklmnoprstuvwxyz'  # no 'q': keywords start with 'q'
+KEYWORD_LENGTH = 6
+KEYWORDS_PER_CATEGORY = 4
+COLORS = ('yellow', 'green', 'cyan', 'magenta', 'blue')
+RECENT_DOCUMENTS = 20  # near-duplicates are copies of one of the last documents (which may be copies themselves)
+EDIT_RATE = 0.06  # fraction of words replaced in a near-duplicate: copies of copies drift apart
+
+
+class SyntheticCorpus:
+
+    def __init__(self, text_length=1000, hit_density=0.01, categories=8, vocabulary=5000, near_duplicates=0.1,
+                 seed=0):
+        """
+
+        Args:
+            text_length: approximate number of characters in each document
+            hit_density: fraction of words in each document that are pattern keywords
+            categories: number of pattern categories
+            vocabulary: number of filler words
+            near_duplicates: fraction of documents that are edited copies of a recent document
+            seed: documents are the same for the same seed and arguments
+        """
+        self.text_length = text_length
+        self.hit_density = hit_density
+        self.near_duplicates = near_duplicates
+        self.seed = seed
+        rng = random.Random(seed)
+        filler = set()
+        while len(filler) < vocabulary:
+            filler.add(''.join(rng.choices(LETTERS, k=rng.randint(3, 10))))
+        self.filler = sorted(filler)
+        keywords = set()
+        while len(keywords) < categories * KEYWORDS_PER_CATEGORY:
+            keywords.add('q' + ''.join(rng.choices(LETTERS, k=KEYWORD_LENGTH - 1)))
+        keywords = sorted(keywords)
+        self.categories = [f'CAT{i}' for i in range(categories)]
+        self.keywords = {
+            category: keywords[i * KEYWORDS_PER_CATEGORY:(i + 1) * KEYWORDS_PER_CATEGORY]
+            for i, category in enumerate(self.categories)
+        }
+        self._keyword_category = {
+            keyword: i for i, category in enumerate(self.categories) for keyword in self.keywords[category]
+        }
+        chars_per_word = sum(len(word) + 1 for word in self.filler) / len(self.filler)
+        self.words_per_doc = max(1, round(text_length / chars_per_word))
+
+    def patterns(self) -> list[tuple[str, str]]:
+        """(category, regex) of each pattern."""
+        return [
+            (category, r'\b(?:' + '|'.join(self.keywords[category]) + r')\b')
+            for category in self.categories
+        ]
+
+    def highlights(self, n: int) -> list[dict]:
+        """`n` highlight regexes (as in config.toml), each matching several filler words."""
+        rng = random.Random(self.seed + 1)
+        return [
+            {'regex': r'\b(?:' + '|'.join(rng.sample(self.filler, 5)) + r')\w*\b', 'color': COLORS[i % len(COLORS)]}
+            for i in range(n)
+        ]
+
+    def documents(self):
+        """Yield (document, hits) forever.
+
+        Hits are (category, start, end) ordered by pattern and then position, as `PatternMatcher.finditer`.
+        """
+        rng = random.Random(self.seed + 2)
+        keywords = sorted(self._keyword_category)
+        expected = self.words_per_doc * self.hit_density
+        recent = deque(maxlen=RECENT_DOCUMENTS)
+        doc_id = 0
+        while True:
+            if recent and rng.random() < self.near_duplicates:
+                words = list(rng.choice(recent))
+                for position in rng.sample(range(len(words)), max(1, round(len(words) * EDIT_RATE))):
+                    if words[position] not in self._keyword_category:  # keep the hits
+                        words[position] = rng.choice(self.filler)
+                positions = [i for i, word in enumerate(words) if word in self._keyword_category]
+            else:
+                words = rng.choices(self.filler, k=self.words_per_doc)
+                n_hits = int(expected) + (rng.random() < expected - int(expected))
+                positions = rng.sample(range(self.words_per_doc), min(n_hits, self.words_per_doc))
+                for position in positions:
+                    words[position] = rng.choice(keywords)
+            recent.append(words)
+            hits = []
+            if positions:
+                offsets = list(accumulate((len(word) + 1 for word in words), initial=0))
+                hits = sorted(
+                    (self._keyword_category[words[position]], offsets[position], offsets[position] + len(words[position]))
+                    for position in positions
+                )
+                hits = [(self.categories[i], begin, end) for i, begin, end in hits]
+            yield {'id': doc_id, 'text': ' '.join(words)}, hits
+            doc_id += 1
+
+    def write_corpus(self, path: Path, n_docs: int) -> Path:
+        """Write `n_docs` documents as a jsonlines corpus (input of `textual-review-search`)."""
+        with open(path, 'w', encoding='utf8') as out:
+            for _, (doc, _) in zip(range(n_docs), self.documents()):
+                out.write(json.dumps(doc) + '\n')
+        return path
+
+    def write_patterns(self, path: Path) -> Path:
+        with open(path, 'w', encoding='utf8') as out:
+            for category, regex in self.patterns():
+                out.write(f'{category}=={regex}\n')
+        return path
+
+    def write_hits(self, path: Path, n_rows: int, source_path: Path = None, context_length=180,
+                   max_window=500) -> int:
+        """Write `n_rows` pattern hits (as `textual-review-search` would) without searching.
+
+        Args:
+            source_path: also write the documents the hits came from (the corpus that was 'searched');
+                the last document's hits beyond `n_rows` are included, so the number of rows is returned
+
+        Returns:
+            number of rows written
+        """
+        if self.hit_density <= 0:
+            raise ValueError('Cannot generate pattern hits with a hit density of 0.')
+        source = open(source_path, 'w', encoding='utf8') if source_path else None
+        n_written = 0
+        try:
+            with open(path, 'w', encoding='utf8') as out:
+                for doc, hits in self.documents():
+                    if n_written >= n_rows:
+                        break
+                    if source is not None:
+                        source.write(json.dumps(doc) + '\n')
+                    elif not hits:
+                        continue
+                    text = doc.pop('text')
+                    for category, start, end in hits:
+                        if source is None and n_written >= n_rows:
+                            break
+                        out.write(json.dumps(make_hit(doc, text, category, start, end, context_length, max_window)) + '\n')
+                        n_written += 1
+        finally:
+            if source is not None:
+                source.close()
+        return n_written
+
+
+def make_workspace(path: Path, n_rows: int, highlights=3, synthetic: SyntheticCorpus = None,
+                   options=('Relevant', 'Uncertain', 'Not Relevant')) -> Path:
+    """Write a review workspace with about `n_rows` records to the directory `path`; return the config path.
+
+    The workspace contains corpus.jsonl (documents), patterns.txt, corpus.pattern.jsonl (pattern hits),
+    and config.toml (with `highlights` highlight regexes).
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    synthetic = synthetic or SyntheticCorpus()
+    synthetic.write_patterns(path / 'patterns.txt')
+    synthetic.write_hits(path / 'corpus.pattern.jsonl', n_rows, source_path=path / 'corpus.jsonl')
+    doc = tomlkit.document()
+    doc['title'] = 'Synthetic Benchmark'
+    doc['offset'] = 0
+    doc['corpus'] = 'corpus.pattern.jsonl'
+    doc['highlights'] = synthetic.highlights(highlights)
+    doc['options'] = list(options)
+    doc['first_run'] = False
+    doc['user'] = 'bench'
+    config_path = path / 'config.toml'
+    config_path.write_text(tomlkit.dumps(doc), encoding='utf8')
+    return config_path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('workspace', type=Path, help='Directory to write the workspace to.')
+    parser.add_argument('--rows', type=int, default=10_000, help='Number of pattern hits (records to review).')
+    parser.add_argument('--text-length', dest='text_length', type=int, default=1000,
+                        help='Approximate number of characters in each document.')
+    parser.add_argument('--hit-density', dest='hit_density', type=float, default=0.01,
+                        help='Fraction of words in each document that are pattern keywords.')
+    parser.add_argument('--categories', type=int, default=8, help='Number of pattern categories.')
+    parser.add_argument('--near-duplicates', dest='near_duplicates', type=float, default=0.1,
+                        help='Fraction of documents that are edited copies of a recent document.')
+    parser.add_argument('--highlights', type=int, default=3, help='Number of highlight regexes in config.toml.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    synthetic = SyntheticCorpus(args.text_length, args.hit_density, args.categories,
+                                near_duplicates=args.near_duplicates, seed=args.seed)
+    config_path = make_workspace(args.workspace, args.rows, args.highlights, synthetic)
+    print(f'Wrote {config_path}')
+
+
+if __name__ == '__main__':
+    main()
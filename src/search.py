@@ -8,49 +8,365 @@ Input:
 Usage:
 * `python search.py /path/to/patterns.txt /path/to/corpus.jsonl`
     * Outputs: /path/to/corpus.pattern.jsonl
+* `python search.py /path/to/patterns.txt /path/to/corpus.jsonl --workers 8`
+    * Splits the corpus into byte-range shards and searches them in parallel
+    * Output is identical (including row order) to the single-process run
+* `python search.py /path/to/patterns.txt /path/to/corpus.jsonl --output-format pointer`
+    * Each hit only stores its category, the byte offset of its document in the corpus, and the
+      match's `start_index`/`end_index`; context windows are rebuilt by the app at display time
+* `python search.py /path/to/patterns.txt /path/to/corpus.jsonl --incremental`
+    * Uses /path/to/corpus.pattern.manifest.json (written by every run) to only search documents appended
+      to the corpus and patterns added since the last run; hits are appended so row numbers are stable
+    * If patterns were changed or removed, the corpus is searched from scratch (renumbering rows)
+* `python search.py /path/to/patterns.txt /path/to/corpus.jsonl --cluster`
+    * Then clusters near-duplicate hits for the app's 'Clusters' queue (see `textual_review_app.clusters`)
+
+Patterns which cannot match a text (their required literals are absent) are skipped (see `PatternMatcher`).
 """
+import hashlib
 import json
+import os
 import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from loguru import logger
+
+from textual_review_app.corpus import make_hit
+from textual_review_app.regex_utils import required_literals
+
+FLAGS = re.I | re.MULTILINE
+
+
+def read_patterns(pattern_file: Path):
+    """Read CATEGORY==REGEX lines into a list of (category, regex) tuples."""
+    patterns = []
+    with open(pattern_file, encoding='utf8') as fh:
+        for line in fh:
+            if line := line.strip():
+                category, regex = line.split('==', maxsplit=1)
+                patterns.append((category, regex))
+    return patterns
+
+
+def compile_patterns(patterns):
+    return [(category, re.compile(regex, FLAGS)) for category, regex in patterns]
 
-def main(pattern_file: Path, corpus_file: Path, context_length=180, max_window=500):
+
+class PatternMatcher:
+    """Find the matches of every (category, regex) pattern in a text.
+
+    Rather than running every pattern's `finditer` over every text, the text is casefolded once and
+    each pattern's required literals (see `required_literals`) are looked up in it; only patterns
+    whose literals are present are run. Results are identical to running `pattern.finditer(text)`
+    for each pattern in turn. Patterns with no extractable literal (e.g., `\\d{3}`) always run.
+    """
+
+    def __init__(self, patterns, prefilter=True):
+        self.patterns = compile_patterns(patterns)
+        self.literals = [required_literals(regex, FLAGS) if prefilter else None for _, regex in patterns]
+        self.prefilter = any(literals is not None for literals in self.literals)
+
+    def active(self, text):
+        """Return indices of patterns which may match the text."""
+        if not self.prefilter:
+            return range(len(self.patterns))
+        folded = text.casefold()
+        found = {}
+        active = []
+        for i, literals in enumerate(self.literals):
+            if literals is None:
+                active.append(i)
+                continue
+            for literal in literals:
+                if literal not in found:
+                    found[literal] = literal in folded
+                if found[literal]:
+                    active.append(i)
+                    break
+        return active
+
+    def finditer(self, text):
+        """Yield (category, start, end) for each match, ordered by pattern and then position."""
+        for i in self.active(text):
+            category, pattern = self.patterns[i]
+            for m in pattern.finditer(text):
+                yield category, m.start(), m.end()
+
+
+OUTPUT_FORMATS = ('full', 'pointer')
+
+
+def search_record(line, matcher: PatternMatcher, context_length=180, max_window=500,
+                  output_format='full', doc_offset=None):
+    """Yield an output row (as a json string) for each pattern hit in a single corpus line.
+
+    Args:
+        output_format: 'full' copies the context windows into each row; 'pointer' only stores
+            the hit's location (`doc_offset` is the byte offset of `line` in the corpus)
+    """
+    data = json.loads(line)
+    text = data['text']
+    del data['text']
+    for category, start, end in matcher.finditer(text):
+        if output_format == 'pointer':
+            yield json.dumps({
+                'category': category,
+                'doc_offset': doc_offset,
+                'start_index': start,
+                'end_index': end,
+            }) + '\n'
+        else:
+            yield json.dumps(make_hit(data, text, category, start, end, context_length, max_window)) + '\n'
+
+
+def shard_offsets(corpus_file: Path, n_shards: int, start=0, end=None):
+    """Split [start, end) of the corpus into at most `n_shards` byte ranges on line boundaries.
+
+    `start` must be the start of a line.
+    """
+    if end is None:
+        end = corpus_file.stat().st_size
+    boundaries = [start]
+    with open(corpus_file, 'rb') as fh:
+        for i in range(1, n_shards):
+            fh.seek(start + (end - start) * i // n_shards)
+            fh.readline()  # advance to start of next line
+            pos = fh.tell()
+            if boundaries[-1] < pos < end:
+                boundaries.append(pos)
+    boundaries.append(end)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _search_shard(corpus_file: Path, start: int, end: int, patterns, out_path: Path,
+                  context_length: int, max_window: int, output_format: str, mode='w'):
+    """Search lines in the byte range [start, end) of the corpus and write hits to `out_path`.
+
+    Returns the number of rows written.
+    """
+    matcher = PatternMatcher(patterns)
+    n_rows = 0
+    with open(out_path, mode, encoding='utf8') as out:
+        with open(corpus_file, 'rb') as fh:
+            fh.seek(start)
+            pos = start
+            while pos < end:
+                line = fh.readline()
+                if not line:
+                    break
+                for row in search_record(line, matcher, context_length, max_window,
+                                         output_format=output_format, doc_offset=pos):
+                    out.write(row)
+                    n_rows += 1
+                pos += len(line)
+    return n_rows
+
+
+def _search_range(corpus_file: Path, start: int, end: int, patterns, out_path: Path,
+                  context_length: int, max_window: int, output_format: str, workers=1, mode='w'):
+    """Search [start, end) of the corpus, in parallel shards if `workers` > 1, and write/append to `out_path`.
+
+    Returns the number of rows written.
+    """
+    if workers <= 1:
+        return _search_shard(corpus_file, start, end, patterns, out_path,
+                             context_length, max_window, output_format, mode=mode)
+
+    shards = shard_offsets(corpus_file, workers, start, end)
+    part_paths = [out_path.with_name(f'{out_path.name}.part{i}') for i in range(len(shards))]
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+            futures = [
+                pool.submit(_search_shard, corpus_file, shard_start, shard_end, patterns, part_path,
+                            context_length, max_window, output_format)
+                for (shard_start, shard_end), part_path in zip(shards, part_paths)
+            ]
+            n_rows = sum(future.result() for future in futures)  # re-raises any worker exception
+        # merge in shard order so that output matches the single-process run
+        with open(out_path, f'{mode}b') as out:
+            for part_path in part_paths:
+                with open(part_path, 'rb') as fh:
+                    shutil.copyfileobj(fh, out)
+    finally:
+        for part_path in part_paths:
+            part_path.unlink(missing_ok=True)
+    return n_rows
+
+
+def pattern_hash(category: str, regex: str):
+    return hashlib.sha256(f'{category}=={regex}'.encode('utf8')).hexdigest()[:16]
+
+
+def file_checksum(path: Path, size: int):
+    """Checksum of the first `size` bytes of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        remaining = size
+        while remaining > 0:
+            chunk = fh.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def manifest_path(out_path: Path):
+    """/path/to/corpus.pattern.jsonl -> /path/to/corpus.pattern.manifest.json"""
+    return out_path.with_suffix('.manifest.json')
+
+
+def count_lines(path: Path):
+    n_lines = 0
+    with open(path, 'rb') as fh:
+        while chunk := fh.read(1 << 20):
+            n_lines += chunk.count(b'\n')
+    return n_lines
+
+
+def _incremental_search(manifest: dict, patterns, corpus_file: Path, out_path: Path,
+                        context_length: int, max_window: int, output_format: str, workers: int):
+    """Append hits for new patterns and new documents; returns the updated manifest."""
+    settings = {'output_format': output_format, 'context_length': context_length, 'max_window': max_window}
+    for key, value in settings.items():
+        if manifest[key] != value:
+            raise ValueError(f'Cannot search incrementally: {key} was {manifest[key]!r}, now {value!r}.'
+                             f' Rerun without --incremental (this will renumber rows in {out_path}).')
+    scanned = manifest['corpus']['size']
+    size = corpus_file.stat().st_size
+    if size < scanned or file_checksum(corpus_file, scanned) != manifest['corpus']['checksum']:
+        raise ValueError(f'Cannot search incrementally: previously searched part of {corpus_file} has changed.'
+                         f' Rerun without --incremental (this will renumber rows in {out_path}).')
+    if count_lines(out_path) != manifest['rows']:
+        raise ValueError(f'Cannot search incrementally: {out_path} does not match {manifest_path(out_path)}.')
+    start = scanned  # of the appended documents
+    if 0 < scanned < size:
+        with open(corpus_file, 'rb') as fh:
+            fh.seek(scanned - 1)
+            boundary = fh.read(2)
+        if boundary[:1] != b'\n':  # the last document searched had no trailing newline
+            if boundary[1:] != b'\n':
+                raise ValueError(f'Cannot search incrementally: the last document searched in {corpus_file} has'
+                                 f' changed (text was appended to it, as it had no trailing newline).'
+                                 f' Rerun without --incremental (this will renumber rows in {out_path}).')
+            start += 1
+
+    known = {p['hash'] for p in manifest['patterns']}
+    new_patterns = [(category, regex) for category, regex in patterns if pattern_hash(category, regex) not in known]
+    kwargs = dict(context_length=context_length, max_window=max_window, output_format=output_format,
+                  workers=workers, mode='a')
+    # new patterns over the already-searched documents
+    if new_patterns and scanned:
+        manifest['rows'] += _search_range(corpus_file, 0, scanned, new_patterns, out_path, **kwargs)
+    # all current patterns over newly appended documents
+    if size > start:
+        manifest['rows'] += _search_range(corpus_file, start, size, patterns, out_path, **kwargs)
+    manifest['patterns'] += [
+        {'category': category, 'regex': regex, 'hash': pattern_hash(category, regex)}
+        for category, regex in new_patterns
+    ]
+    manifest['corpus'] = {'size': size, 'checksum': file_checksum(corpus_file, size)}
+    return manifest
+
+
+def search(pattern_file: Path, corpus_file: Path, context_length=180, max_window=500, workers=1,
+           output_format='full', incremental=False):
     """
 
     Args:
         pattern_file: file with CATEGORY==REGEX (e.g., `JEALOUS==\b(?:jealous|env[yi])\w*\b`)
         corpus_file: file with jsonlines corpus with 'text' as key storing text
         context_length: how much around each match to collect for immediate context
+        max_window: how much around each match to collect for the 'Show Before'/'Show After' views
+        workers: number of processes to use; >1 searches byte-range shards of the corpus in parallel
+        output_format: 'full' (copy context into each row) or 'pointer' (store only offsets into the corpus)
+        incremental: only search documents appended to the corpus and patterns added to the patterns
+            file since the last run, appending their hits so existing row numbers (and the annotations
+            referencing them) stay valid. If patterns were changed or removed, their hits can't be
+            removed without renumbering rows, so the corpus is searched from scratch.
 
     """
-    patterns = []
-    with open(pattern_file, encoding='utf8') as fh:
-        for line in fh:
-            if line := line.strip():
-                category, regex = line.split('==', maxsplit=1)
-                patterns.append((category, re.compile(regex, re.I | re.MULTILINE)))
-
-    with open(corpus_file.with_suffix('.pattern.jsonl'), 'w', encoding='utf8') as out:
-        with open(corpus_file, encoding='utf8') as fh:
-            for line in fh:
-                data = json.loads(line)
-                text = data['text']
-                del data['text']
-                for category, pattern in patterns:
-                    for m in pattern.finditer(text):
-                        out.write(json.dumps(data | {
-                            'category': category,
-                            'precontext': text[max(m.start() - context_length, 0): m.start()],
-                            'match': m.group(),
-                            'postcontext': text[m.end(): m.end() + context_length],
-                            'pretext': text[max(m.start() - max_window, 0): m.start()],  # TODO: configure how much to show
-                            'posttext': text[m.end(): m.end() + max_window],  # TODO: configure how much to show
-                            'start_index': m.start(),
-                            'end_index': m.end(),
-                        }) + '\n')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format: {output_format} (expected one of {OUTPUT_FORMATS})')
+    patterns = read_patterns(pattern_file)
+    out_path = corpus_file.with_suffix('.pattern.jsonl')
+    manifest_file = manifest_path(out_path)
 
+    manifest = None
+    if incremental and out_path.exists():
+        if not manifest_file.exists():
+            raise ValueError(f'Cannot search incrementally: no manifest for {out_path}.'
+                             f' Rerun without --incremental (this will renumber rows in {out_path}).')
+        with open(manifest_file, encoding='utf8') as fh:
+            manifest = json.load(fh)
+        current = {pattern_hash(category, regex) for category, regex in patterns}
+        if stale := [p['category'] for p in manifest['patterns'] if p['hash'] not in current]:
+            logger.warning(f'Patterns were changed or removed ({", ".join(stale)}): searching {corpus_file}'
+                           f' from scratch, which renumbers rows in {out_path}.')
+            manifest = None
+        else:
+            manifest = _incremental_search(manifest, patterns, corpus_file, out_path,
+                                           context_length, max_window, output_format, workers)
+    if manifest is None:
+        size = corpus_file.stat().st_size
+        rows = _search_range(corpus_file, 0, size, patterns, out_path, context_length, max_window,
+                             output_format, workers=workers)
+        manifest = {
+            'output_format': output_format,
+            'context_length': context_length,
+            'max_window': max_window,
+            'patterns': [
+                {'category': category, 'regex': regex, 'hash': pattern_hash(category, regex)}
+                for category, regex in patterns
+            ],
+            'corpus': {'size': size, 'checksum': file_checksum(corpus_file, size)},
+            'rows': rows,
+        }
+    with open(manifest_file, 'w', encoding='utf8') as out:
+        json.dump(manifest, out, indent=2)
+    return out_path
 
-if __name__ == '__main__':
-    import sys
 
-    main(Path(sys.argv[1]), Path(sys.argv[2]))
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('pattern_file', type=Path,
+                        help='Path to patterns file (CATEGORY==REGEX on each line).')
+    parser.add_argument('corpus_file', type=Path,
+                        help='Path to jsonlines corpus with text stored in "text".')
+    parser.add_argument('--context-length', dest='context_length', type=int, default=180,
+                        help='Number of characters of immediate context around each match.')
+    parser.add_argument('--max-window', dest='max_window', type=int, default=500,
+                        help='Number of characters of extended context around each match.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help=f'Number of processes to search with (e.g., {os.cpu_count()}).')
+    parser.add_argument('--output-format', dest='output_format', choices=OUTPUT_FORMATS, default='full',
+                        help='"full" copies context into each row; "pointer" stores only offsets into the corpus'
+                             ' (set `source_corpus`, `context_length`, and `max_window` in config.toml).')
+    parser.add_argument('--incremental', action='store_true', default=False,
+                        help='Only search new documents and new patterns since the last run, appending hits so'
+                             ' that existing row numbers (and annotations) stay valid.')
+    parser.add_argument('--cluster', action='store_true', default=False,
+                        help='Cluster near-duplicate hits afterwards (as `textual-review-cluster` with its defaults).')
+    args = parser.parse_args()
+
+    out_path = search(args.pattern_file, args.corpus_file, context_length=args.context_length,
+                      max_window=args.max_window, workers=args.workers, output_format=args.output_format,
+                      incremental=args.incremental)
+    if args.cluster:
+        from textual_review_app.clusters import build_clusters
+        from textual_review_app.corpus import Corpus
+
+        corpus = Corpus(out_path, source_path=args.corpus_file, context_length=args.context_length,
+                        max_window=args.max_window, prefetch=0)
+        try:
+            build_clusters(corpus).close()
+        finally:
+            corpus.close()
+
+
+if __name__ == '__main__':
+    main()
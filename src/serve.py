@@ -1,10 +1,209 @@
-from textual_serve.server import Server
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from importlib.metadata import version
+from pathlib import Path
 
+from aiohttp import web
+from textual_serve.app_service import AppService
+from textual_serve.server import Server, to_int
 
-def serve(config_path, port=8080, public_url=None, host='localhost'):
-    server = Server(f'python textual_review_app/app.py {config_path}', host=host, port=port,
-                    public_url=public_url)
-    server.serve()
+log = logging.getLogger('textual-serve')
+
+
+def session_environment(width: int = 80, height: int = 24, debug=False) -> dict[str, str]:
+    """Environment of a served app session, as textual-serve's `AppService` sets it up.
+
+    Textual reads its driver and colour settings from these at import, so the fork server needs them before it
+    preloads the app, and each forked session needs its terminal size.
+    """
+    environment = dict(os.environ)
+    environment['TEXTUAL_DRIVER'] = 'textual.drivers.web_driver:WebDriver'
+    environment['TEXTUAL_FPS'] = '60'
+    environment['TEXTUAL_COLOR_SYSTEM'] = 'truecolor'
+    environment['TERM_PROGRAM'] = 'textual'
+    environment['TERM_PROGRAM_VERSION'] = version('textual-serve')
+    environment['COLUMNS'] = str(width)
+    environment['ROWS'] = str(height)
+    if debug:
+        environment['TEXTUAL'] = 'debug,devtools'
+        environment['TEXTUAL_LOG'] = 'textual.log'
+    return environment
+
+
+class SessionProcess:
+    """The parts of `asyncio.subprocess.Process` that `AppService` uses, for a worker of the fork server."""
+
+    def __init__(self, pid, stdin, stdout, stderr):
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class ForkAppService(AppService):
+    """Runs a session in a worker forked from the fork server (see `textual_review_app.fork_server`).
+
+    Upgrade hazard: textual-serve has no public hook for starting a session's process, so this overrides the
+    private `AppService._open_app_process` and sets the `_stdin`/`_process` attributes the rest of `AppService`
+    reads (as of textual-serve 1.1; pinned in pyproject.toml). Check them when upgrading textual-serve.
+    """
+
+    def __init__(self, command, *, socket_path: Path, **kwargs):
+        super().__init__(command, **kwargs)
+        self.socket_path = socket_path
+
+    async def _open_app_process(self, width: int = 80, height: int = 24) -> SessionProcess:
+        from textual_review_app.fork_server import fork_session
+
+        environment = session_environment(width, height, self.debug)
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        try:
+            # only what differs from the fork server's own environment
+            pid = await asyncio.to_thread(fork_session, self.socket_path, {
+                key: value for key, value in environment.items() if os.environ.get(key) != value
+            }, (stdin_r, stdout_w, stderr_w))
+        except OSError:
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise
+        finally:
+            # the worker has its own copies
+            for fd in (stdin_r, stdout_w, stderr_w):
+                os.close(fd)
+
+        loop = asyncio.get_running_loop()
+        stdout = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stdout), open(stdout_r, 'rb', 0))
+        stderr = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stderr), open(stderr_r, 'rb', 0))
+        transport, protocol = await loop.connect_write_pipe(
+            lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), open(stdin_w, 'wb', 0)
+        )
+        self._stdin = asyncio.StreamWriter(transport, protocol, None, loop)
+        self._process = process = SessionProcess(pid, self._stdin, stdout, stderr)
+        return process
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._stdin is not None and not self._stdin.is_closing():
+            self._stdin.close()
+
+
+class ReviewServer(Server):
+    """textual-serve `Server` with a cap on concurrent sessions, optionally forking sessions from a fork server."""
+
+    def __init__(self, command, *, max_sessions: int = None, socket_path: Path = None, **kwargs):
+        """
+
+        Args:
+            command: command that runs the app (ignored for sessions forked from `socket_path`)
+            max_sessions: maximum number of concurrent sessions; None for no limit
+            socket_path: socket of a running fork server; if None, each session runs `command`
+        """
+        super().__init__(command, **kwargs)
+        self.max_sessions = max_sessions
+        self.socket_path = socket_path
+        self.sessions = 0
+
+    def _create_app_service(self, websocket: web.WebSocketResponse) -> AppService:
+        kwargs = dict(
+            write_bytes=websocket.send_bytes,
+            write_str=websocket.send_str,
+            close=websocket.close,
+            download_manager=self.download_manager,
+            debug=self.debug,
+        )
+        if self.socket_path is None:
+            return AppService(self.command, **kwargs)
+        return ForkAppService(self.command, socket_path=self.socket_path, **kwargs)
+
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        # as `Server.handle_websocket`, but enforcing `max_sessions` and choosing the `AppService`
+        websocket = web.WebSocketResponse(heartbeat=15)
+
+        width = to_int(request.query.get('width', '80'), 80)
+        height = to_int(request.query.get('height', '24'), 24)
+
+        if self.max_sessions is not None and self.sessions >= self.max_sessions:
+            log.warning(f'Refusing session: {self.sessions} of {self.max_sessions} sessions in use')
+            await websocket.prepare(request)
+            await websocket.close(code=1013, message=b'Too many review sessions; try again later.')
+            return websocket
+
+        self.sessions += 1
+        app_service: AppService | None = None
+        try:
+            await websocket.prepare(request)
+            app_service = self._create_app_service(websocket)
+            await app_service.start(width, height)
+            try:
+                await self._process_messages(websocket, app_service)
+            finally:
+                await app_service.stop()
+
+        except asyncio.CancelledError:
+            await websocket.close()
+
+        except Exception as error:
+            log.exception(error)
+
+        finally:
+            self.sessions -= 1
+            if app_service is not None:
+                await app_service.stop()
+
+        return websocket
+
+
+def start_fork_server(server: Server, config_path, socket_path: Path) -> subprocess.Popen:
+    """Start the fork server and wait until it has preloaded the app and corpus."""
+    from textual_review_app.fork_server import READY
+
+    environment = session_environment(debug=server.debug)
+    src = str(Path(__file__).resolve().parent)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [src, environment.get('PYTHONPATH')]))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'textual_review_app.fork_server', str(config_path), str(socket_path)],
+        stdout=subprocess.PIPE, env=environment,
+    )
+    if process.stdout.readline() != READY:
+        process.kill()
+        raise RuntimeError(f'Fork server failed to start (exit code {process.wait()}).')
+    return process
+
+
+def serve(config_path, port=8080, public_url=None, host='localhost', fork=False, max_sessions=None):
+    """
+
+    Args:
+        config_path: path to toml config
+        port: port to serve on
+        public_url: public URL if behind a reverse proxy
+        host: host to serve on
+        fork: run sessions in workers forked from a single preloaded process rather than one interpreter each
+        max_sessions: maximum number of concurrent sessions; None for no limit
+    """
+    if not fork:
+        server = ReviewServer(f'python textual_review_app/app.py {config_path}', host=host, port=port,
+                              public_url=public_url, max_sessions=max_sessions)
+        server.serve()
+        return
+    with tempfile.TemporaryDirectory(prefix='textual-review-') as tmpdir:
+        socket_path = Path(tmpdir) / 'fork.sock'
+        server = ReviewServer(f'python -m textual_review_app.fork_server {config_path}', host=host, port=port,
+                              public_url=public_url, max_sessions=max_sessions, socket_path=socket_path)
+        fork_server = start_fork_server(server, config_path, socket_path)
+        try:
+            server.serve()
+        finally:
+            fork_server.terminate()
+            fork_server.wait()
 
 
 def main():
@@ -19,9 +218,15 @@ def main():
                         help='Host (specify 0.0.0.0 to serve content)')
     parser.add_argument('--public-url', dest='public_url', default=None,
                         help='Public URL if using a reverse proxy to serve the application.')
+    parser.add_argument('--fork', action='store_true', default=False,
+                        help='Preload the app and corpus once, and fork a worker for each session'
+                             ' (less memory and faster startup per session; not available on Windows).')
+    parser.add_argument('--max-sessions', dest='max_sessions', type=int, default=None,
+                        help='Maximum number of concurrent sessions (additional connections are refused).')
     args = parser.parse_args()
 
-    serve(args.config_path, host=args.host, port=args.port, public_url=args.public_url)
+    serve(args.config_path, host=args.host, port=args.port, public_url=args.public_url,
+          fork=args.fork, max_sessions=args.max_sessions)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,15 @@
 import json
+import re
+import threading
+import time
 from datetime import datetime, timezone
 import sqlite3
 from pathlib import Path
 
+from loguru import logger
+
+from textual_review_app.profiling import timed
+
 
 class Annotation:
 
@@ -37,23 +44,188 @@ class Annotation:
         })
 
 
+class Bitmap:
+    """Set of non-negative integers stored one bit per value in a growable bytearray."""
+    _SET_BYTE = re.compile(rb'[^\x00]')
+    _UNSET_BYTE = re.compile(rb'[^\xff]')
+    _SCAN_CHUNK = 64  # bytes examined by the first step of a backward scan; doubles with each step
+
+    def __init__(self, values=()):
+        self.data = bytearray()
+        self.count = 0
+        for value in values:
+            self.add(value)
+
+    def add(self, value: int):
+        byte, bit = divmod(value, 8)
+        if byte >= len(self.data):
+            self.data.extend(bytes(byte - len(self.data) + 1))
+        if not self.data[byte] & (1 << bit):
+            self.data[byte] |= 1 << bit
+            self.count += 1
+
+    def discard(self, value: int):
+        byte, bit = divmod(value, 8)
+        if byte < len(self.data) and self.data[byte] & (1 << bit):
+            self.data[byte] &= ~(1 << bit)
+            self.count -= 1
+
+    def __contains__(self, value: int):
+        byte, bit = divmod(value, 8)
+        return 0 <= byte < len(self.data) and bool(self.data[byte] & (1 << bit))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        data = bytes(self.data)  # snapshot: safe to save while iterating
+        for m in self._SET_BYTE.finditer(data):
+            byte = m.start()
+            for bit in range(8):
+                if data[byte] & (1 << bit):
+                    yield byte * 8 + bit
+
+    def next_set(self, after: int = -1) -> int | None:
+        """Return the smallest value greater than `after` in the set, or None."""
+        value = max(after + 1, 0)
+        byte, bit = divmod(value, 8)
+        if byte >= len(self.data):
+            return None
+        for b in range(bit, 8):
+            if self.data[byte] & (1 << b):
+                return byte * 8 + b
+        # skip empty bytes
+        if m := self._SET_BYTE.search(self.data, byte + 1):
+            byte = m.start()
+            return byte * 8 + (self.data[byte] & -self.data[byte]).bit_length() - 1
+        return None
+
+    def previous_set(self, before: int) -> int | None:
+        """Return the largest value less than `before` in the set, or None."""
+        value = min(before - 1, len(self.data) * 8 - 1)
+        if value < 0:
+            return None
+        byte, bit = divmod(value, 8)
+        for b in range(bit, -1, -1):
+            if self.data[byte] & (1 << b):
+                return byte * 8 + b
+        byte = self._last_byte_not(0x00, byte)  # skip empty bytes
+        if byte < 0:
+            return None
+        return byte * 8 + self.data[byte].bit_length() - 1
+
+    def previous_missing(self, before: int) -> int | None:
+        """Return the largest non-negative value less than `before` not in the set, or None."""
+        value = before - 1
+        if value < 0:
+            return None
+        byte, bit = divmod(value, 8)
+        if byte >= len(self.data):
+            return value
+        for b in range(bit, -1, -1):
+            if not self.data[byte] & (1 << b):
+                return byte * 8 + b
+        byte = self._last_byte_not(0xff, byte)  # skip full bytes
+        if byte < 0:
+            return None
+        return byte * 8 + (~self.data[byte] & 0xff).bit_length() - 1
+
+    def _last_byte_not(self, value: int, end: int) -> int:
+        """Index of the last byte before `end` that isn't `value`, or -1.
+
+        Scans back in growing chunks, so the cost is proportional to the distance to that byte rather than to `end`.
+        """
+        fill = bytes([value])
+        size = self._SCAN_CHUNK
+        while end > 0:
+            start = max(end - size, 0)
+            if chunk := self.data[start:end].rstrip(fill):
+                return start + len(chunk) - 1
+            end = start
+            size *= 2
+        return -1
+
+    def next_missing(self, after: int = -1) -> int:
+        """Return the smallest non-negative value greater than `after` that is not in the set."""
+        value = max(after + 1, 0)
+        byte, bit = divmod(value, 8)
+        if byte >= len(self.data):
+            return value
+        for b in range(bit, 8):
+            if not self.data[byte] & (1 << b):
+                return byte * 8 + b
+        # skip full bytes
+        if m := self._UNSET_BYTE.search(self.data, byte + 1):
+            byte = m.start()
+            for b in range(8):
+                if not self.data[byte] & (1 << b):
+                    return byte * 8 + b
+        return len(self.data) * 8
+
+
 class AnnotationStore:
+    SCHEMA_VERSION = 4
+
+    def __init__(self, dbpath: Path, user: str | None = None, write_behind=False,
+                 flush_interval_ms=500, flush_max_records=20, per_user=False, lease_minutes=60):
+        """
 
-    def __init__(self, dbpath: Path, user: str | None = None):
+        Args:
+            dbpath: sqlite database of annotations
+            user: reviewer name, recorded with each annotation saved, to whom records are leased (and under which
+                per-user annotations are saved)
+            write_behind: if True, `save` only records the annotation in an in-memory journal, and a
+                background thread writes the journal to the database in a single transaction
+            flush_interval_ms: (write_behind only) maximum time an annotation waits in the journal
+            flush_max_records: (write_behind only) flush as soon as this many annotations are pending
+            per_user: if True, each user has their own annotation of a record; otherwise, annotations
+                are shared (stored with an empty user) and the last save wins
+            lease_minutes: how long records leased by `acquire_leases` stay assigned without being renewed
+        """
         self.dbpath = dbpath
-        self.conn = sqlite3.connect(
+        self.conn = self._connect()
+        self._create_table()
+        self._migrate()
+        self.per_user = per_user
+        self.lease_seconds = lease_minutes * 60
+        # write-behind journal: rowid -> (annotation json, last_update_utc, annotation dict)
+        self._lock = threading.RLock()
+        self._journal = {}
+        # the journal being written by `flush`: it writes (and commits) outside of `_lock`, on its own connection,
+        # so saves and reads aren't held up by a commit; `_flush_lock` keeps writes in the order they were saved
+        self._inflight = {}
+        self._flush_lock = threading.Lock()
+        # connection for the writes made under `_flush_lock` (flushing the journal and leasing records)
+        self._flush_conn = self._connect()
+        self._user = user or 'anonymous'
+        self._load_status()
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_records = flush_max_records
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = None
+        if self.write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, name='annotation-flush', daemon=True)
+            self._flusher.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
             self.dbpath,
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            # the app opens the store off the event loop (see `ReviewApp.load`), and with write_behind the
+            # journal is flushed from a thread; access to each connection is serialized by `_lock`/`_flush_lock`
+            check_same_thread=False,
         )
-        self.conn.row_factory = sqlite3.Row
-        # WAL and schema versioning
+        conn.row_factory = sqlite3.Row
         try:
-            self.conn.execute('PRAGMA journal_mode=WAL;')
+            conn.execute('PRAGMA journal_mode=WAL;')
+            # with WAL, commits stay atomic and durable across application crashes without an fsync
+            # each; this keeps write transactions (and so lock waits between sessions) short
+            conn.execute('PRAGMA synchronous=NORMAL;')
         except Exception:
             pass
-        self.conn.execute('PRAGMA user_version=1;')
-        self._create_table()
-        self.user = user or 'anonymous'
+        return conn
 
     def _create_table(self):
         self.conn.execute('''
@@ -68,49 +240,592 @@ class AnnotationStore:
         self.conn.execute('CREATE INDEX IF NOT EXISTS idx_annotations_rowid ON annotations(rowid);')
         self.conn.commit()
 
-    def save(self, rowid, annotation: Annotation):
+    def _schema_version(self) -> int:
+        # a new database (or one created before versioning) has version 0; its tables are at version 1
+        return max(self.conn.execute('PRAGMA user_version;').fetchone()[0], 1)
+
+    def _migrate(self):
+        """Upgrade the schema to `SCHEMA_VERSION`, one version at a time, each in its own transaction.
+
+        Other sessions may be opening the same database: each step takes the write lock before re-reading the
+        version, and is skipped if another session has applied it in the meantime.
+        """
+        for target in range(self._schema_version() + 1, self.SCHEMA_VERSION + 1):
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._schema_version() < target:
+                    getattr(self, f'_migrate_v{target}')()
+                    self.conn.execute(f'PRAGMA user_version={target};')
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def _migrate_v2(self):
+        """Store flagged, selected options and marks in indexed columns/tables alongside the JSON blob."""
+        self.conn.execute('ALTER TABLE annotations ADD COLUMN flagged INTEGER NOT NULL DEFAULT 0')
         self.conn.execute('''
-                          INSERT INTO annotations (rowid, annotation, last_update_utc)
-                          VALUES (?, ?, ?) ON CONFLICT(rowid) DO
-                          UPDATE SET
-                              annotation = excluded.annotation,
-                              last_update_utc = excluded.last_update_utc
-                          ''', (rowid, annotation.to_json_str(), datetime.now(timezone.utc)))
-        self.conn.commit()
+                          CREATE TABLE annotation_selected
+                          (
+                              rowid INTEGER NOT NULL,
+                              option TEXT NOT NULL
+                          )
+                          ''')
+        self.conn.execute('''
+                          CREATE TABLE annotation_marks
+                          (
+                              rowid INTEGER NOT NULL,
+                              start_index INTEGER NOT NULL,
+                              end_index INTEGER NOT NULL,
+                              kind TEXT NOT NULL,
+                              selection TEXT
+                          )
+                          ''')
+        self.conn.execute('CREATE INDEX idx_annotations_flagged ON annotations(flagged) WHERE flagged = 1;')
+        self.conn.execute('CREATE INDEX idx_annotations_last_update ON annotations(last_update_utc);')
+        self.conn.execute('CREATE INDEX idx_selected_option ON annotation_selected(option, rowid);')
+        self.conn.execute('CREATE INDEX idx_selected_rowid ON annotation_selected(rowid);')
+        self.conn.execute('CREATE INDEX idx_marks_kind ON annotation_marks(kind, rowid);')
+        self.conn.execute('CREATE INDEX idx_marks_rowid ON annotation_marks(rowid);')
+        annotations = {
+            row['rowid']: json.loads(row['annotation'])
+            for row in self.conn.execute('SELECT rowid, annotation FROM annotations')
+        }
+        self.conn.executemany(
+            'UPDATE annotations SET flagged = 1 WHERE rowid = ?',
+            [(rowid,) for rowid, data in annotations.items() if data.get('flagged')]
+        )
+        self.conn.executemany(
+            'INSERT INTO annotation_selected (rowid, option) VALUES (?, ?)',
+            [(rowid, option) for rowid, data in annotations.items() for option in data.get('selected', [])]
+        )
+        self.conn.executemany(
+            'INSERT INTO annotation_marks (rowid, start_index, end_index, kind, selection) VALUES (?, ?, ?, ?, ?)',
+            [(rowid, mark['start'], mark['end'], mark['kind'], mark.get('selection'))
+             for rowid, data in annotations.items() for mark in data.get('marks', [])]
+        )
+
+    def _migrate_v3(self):
+        """Number each write transaction, so incremental exports can pick up rows committed after a row saved later.
+
+        `last_update_utc` is set when an annotation is saved, which (with write_behind, or another session) can be
+        well before it is committed. Existing annotations have `seq` 0.
+        """
+        self.conn.execute('ALTER TABLE annotations ADD COLUMN seq INTEGER NOT NULL DEFAULT 0')
+        self.conn.execute('CREATE INDEX idx_annotations_seq ON annotations(seq);')
+        self.conn.execute('''
+                          CREATE TABLE change_seq
+                          (
+                              id INTEGER PRIMARY KEY CHECK (id = 0),
+                              seq INTEGER NOT NULL
+                          )
+                          ''')
+        self.conn.execute('INSERT INTO change_seq (id, seq) VALUES (0, 0)')
+
+    def _migrate_v4(self):
+        """Key annotations by (rowid, user), and add the leases that assign records to users.
+
+        Existing annotations become shared annotations (user ''). `saved_by` records the user who saved each
+        annotation (for shared annotations, which any user may save); it is '' for existing annotations.
+        """
+        self.conn.execute('''
+                          CREATE TABLE annotations_v4
+                          (
+                              rowid INTEGER NOT NULL,
+                              user TEXT NOT NULL DEFAULT '',
+                              annotation TEXT NOT NULL,
+                              last_update_utc TIMESTAMP NOT NULL,
+                              flagged INTEGER NOT NULL DEFAULT 0,
+                              seq INTEGER NOT NULL DEFAULT 0,
+                              saved_by TEXT NOT NULL DEFAULT '',
+                              PRIMARY KEY (rowid, user)
+                          )
+                          ''')
+        self.conn.execute('''
+                          INSERT INTO annotations_v4 (rowid, user, annotation, last_update_utc, flagged, seq)
+                          SELECT rowid, '', annotation, last_update_utc, flagged, seq
+                          FROM annotations
+                          ''')
+        self.conn.execute('DROP TABLE annotations')  # and its indexes
+        self.conn.execute('ALTER TABLE annotations_v4 RENAME TO annotations')
+        self.conn.execute('CREATE INDEX idx_annotations_rowid ON annotations(rowid);')
+        self.conn.execute('CREATE INDEX idx_annotations_user ON annotations(user, rowid);')
+        self.conn.execute('CREATE INDEX idx_annotations_flagged ON annotations(user, rowid) WHERE flagged = 1;')
+        self.conn.execute('CREATE INDEX idx_annotations_last_update ON annotations(last_update_utc);')
+        self.conn.execute('CREATE INDEX idx_annotations_seq ON annotations(seq);')
+        for table in ['annotation_selected', 'annotation_marks']:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN user TEXT NOT NULL DEFAULT ''")
+        self.conn.execute('DROP INDEX idx_selected_option;')
+        self.conn.execute('DROP INDEX idx_selected_rowid;')
+        self.conn.execute('DROP INDEX idx_marks_kind;')
+        self.conn.execute('DROP INDEX idx_marks_rowid;')
+        self.conn.execute('CREATE INDEX idx_selected_option ON annotation_selected(user, option, rowid);')
+        self.conn.execute('CREATE INDEX idx_selected_rowid ON annotation_selected(rowid, user);')
+        self.conn.execute('CREATE INDEX idx_marks_kind ON annotation_marks(user, kind, rowid);')
+        self.conn.execute('CREATE INDEX idx_marks_rowid ON annotation_marks(rowid, user);')
+        # a record is leased to at most one user at a time
+        self.conn.execute('''
+                          CREATE TABLE leases
+                          (
+                              rowid INTEGER PRIMARY KEY,
+                              user TEXT NOT NULL,
+                              expires REAL NOT NULL
+                          )
+                          ''')
+        self.conn.execute('CREATE INDEX idx_leases_user ON leases(user, rowid);')
+        self.conn.execute('CREATE INDEX idx_leases_expires ON leases(expires);')
+        # records below `next_rowid` have been leased (or were already reviewed)
+        self.conn.execute('''
+                          CREATE TABLE lease_cursor
+                          (
+                              id INTEGER PRIMARY KEY CHECK (id = 0),
+                              next_rowid INTEGER NOT NULL
+                          )
+                          ''')
+
+    def _write_details(self, annotations: dict, conn: sqlite3.Connection = None):
+        """Replace the normalized flagged/selected/marks rows for `annotations` (rowid -> annotation dict)."""
+        conn = conn or self.conn
+        owner = self.owner
+        keys = [(rowid, owner) for rowid in annotations]
+        conn.executemany('DELETE FROM annotation_selected WHERE rowid = ? AND user = ?', keys)
+        conn.executemany('DELETE FROM annotation_marks WHERE rowid = ? AND user = ?', keys)
+        conn.executemany(
+            'UPDATE annotations SET flagged = ? WHERE rowid = ? AND user = ?',
+            [(int(bool(data.get('flagged'))), rowid, owner) for rowid, data in annotations.items()]
+        )
+        conn.executemany(
+            'INSERT INTO annotation_selected (rowid, user, option) VALUES (?, ?, ?)',
+            [(rowid, owner, option) for rowid, data in annotations.items() for option in data.get('selected', [])]
+        )
+        conn.executemany(
+            'INSERT INTO annotation_marks (rowid, user, start_index, end_index, kind, selection)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            [(rowid, owner, mark['start'], mark['end'], mark['kind'], mark.get('selection'))
+             for rowid, data in annotations.items() for mark in data.get('marks', [])]
+        )
+
+    @property
+    def user(self) -> str:
+        return self._user
+
+    @user.setter
+    def user(self, value: str):
+        # pending saves belong to the previous user
+        with self._flush_lock:
+            self._flush()
+            with self._lock:
+                self._user = value or 'anonymous'
+                if self.per_user:
+                    self._load_status()
+
+    @property
+    def owner(self) -> str:
+        """User under which annotations are stored: '' when annotations are shared."""
+        return self._user if self.per_user else ''
+
+    def _load_status(self):
+        """Build the in-memory reviewed/flagged bitmaps from the database."""
+        self.reviewed = Bitmap(row[0] for row in self.conn.execute(
+            'SELECT rowid FROM annotations WHERE user = ?', (self.owner,)
+        ))
+        self.flagged = Bitmap(row[0] for row in self.conn.execute(
+            'SELECT rowid FROM annotations WHERE user = ? AND flagged = 1', (self.owner,)
+        ))
+
+    @timed('annotations.save')
+    def save(self, rowid, annotation: Annotation):
+        data = annotation.to_json()
+        record = (json.dumps(data), datetime.now(timezone.utc), data)
+        with self._lock:
+            self.reviewed.add(rowid)
+            if annotation.flagged:
+                self.flagged.add(rowid)
+            else:
+                self.flagged.discard(rowid)
+            if self.write_behind:
+                self._journal[rowid] = record
+                if len(self._journal) >= self.flush_max_records:
+                    self._wake.set()
+                return
+            self._write({rowid: record})
+
+    @timed('annotations.save_many')
+    def save_many(self, annotations: dict[int, Annotation]) -> dict[int, Annotation | None]:
+        """Save several annotations (rowid -> annotation) in a single transaction, even with write_behind.
+
+        Returns:
+            the annotation each record had before (None if it wasn't reviewed), to undo with `restore`
+        """
+        with self._flush_lock, self._lock:
+            previous = {rowid: self.get(rowid) if rowid in self.reviewed else None for rowid in annotations}
+            self._write_many(annotations)
+        return previous
+
+    def restore(self, previous: dict[int, Annotation | None]):
+        """Undo `save_many` in a single transaction: save the previous annotations, and delete the annotations
+        of records that weren't reviewed (leasing them to this user again, if they had been leased)."""
+        with self._flush_lock, self._lock:
+            self._write_many(
+                {rowid: annotation for rowid, annotation in previous.items() if annotation is not None},
+                delete=[rowid for rowid, annotation in previous.items() if annotation is None],
+            )
+
+    def _write_many(self, annotations: dict[int, Annotation], delete=()):
+        delete = set(delete)
+        now = datetime.now(timezone.utc)
+        records = {}
+        for rowid, annotation in annotations.items():
+            data = annotation.to_json()
+            records[rowid] = (json.dumps(data), now, data)
+        # pending saves of these records are superseded; the rest of the journal is written along with them
+        journal = {rowid: record for rowid, record in self._journal.items() if rowid not in delete} | records
+        try:
+            keys = [(rowid, self.owner) for rowid in delete]
+            for table in ('annotations', 'annotation_selected', 'annotation_marks'):
+                self.conn.executemany(f'DELETE FROM {table} WHERE rowid = ? AND user = ?', keys)
+            if delete:
+                # saving dropped the leases on these records, and the lease cursor has moved past them
+                row = self.conn.execute('SELECT next_rowid FROM lease_cursor WHERE id = 0').fetchone()
+                expires = time.time() + self.lease_seconds
+                self.conn.executemany(
+                    'INSERT INTO leases (rowid, user, expires) VALUES (?, ?, ?) ON CONFLICT(rowid) DO NOTHING',
+                    [(rowid, self._user, expires) for rowid in delete if row and rowid < row[0]]
+                )
+            if journal:
+                self._write(journal)
+            else:
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._journal = {}
+        for rowid in delete:
+            self.reviewed.discard(rowid)
+            self.flagged.discard(rowid)
+        for rowid, (_, _, data) in records.items():
+            self.reviewed.add(rowid)
+            if data.get('flagged'):
+                self.flagged.add(rowid)
+            else:
+                self.flagged.discard(rowid)
+
+    def _write(self, records: dict, conn: sqlite3.Connection = None):
+        conn = conn or self.conn
+        owner = self.owner
+        # incremented inside the write transaction, so sessions number their writes in the order they commit
+        conn.execute('UPDATE change_seq SET seq = seq + 1 WHERE id = 0')
+        seq = conn.execute('SELECT seq FROM change_seq WHERE id = 0').fetchone()[0]
+        conn.executemany('''
+                              INSERT INTO annotations (rowid, user, annotation, last_update_utc, seq, saved_by)
+                              VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(rowid, user) DO
+                              UPDATE SET
+                                  annotation = excluded.annotation,
+                                  last_update_utc = excluded.last_update_utc,
+                                  seq = excluded.seq,
+                                  saved_by = excluded.saved_by
+                              ''', [(rowid, owner, annotation, ts, seq, self._user)
+                                    for rowid, (annotation, ts, _) in records.items()])
+        self._write_details({rowid: data for rowid, (_, _, data) in records.items()}, conn)
+        # reviewed records are no longer leased
+        conn.executemany('DELETE FROM leases WHERE rowid = ? AND user = ?',
+                         [(rowid, self._user) for rowid in records])
+        conn.commit()
+
+    @timed('annotations.flush')
+    def flush(self):
+        """Write all pending (write-behind) annotations to the database in one transaction."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        # the caller holds `_flush_lock`; saves (and `get`) only wait for the journal to be swapped out
+        with self._lock:
+            if not self._journal:
+                return
+            batch = self._inflight = self._journal
+            self._journal = {}
+        conn = self._flush_conn
+        try:
+            self._write(batch, conn)
+        except Exception:
+            conn.rollback()
+            with self._lock:
+                self._journal = batch | self._journal  # keep later saves
+                self._inflight = {}
+            raise
+        with self._lock:
+            self._inflight = {}
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as exc:
+                # keep the journal; retry on the next interval
+                logger.error(f'Failed to flush annotations to {self.dbpath}: {exc}')
+
+    @property
+    def pending(self) -> int:
+        """Number of annotations saved but not yet written to the database."""
+        with self._lock:
+            return len(self._journal.keys() | self._inflight.keys())
 
     def get(self, rowid):
-        cur = self.conn.execute('''
-                                SELECT rowid, annotation
-                                FROM annotations
-                                WHERE rowid = ?
-                                ''', (rowid,))
-        if row := cur.fetchone():
-            return Annotation(rowid, row['annotation'])
+        with self._lock:
+            for journal in (self._journal, self._inflight):
+                if rowid in journal:
+                    return Annotation(rowid, journal[rowid][0])
+            cur = self.conn.execute('''
+                                    SELECT rowid, annotation
+                                    FROM annotations
+                                    WHERE rowid = ? AND user = ?
+                                    ''', (rowid, self.owner))
+            if row := cur.fetchone():
+                return Annotation(rowid, row['annotation'])
         return Annotation(rowid)
 
     def exists(self, rowid: int) -> bool:
         """Return True if an annotation record exists for the given rowid.
 
-        This does not infer from default objects; it checks the database presence.
+        This does not infer from default objects; it checks the reviewed bitmap, which mirrors
+        the database (including pending writes).
         """
-        cur = self.conn.execute('SELECT 1 FROM annotations WHERE rowid = ? LIMIT 1', (rowid,))
-        return cur.fetchone() is not None
+        return rowid in self.reviewed
+
+    def count_reviewed(self) -> int:
+        return len(self.reviewed)
+
+    def count_flagged(self) -> int:
+        return len(self.flagged)
+
+    def next_unreviewed(self, after: int = -1, total: int | None = None) -> int | None:
+        """Return the first unreviewed rowid after `after`, or None if all rowids below `total` are reviewed."""
+        rowid = self.reviewed.next_missing(after)
+        if total is not None and rowid >= total:
+            return None
+        return rowid
+
+    def previous_unreviewed(self, before: int) -> int | None:
+        """Return the last unreviewed rowid before `before`, or None."""
+        return self.reviewed.previous_missing(before)
+
+    def iter_flagged(self):
+        """Yield flagged rowids in ascending order."""
+        yield from self.flagged
+
+    def flagged_ids(self) -> list[int]:
+        self.flush()
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                'SELECT rowid FROM annotations WHERE user = ? AND flagged = 1 ORDER BY rowid', (self.owner,)
+            )]
+
+    def ids_with_option(self, option: str) -> list[int]:
+        """Rowids where `option` was selected."""
+        self.flush()
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                'SELECT DISTINCT rowid FROM annotation_selected WHERE user = ? AND option = ? ORDER BY rowid',
+                (self.owner, option)
+            )]
+
+    def ids_with_mark(self, kind: str) -> list[int]:
+        """Rowids with at least one mark of `kind`."""
+        self.flush()
+        with self._lock:
+            return [row[0] for row in self.conn.execute(
+                'SELECT DISTINCT rowid FROM annotation_marks WHERE user = ? AND kind = ? ORDER BY rowid',
+                (self.owner, kind)
+            )]
+
+    def next_with_option(self, option: str, after: int = -1) -> int | None:
+        """First rowid after `after` where `option` was selected (an index seek)."""
+        self.flush()
+        with self._lock:
+            return self.conn.execute(
+                'SELECT MIN(rowid) FROM annotation_selected WHERE user = ? AND option = ? AND rowid > ?',
+                (self.owner, option, after)
+            ).fetchone()[0]
+
+    def previous_with_option(self, option: str, before: int) -> int | None:
+        """Last rowid before `before` where `option` was selected (an index seek)."""
+        self.flush()
+        with self._lock:
+            return self.conn.execute(
+                'SELECT MAX(rowid) FROM annotation_selected WHERE user = ? AND option = ? AND rowid < ?',
+                (self.owner, option, before)
+            ).fetchone()[0]
+
+    def option_counts(self) -> dict[str, int]:
+        """Number of rows on which each option was selected."""
+        self.flush()
+        with self._lock:
+            return {row[0]: row[1] for row in self.conn.execute(
+                'SELECT option, COUNT(DISTINCT rowid) FROM annotation_selected WHERE user = ? GROUP BY option',
+                (self.owner,)
+            )}
 
     def recent_reviewed_ids(self, n=None):
         """Yield rowids that have been reviewed (persisted in the DB)."""
+        self.flush()
         limit = f'LIMIT {n}' if n else ''
-        cur = self.conn.execute(f'SELECT rowid FROM annotations ORDER BY last_update_utc DESC {limit}')
-        return sorted(row['rowid'] for row in cur)
+        with self._lock:
+            cur = self.conn.execute(
+                f'SELECT rowid FROM annotations WHERE user = ? ORDER BY last_update_utc DESC {limit}', (self.owner,)
+            )
+            return sorted(row['rowid'] for row in cur)
+
+    def count_reviewed_all(self) -> int:
+        """Number of records reviewed by anyone."""
+        self.flush()
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(DISTINCT rowid) FROM annotations').fetchone()[0]
+
+    def progress(self) -> dict[str, dict[str, int]]:
+        """Number of records each user has reviewed and currently has leased.
+
+        Shared annotations (see `per_user`) are counted under ''.
+        """
+        self.flush()
+        with self._lock:
+            progress = {
+                row[0]: {'reviewed': row[1], 'leased': 0}
+                for row in self.conn.execute('SELECT user, COUNT(*) FROM annotations GROUP BY user')
+            }
+            for user, n_leased in self.conn.execute(
+                    'SELECT user, COUNT(*) FROM leases WHERE expires >= ? GROUP BY user', (time.time(),)):
+                progress.setdefault(user, {'reviewed': 0, 'leased': 0})['leased'] = n_leased
+        return progress
+
+    def acquire_leases(self, n: int, total: int) -> list[int]:
+        """Renew this user's leases and top them up to `n` records below `total`; return the leased rowids.
+
+        New leases come first from expired leases on records nobody has reviewed, then from records
+        past the lease cursor that nobody has reviewed or leased. This runs as one short
+        `BEGIN IMMEDIATE` transaction, so concurrent sessions (including other processes) never
+        lease the same record. It runs on its own connection, outside of the lock held by saves and
+        reads (including `next_leased` and `count_leased`), so it can run in a background thread
+        (see `LeaseQueue`).
+        """
+        now = time.time()
+        expires = now + self.lease_seconds
+        user = self._user
+        with self._flush_lock:
+            self._flush()  # this user's reviewed records are not leased again
+            conn = self._flush_conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('UPDATE leases SET expires = ? WHERE user = ?', (expires, user))
+                leased = [row[0] for row in conn.execute('''
+                                                              SELECT rowid
+                                                              FROM leases
+                                                              WHERE user = ?
+                                                                AND NOT EXISTS (SELECT 1 FROM annotations a WHERE a.rowid = leases.rowid)
+                                                              ''', (user,))]
+                need = n - len(leased)
+                if need > 0:
+                    # expired leases on records that were reviewed anyway
+                    conn.execute('''
+                                      DELETE FROM leases
+                                      WHERE expires < ?
+                                        AND EXISTS (SELECT 1 FROM annotations a WHERE a.rowid = leases.rowid)
+                                      ''', (now,))
+                    reclaimed = [row[0] for row in conn.execute(
+                        'SELECT rowid FROM leases WHERE expires < ? ORDER BY rowid LIMIT ?', (now, need)
+                    )]
+                    conn.executemany('UPDATE leases SET user = ?, expires = ? WHERE rowid = ?',
+                                     [(user, expires, rowid) for rowid in reclaimed])
+                    leased += reclaimed
+                    need -= len(reclaimed)
+                if need > 0:
+                    row = conn.execute('SELECT next_rowid FROM lease_cursor WHERE id = 0').fetchone()
+                    cursor = row[0] if row else 0
+                    fresh = []
+                    while len(fresh) < need and cursor < total:
+                        end = min(cursor + max(need, 256), total)
+                        taken = {r[0] for r in conn.execute(
+                            'SELECT rowid FROM annotations WHERE rowid >= ? AND rowid < ?', (cursor, end)
+                        )}
+                        taken.update(r[0] for r in conn.execute(
+                            'SELECT rowid FROM leases WHERE rowid >= ? AND rowid < ?', (cursor, end)
+                        ))
+                        for rowid in range(cursor, end):
+                            cursor = rowid + 1
+                            if rowid not in taken:
+                                fresh.append(rowid)
+                                if len(fresh) == need:
+                                    break
+                    conn.executemany('INSERT INTO leases (rowid, user, expires) VALUES (?, ?, ?)',
+                                     [(rowid, user, expires) for rowid in fresh])
+                    conn.execute('''
+                                      INSERT INTO lease_cursor (id, next_rowid)
+                                      VALUES (0, ?) ON CONFLICT(id) DO
+                                      UPDATE SET next_rowid = excluded.next_rowid
+                                      ''', (cursor,))
+                    leased += fresh
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return sorted(leased)
+
+    def _active_lease_condition(self) -> tuple[str, tuple]:
+        # leased to this user, unexpired, and not yet reviewed (e.g., by a previous holder of the lease)
+        return (
+            'user = ? AND expires >= ? AND NOT EXISTS (SELECT 1 FROM annotations a WHERE a.rowid = leases.rowid)',
+            (self._user, time.time()),
+        )
+
+    def _iter_leased(self, where='', params=(), order='ASC'):
+        """Yield this user's active leases (`where` further restricts rowid), skipping records with pending saves.
+
+        Pending saves are skipped rather than flushed: the caller holds `_lock` (not `_flush_lock`), so reads
+        don't wait on a flush or on `acquire_leases`.
+        """
+        condition, condition_params = self._active_lease_condition()
+        pending = self._journal.keys() | self._inflight.keys()
+        cur = self.conn.execute(f'SELECT rowid FROM leases WHERE {condition} {where} ORDER BY rowid {order}',
+                                condition_params + params)
+        for row in cur:
+            if row[0] not in pending:
+                yield row[0]
+
+    def leased_ids(self) -> list[int]:
+        """Rowids currently leased to this user and not yet reviewed."""
+        with self._lock:
+            return list(self._iter_leased())
+
+    def count_leased(self) -> int:
+        return len(self.leased_ids())
+
+    def next_leased(self, after: int = -1) -> int | None:
+        """First rowid after `after` leased to this user and not yet reviewed."""
+        with self._lock:
+            return next(self._iter_leased('AND rowid > ?', (after,)), None)
+
+    def previous_leased(self, before: int) -> int | None:
+        """Last rowid before `before` leased to this user and not yet reviewed."""
+        with self._lock:
+            return next(self._iter_leased('AND rowid < ?', (before,), order='DESC'), None)
 
-    def export(self):
-        with open(self.dbpath.parent / f'export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db.jsonl',
-                  'w', encoding='utf8') as out:
-            for rowid, annotation in self.conn.execute('SELECT rowid, annotation FROM annotations'):
-                d = json.loads(annotation)
-                d['row'] = rowid
-                d['user'] = self.user
-                out.write(json.dumps(d) + '\n')
+    def export(self, fmt='jsonl', incremental=False, out_path: Path = None, corpus=None):
+        """Flush pending saves and export annotations (see `textual_review_app.export`)."""
+        from textual_review_app.export import export_annotations
 
+        self.flush()
+        return export_annotations(self.dbpath, out_path, fmt=fmt, incremental=incremental,
+                                  user=self.user, corpus=corpus)
 
     def close(self):
+        self._closed = True
+        if self._flusher is not None:
+            self._wake.set()
+            self._flusher.join()
+            self._flusher = None
+        with self._flush_lock:
+            self._flush()
+            self._flush_conn.close()
         self.conn.close()
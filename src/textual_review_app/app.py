@@ -1,7 +1,8 @@
+import asyncio
 from pathlib import Path
 
 from loguru import logger
-from textual import on
+from textual import on, work
 
 from textual.app import App, ComposeResult
 from textual.containers import Container, Horizontal, Vertical
@@ -11,13 +12,9 @@ from textual.widgets import Header, Footer, Label, Button
 from textual_review_app.annotation_store import AnnotationStore
 from textual_review_app.config import Config
 from textual_review_app.corpus import Corpus
-from textual_review_app.widgets.add_keyword_modal import AddKeywordModal
-from textual_review_app.widgets.info_modal import InfoModal
-from textual_review_app.widgets.metadata_modal import MetadataModal
+from textual_review_app.profiling import PROFILER, timed
 from textual_review_app.widgets.snippet_widget import SnippetWidget
 from textual_review_app.widgets.toggle_button import ToggleButton
-from textual_review_app.widgets.settings_modal import SettingsModal
-from textual_review_app.widgets.search_modal import SearchModal
 
 
 class ReviewApp(App):
@@ -29,20 +26,34 @@ class ReviewApp(App):
         ('ctrl+f', 'search', 'Search'),
         ('ctrl+r', 'toggle_flag', 'Flag Record'),
         ('ctrl+l', 'open_canned_responses', 'Canned Responses'),
+        ('ctrl+down', 'queue_next', 'Next in Queue'),
+        ('ctrl+up', 'queue_previous', 'Previous in Queue'),
+        ('ctrl+g', 'apply_identical', 'Apply to Identical'),
+        ('ctrl+b', 'undo_apply_identical', 'Undo Apply'),
+        ('f9', 'diagnostics', 'Diagnostics'),
     ]
 
     curr_idx = reactive(0)
     current_entry = reactive(dict)
 
-    def __init__(self, config_path: Path):
+    def __init__(self, config_path: Path, corpus_index=None):
+        """
+
+        Args:
+            config_path: path to the toml config
+            corpus_index: already opened `OffsetIndex` of the corpus (see `fork_server`)
+        """
         super().__init__()
         self.config = Config(config_path)
-        self.corpus = Corpus(self.config.corpus_path)
         self.wksp_path = config_path.parent
-        self.annotations = AnnotationStore(self.config.corpus_path.parent / 'annotations.db', user=self.config.user)
+        # opened in a thread by `load`, so they don't delay the first frame
+        self.corpus_index = corpus_index
+        self.corpus: Corpus = None
+        self.annotations: AnnotationStore = None
         self.snippet_widget: SnippetWidget = None
         self.progress_label: Label = None
         self.last_saved_label: Label = None
+        self.dedup_label: Label = None
         self.current_meta1 = None
         self.current_meta2 = None
         self.current_meta3 = None
@@ -53,6 +64,15 @@ class ReviewApp(App):
             for i, option in enumerate(self.config.options)
         ]
         self.current_display_metadata = list()
+        self.search_index = None  # built on first corpus search
+        self.last_search = ''
+        self.category_index = None  # built in the background when the queues are first opened
+        self.category_worker = None
+        self.cluster_index = None  # written by `textual-review-cluster`, opened on first use of the queues
+        self.queue = None
+        self.queue_key = None
+        self.dedup_index = None  # built in the background once the corpus is open
+        self.undo_stack = []  # annotations replaced by each 'Apply to Identical', see `AnnotationStore.restore`
 
     def compose(self) -> ComposeResult:
         self.header = Header(name=self.config.title)
@@ -61,14 +81,16 @@ class ReviewApp(App):
         self.current_meta1 = Label('', id='current-md1')
         self.current_meta2 = Label('Instructions', id='current-md2')
         self.current_meta3 = Label('', id='current-md3')
-        self.progress_label = Label('', id='progress-label')
+        self.progress_label = Label('Loading...', id='progress-label')
         self.last_saved_label = Label('', id='last-saved-label')
+        self.dedup_label = Label('', id='dedup-label')
         yield Vertical(
             Container(
                 Button('Metadata', id='metadata-btn', classes='orange-btn'),
                 Button('Instructions', id='instructions-btn', classes='yellow-btn'),
                 Button('Settings', id='settings-btn', classes='yellow-btn'),
                 Button('Go To Reviewed', id='goto-reviewed-btn', classes='blue-btn'),
+                Button('Queues', id='queue-btn', classes='blue-btn'),
                 id='buttonbar',
                 classes='horizontal-layout',
             ),
@@ -78,6 +100,7 @@ class ReviewApp(App):
                 self.current_meta3,
                 self.progress_label,
                 self.last_saved_label,
+                self.dedup_label,
                 id='infobar',
                 classes='horizontal-layout',
             ),
@@ -97,6 +120,7 @@ class ReviewApp(App):
                 # toggle review flag button (green when unflagged, red when flagged)
                 yield Button('Flag', variant='success', id='flag-toggle')
                 yield Button('Save', variant='success', id='save')
+                yield Button('Apply to Identical', variant='success', id='apply-identical', disabled=True)
                 yield Button('Save & Next', variant='primary', id='next')
             with Horizontal(classes='buttonbar'):
                 for response in self.response_buttons:
@@ -105,20 +129,66 @@ class ReviewApp(App):
         yield Footer()
 
     async def on_mount(self):
-        self.curr_idx = self.config.offset
-        percent_done = self.curr_idx / len(self.corpus) * 100
-        self.progress_label.update(f'Completed {self.curr_idx} / {len(self.corpus)} ({percent_done:.2f}%)')
         self.header.title = self.config.title
         # apply font scale
         try:
             self.styles.scale = float(self.config.font_scale)
         except Exception:
             pass
+        # the snippet shows a loading indicator until the corpus and annotations are open; loading runs from
+        # its message queue, so the first frame (and the app's own queue) isn't held up
+        self.snippet_widget.loading = True
+        for bar in self.query('#buttonbar, #bottom'):
+            bar.disabled = True
+        self.snippet_widget.call_later(self.load)
+
+    def _open_stores(self) -> tuple[Corpus, AnnotationStore]:
+        corpus = Corpus(self.config.corpus_path, source_path=self.config.source_corpus_path,
+                        context_length=self.config.context_length, max_window=self.config.max_window,
+                        cache_size=self.config.cache_size, prefetch=self.config.prefetch,
+                        index=self.corpus_index)
+        annotations = AnnotationStore(self.config.corpus_path.parent / 'annotations.db', user=self.config.user,
+                                      write_behind=self.config.write_behind,
+                                      flush_interval_ms=self.config.flush_interval_ms,
+                                      flush_max_records=self.config.flush_max_records,
+                                      per_user=self.config.per_user, lease_minutes=self.config.lease_minutes)
+        return corpus, annotations
+
+    @timed('app.load')
+    async def load(self):
+        """Open the corpus (building its offset index on first use) and annotations in a thread, then show the
+        starting record and the instructions.
+        """
+        try:
+            self.corpus, self.annotations = await asyncio.to_thread(self._open_stores)
+        finally:
+            self.snippet_widget.loading = False
+            for bar in self.query('#buttonbar, #bottom'):
+                bar.disabled = False
+        if self.config.lease_size > 0:
+            # work through the records leased to this reviewer, starting from where they left off
+            self.queue_key = 'leases'
+            self.queue = self.get_queue(self.queue_key)
+            # leases the first batch: keep the (possibly contended) lease transaction off the event loop
+            rowid = await asyncio.to_thread(self.queue.next, self.config.offset - 1)
+            idx = self.config.offset if rowid is None else rowid
+        else:
+            idx = self.config.offset
+        n_reviewed = self.annotations.count_reviewed()
+        percent_done = n_reviewed / len(self.corpus) * 100
+        progress = f'Completed {n_reviewed} / {len(self.corpus)} ({percent_done:.2f}%)'
+        if self.annotations.per_user:
+            progress += f'; all reviewers: {self.annotations.count_reviewed_all()}'
+        self.progress_label.update(progress)
+        self.set_reactive(ReviewApp.curr_idx, idx)
+        await self.watch_curr_idx(idx)
+        self._open_dedup_index()
         # getting started overlay will be shown from Instructions button on first use to avoid blocking flows
         recovery_file = self.wksp_path / '.recovery.json'
         if recovery_file.exists():
             import json
             try:
+                self.annotations.flush()  # recovered state must not be overwritten by a pending save
                 data = json.loads(recovery_file.read_text(encoding='utf8'))
                 idx = int(data.get('idx', 0))
                 self.curr_idx = max(0, min(idx, len(self.corpus) - 1))
@@ -128,6 +198,7 @@ class ReviewApp(App):
                 from textual_review_app.annotation_store import Annotation
                 self.current_annot = Annotation(self.curr_idx, json.dumps(data.get('annotation', {})))
                 await self.update_display()
+                from textual_review_app.widgets.info_modal import InfoModal
                 await self.push_screen(InfoModal('Recovered unsaved session state.', title='Recovery'))
             except Exception:
                 pass
@@ -136,14 +207,25 @@ class ReviewApp(App):
                     recovery_file.unlink(missing_ok=True)
                 except Exception:
                     pass
-
-    async def on_ready(self):
-        """Called when the app is fully loaded and ready."""
         # showing a modal once the app has finished loading
-        await self.update_display()
         await self.show_instructions()
 
+    def check_action(self, action: str, parameters) -> bool | None:
+        # the review app's own actions need the corpus and annotations (see `load`)
+        if self.annotations is None and f'action_{action}' in vars(ReviewApp):
+            return False
+        return True
+
+    async def on_unmount(self):
+        if self.annotations is not None:
+            self.annotations.flush()
+        self.config.flush()
+
+    @timed('app.load_record')
     async def watch_curr_idx(self, idx: int):
+        if self.corpus is None:
+            return  # not loaded yet: `load` shows the starting record
+        from textual_review_app.widgets.info_modal import InfoModal
         if idx < 0:
             self.curr_idx = 0
             await self.push_screen(InfoModal([
@@ -160,22 +242,28 @@ class ReviewApp(App):
         else:
             self.config.offset = self.curr_idx
             self.current_entry = self.corpus[idx]
+            self.corpus.prefetch(idx)
             self.current_annot = self.annotations.get(idx)
             if self.is_mounted:
                 await self.update_display()
 
-    def save(self):
-        comment = self.snippet_widget.get_comment()
-        self.current_annot.comment = comment
+    def _update_annotation(self):
+        """Copy the comment and selected options shown into the current annotation."""
+        self.current_annot.comment = self.snippet_widget.get_comment()
         self.current_annot.selected = [
             str(btn.label) for btn in self.response_buttons if 'responsebtn-checked' in btn.classes
         ]
+
+    @timed('app.save')
+    def save(self):
+        self._update_annotation()
         self.annotations.save(self.curr_idx, self.current_annot)
         # update last saved timestamp and toast
         from datetime import datetime
         self.last_saved_label.update(f'Last saved: {datetime.now().strftime("%H:%M:%S")}')
         self.notify('Saved', severity='information', timeout=2)
 
+    @timed('app.update_display')
     async def update_display(self):
         if self.curr_idx < 0:
             self.curr_idx = 0
@@ -197,6 +285,7 @@ class ReviewApp(App):
             self.current_meta3.update(display_metadata[2])
         percent_done = self.curr_idx / len(self.corpus) * 100
         self.progress_label.update(f'Record #{self.curr_idx + 1} / {len(self.corpus)} ({percent_done:.2f}%)')
+        self._update_dedup_label()
         # sync review flag button state
         try:
             self._update_flag_button()
@@ -205,10 +294,15 @@ class ReviewApp(App):
 
     @on(Button.Pressed, '#highlight-keyword')
     def open_add_keyword_dialog(self):
+        from textual_review_app.widgets.add_keyword_modal import AddKeywordModal
         self.push_screen(AddKeywordModal(self.snippet_widget.get_selected_text()))
 
     @on(Button.Pressed, '#next')
+    @timed('app.save_next')
     async def get_next_record(self):
+        if self.queue_key == 'leases':
+            await self._step_queue(forward=True)  # don't step onto another reviewer's records
+            return
         self.save()
         self.curr_idx += 1
 
@@ -223,13 +317,21 @@ class ReviewApp(App):
 
     @on(Button.Pressed, '#previous')
     async def previous_record(self):
+        if self.queue_key == 'leases':
+            await self._step_queue(forward=False)
+            return
         self.save()
         self.curr_idx -= 1
 
     @on(Button.Pressed, '#metadata-btn')
     async def show_metadata(self):
+        from textual_review_app.widgets.metadata_modal import MetadataModal
         await self.push_screen(MetadataModal(self.current_entry))
 
+    def action_diagnostics(self):
+        from textual_review_app.widgets.diagnostics_modal import DiagnosticsModal
+        self.push_screen(DiagnosticsModal(self.corpus.cache_info(), self.annotations.pending))
+
     @on(Button.Pressed, '#canned-btn')
     def action_open_canned_responses(self):
         from textual_review_app.widgets.canned_response_modal import CannedResponseModal
@@ -259,6 +361,7 @@ class ReviewApp(App):
 
     @on(Button.Pressed, '#instructions-btn')
     async def show_instructions(self):
+        from textual_review_app.widgets.info_modal import InfoModal
         await self.push_screen(InfoModal(
             [
                 '[b]Welcome to the Textual Review App![/b]',
@@ -272,6 +375,8 @@ class ReviewApp(App):
                 ' • [b]Previous[/b]: Go back to the preceding record.',
                 ' • [b]Flag[/b]: Mark records for further review.',
                 ' • [b]Add Highlight[/b]: Add custom highlights to the text.',
+                ' • [b]Queues[/b]: Only step through unreviewed or flagged records, a category, an option, or clusters of similar records.',
+                ' • [b]Apply to Identical[/b]: Save the same response for every record with identical text.',
                 '',
                 '[b]Keyboard Shortcuts:[/b]',
                 ' • [yellow]Ctrl+S[/yellow]: Save current record',
@@ -279,6 +384,8 @@ class ReviewApp(App):
                 ' • [yellow]Ctrl+←[/yellow]: Go to previous',
                 ' • [yellow]Ctrl+F[/yellow]: Search',
                 ' • [yellow]Ctrl+R[/yellow]: Toggle flag',
+                ' • [yellow]Ctrl+↓[/yellow]/[yellow]Ctrl+↑[/yellow]: Save and go to next/previous in the review queue',
+                ' • [yellow]Ctrl+G[/yellow]: Apply to all identical records ([yellow]Ctrl+B[/yellow] to undo)',
                 ' • [yellow]Ctrl+l[/yellow]: When in comments, open canned responses.',
                 '',
                 '[b]Here are your project-specific instructions:[/b]',
@@ -290,22 +397,25 @@ class ReviewApp(App):
 
     @on(Button.Pressed, '#settings-btn')
     async def open_settings(self):
+        from textual_review_app.widgets.settings_modal import SettingsModal
+
         async def _apply_settings(values: dict):
             if not values:
                 return  # 'cancel'
             # values keys: 'font_scale', 'user', 'canned_responses'
-            try:
-                self.config.font_scale = float(values.get('font_scale', self.config.font_scale))
-                self.styles.scale = self.config.font_scale
-            except Exception:
-                pass
-            user = values.get('user')
-            if user:
-                self.config.user = user
-                self.annotations.user = user
+            with self.config.batch():
+                try:
+                    self.config.font_scale = float(values.get('font_scale', self.config.font_scale))
+                    self.styles.scale = self.config.font_scale
+                except Exception:
+                    pass
+                user = values.get('user')
+                if user:
+                    self.config.user = user
+                    self.annotations.user = user
 
-            if 'canned_responses' in values:
-                self.config.canned_responses = values['canned_responses']
+                if 'canned_responses' in values:
+                    self.config.canned_responses = values['canned_responses']
 
         await self.push_screen(
             SettingsModal(self.config.font_scale, self.config.user, self.config.canned_responses),
@@ -315,6 +425,8 @@ class ReviewApp(App):
     @on(Button.Pressed, '#goto-reviewed-btn')
     async def open_goto(self):
         from textual_review_app.widgets.goto_modal import GoToModal
+        from textual_review_app.widgets.info_modal import InfoModal
+
         async def _send_to_record_id(result=None):
             """result: str interpreted as message, int as record_id to navigate to"""
             if isinstance(result, str):
@@ -341,13 +453,181 @@ class ReviewApp(App):
     async def action_previous(self):
         await self.previous_record()
 
-    async def action_search(self):
-        async def _apply_search(pattern: str):
-            if pattern:
-                self.snippet_widget.set_temp_highlights([{'regex': pattern, 'color': 'yellow'}])
-                await self.update_display()
+    def get_queue(self, key: str):
+        """Build the review queue identified by `key` (see `open_queues`)."""
+        from textual_review_app import queues
+        kind, _, value = key.partition(':')
+        if kind == 'leases':
+            return queues.LeaseQueue(self.annotations, len(self.corpus), self.config.lease_size)
+        elif kind == 'unreviewed':
+            return queues.UnreviewedQueue(self.annotations, len(self.corpus))
+        elif kind == 'flagged':
+            return queues.FlaggedQueue(self.annotations)
+        elif kind == 'option':
+            return queues.OptionQueue(self.annotations, value)
+        elif kind == 'category':
+            return self._get_category_index().queue(value)
+        elif kind == 'clusters' and self._get_cluster_index() is not None:
+            return self.cluster_index.queue()
+        raise ValueError(f'Unknown queue: {key}')
+
+    def _get_category_index(self):
+        if self.category_index is None:
+            from textual_review_app.queues import CategoryIndex
+            self.category_index = CategoryIndex(self.config.corpus_path)
+        return self.category_index
+
+    def _get_cluster_index(self):
+        if self.cluster_index is None:
+            from textual_review_app.clusters import open_clusters
+            self.cluster_index = open_clusters(self.config.corpus_path)
+        return self.cluster_index
+
+    @on(Button.Pressed, '#queue-btn')
+    async def open_queues(self):
+        from textual_review_app.widgets.queue_modal import QueueModal
+
+        async def _set_queue(key: str | None):
+            if key is None:
+                return  # cancel
+            if not key:
+                self.queue = self.queue_key = None
+                self.notify('Cleared review queue', severity='information')
+                return
+            self.queue = self.get_queue(key)
+            self.queue_key = key
+            rowid = self.queue.next(self.curr_idx - 1)
+            if rowid is None:
+                rowid = self.queue.next(-1)
+            if rowid is None:
+                self.notify(f'No records in queue: {self.queue.name}', severity='warning')
+            else:
+                self.notify(f'{self.queue.name}: {len(self.queue)} records', severity='information')
+                self.curr_idx = rowid
+
+        options = [('leases', f'Assigned to Me ({self.annotations.count_leased()})')] if self.config.lease_size > 0 else []
+        options += [
+            ('unreviewed', f'Unreviewed ({len(self.corpus) - self.annotations.count_reviewed()})'),
+            ('flagged', f'Flagged ({self.annotations.count_flagged()})'),
+        ]
+        if (cluster_index := self._get_cluster_index()) is not None:
+            options.append(('clusters', f'Clusters ({cluster_index.n_clustered} in {cluster_index.n_multi} clusters)'))
+        counts = self.annotations.option_counts()
+        options += [(f'option:{option}', f'Option: {option} ({counts.get(option, 0)})') for option in self.config.options]
+        if (category_index := self.category_index) is not None:
+            options += [
+                (f'category:{category}', f'Category: {category} ({len(category_index.rows(category))})')
+                for category in category_index.categories
+            ]
+        elif self.category_worker is None:
+            self.category_worker = self._open_category_index()
+            self.notify('Indexing categories; category queues will be listed once ready', severity='information')
+        await self.push_screen(QueueModal(options, self.queue_key), _set_queue)
+
+    @work(thread=True, exclusive=True, group='categories')
+    def _open_category_index(self):
+        """Load (or build, on first use) the rows of each category without holding up the queue picker."""
+        from textual_review_app.queues import CategoryIndex
+        try:
+            category_index = CategoryIndex(self.config.corpus_path)
+        except Exception as exc:
+            logger.warning(f'Unable to index categories: {exc}')
+            return
+        try:
+            self.call_from_thread(self._set_category_index, category_index)
+        except RuntimeError:  # the app exited meanwhile
+            category_index.close()
+
+    def _set_category_index(self, category_index):
+        self.category_index = category_index
+        self.notify(f'Category queues ready: {len(category_index.categories)} categories', severity='information')
+
+    async def _step_queue(self, forward=True):
+        if self.queue is None:
+            await self.open_queues()
+            return
+        self.save()
+        rowid = self.queue.next(self.curr_idx) if forward else self.queue.previous(self.curr_idx)
+        if rowid is None:
+            self.notify(f'No {"more" if forward else "earlier"} records in queue: {self.queue.name}',
+                        severity='warning')
+        else:
+            self.curr_idx = rowid
 
-        await self.push_screen(SearchModal(), _apply_search)
+    async def action_queue_next(self):
+        await self._step_queue(forward=True)
+
+    async def action_queue_previous(self):
+        await self._step_queue(forward=False)
+
+    def search_corpus(self, pattern: str, start: int = 0, limit: int = 200):
+        """Find records matching `pattern` (see `SearchIndex.search`); builds the index on first use."""
+        if self.search_index is None:
+            from textual_review_app.search_index import SearchIndex
+            self.search_index = SearchIndex(self.corpus)
+        return self.search_index.search(pattern, start=start, limit=limit)
+
+    async def action_search(self):
+        from textual_review_app.widgets.search_modal import SearchModal
+
+        async def _apply_search(result: str | tuple[str, int] | None):
+            if not result:
+                return
+            pattern, rowid = result if isinstance(result, tuple) else (result, None)
+            self.last_search = pattern
+            self.snippet_widget.set_temp_highlights([{'regex': pattern, 'color': 'yellow'}])
+            if rowid is not None and rowid != self.curr_idx:
+                self.curr_idx = rowid
+            await self.update_display()
+
+        await self.push_screen(SearchModal(self.search_corpus, self.last_search, self.curr_idx + 1), _apply_search)
+
+    @work(thread=True, exclusive=True, group='dedup')
+    def _open_dedup_index(self):
+        """Load (or build, on first use) the groups of identical records without holding up review."""
+        from textual_review_app.dedup import DedupIndex
+        try:
+            dedup_index = DedupIndex(self.corpus)
+        except Exception as exc:
+            logger.warning(f'Unable to group identical records: {exc}')
+            return
+        try:
+            self.call_from_thread(self._set_dedup_index, dedup_index)
+        except RuntimeError:  # the app exited meanwhile
+            dedup_index.close()
+
+    def _set_dedup_index(self, dedup_index):
+        self.dedup_index = dedup_index
+        self._update_dedup_label()
+
+    def _update_dedup_label(self):
+        size = self.dedup_index.group_size(self.curr_idx) if self.dedup_index is not None else 1
+        self.dedup_label.update(f'{size} identical' if size > 1 else '')
+        self.query_one('#apply-identical', Button).disabled = size <= 1
+
+    @on(Button.Pressed, '#apply-identical')
+    async def action_apply_identical(self):
+        """Save the current annotation to every record identical to the current one (in one transaction)."""
+        if self.dedup_index is None or self.dedup_index.group_size(self.curr_idx) <= 1:
+            self.notify('No identical records', severity='warning')
+            return
+        from textual_review_app.annotation_store import Annotation
+        self._update_annotation()
+        data = self.current_annot.to_json_str()
+        rowids = self.dedup_index.group(self.curr_idx)
+        self.undo_stack.append(self.annotations.save_many({rowid: Annotation(rowid, data) for rowid in rowids}))
+        self.notify(f'Applied to {len(rowids)} identical records (Ctrl+B to undo)', severity='information')
+
+    async def action_undo_apply_identical(self):
+        if not self.undo_stack:
+            self.notify('Nothing to undo', severity='warning')
+            return
+        previous = self.undo_stack.pop()
+        self.annotations.restore(previous)
+        self.notify(f'Restored {len(previous)} records', severity='information')
+        if self.curr_idx in previous:
+            self.current_annot = self.annotations.get(self.curr_idx)
+            await self.update_display()
 
     async def action_toggle_flag(self):
         self.current_annot.flagged = not getattr(self.current_annot, 'flagged', False)
@@ -376,6 +656,32 @@ class ReviewApp(App):
         await self.action_toggle_flag()
 
 
+def run_app(config_path: Path, corpus_index=None):
+    """Run the review app until it exits, then export this session's annotations and close the stores."""
+    app = ReviewApp(config_path, corpus_index=corpus_index)
+    app.run()
+    for index in (app.dedup_index, app.cluster_index, app.search_index, app.category_index):
+        if index is not None:
+            index.close()
+    if app.corpus is not None:
+        logger.debug(f'Corpus cache: {app.corpus.cache_info()}')
+        app.corpus.close()
+    if app.annotations is not None:
+        # on exit, export annotations saved during this session
+        try:
+            app.annotations.export(incremental=True)
+        except Exception as exc:
+            logger.error(f'Export failed: {exc}')
+        finally:
+            app.annotations.close()
+    if PROFILER.enabled:
+        from datetime import datetime
+        import os
+        PROFILER.dump(PROFILER.trace_path or Path(config_path).parent / (
+            f'profile_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}.jsonl'
+        ))
+
+
 def main():
     import argparse
 
@@ -383,7 +689,13 @@ def main():
     parser.add_argument('config_path', type=Path,
                         help='Path to config file (its directory will be the workspace directory).')
     parser.add_argument('--sample', action='store_true', help='Generate a sample workspace for exploration.')
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='TRACE_PATH',
+                        help='Time save/navigation stages (press F9 in the app to view), and write a jsonlines'
+                             ' trace on exit to TRACE_PATH (default: profile_*.jsonl in the workspace).'
+                             ' Alternatively, set TEXTUAL_REVIEW_PROFILE.')
     args = parser.parse_args()
+    if args.profile is not None:
+        PROFILER.enable(args.profile or None)
 
     config_path = args.config_path
     if args.sample:
@@ -404,14 +716,7 @@ def main():
         logger.info(f'Sample workspace generated at {wksp}')
         return
     if config_path.exists():
-        app = ReviewApp(config_path)
-        app.run()
-        # on exit, export database
-        try:
-            app.annotations.export()
-            app.notify('Exported annotations', severity='information')
-        except Exception as exc:
-            logger.error(f'Export failed: {exc}')
+        run_app(config_path)
     else:
         logger.error(f'Configuration file does not exist! {config_path}')
         logger.warning(f'Creating default configuration at {config_path}')
@@ -0,0 +1,402 @@
+"""
+Cluster near-duplicate pattern hits (e.g., templated notes differing only by dates or names) for batch review.
+
+Each record's `precontext`, `match` and `postcontext` are split into word shingles (casefolded, with
+digits replaced by 0), and summarized by a MinHash signature. Records whose signatures collide in any
+LSH band (and whose estimated similarity is at least `threshold`) are clustered together. The clusters
+are stored next to the corpus (`<name>.clusters.idx`) and reviewed with the 'Clusters' queue.
+
+Memory does not grow with the number of shingles or signatures: records are streamed from the corpus,
+signatures are written to a temporary array file (memory-mapped when comparing candidates), and band
+keys are spilled to partition files which are bucketed one at a time.
+
+Usage:
+* `textual-review-cluster /path/to/config.toml`
+* `textual-review-cluster /path/to/config.toml --bands 8 --threshold 0.8` (fewer, more similar clusters)
+* `textual-review-search patterns.txt corpus.jsonl --cluster` (cluster the hits after searching)
+"""
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+from loguru import logger
+
+from textual_review_app.queues import ReviewQueue
+
+TOKEN = re.compile(r'\w+')
+DIGITS = re.compile(r'\d+')
+EMPTY = 0xFFFFFFFF
+MASK = (1 << 64) - 1
+VALUE_BITS = 24  # minimums are 24 bits, leaving room to offset values borrowed by empty bins
+PARTITION_PAIRS = 1 << 18  # (band key, rowid) pairs bucketed in memory at a time
+MAX_PARTITIONS = 256  # (open files)
+BUFFER_PAIRS = 1 << 12
+BUCKET_RECENT = 4  # members of a band bucket that each new member is compared with (most recent first)
+
+
+def shingle_hashes(record: dict, shingle_size=3) -> set[int]:
+    """64-bit hashes of the word shingles of what the reviewer sees of a record."""
+    text = ' '.join(record.get(field) or '' for field in ('precontext', 'match', 'postcontext'))
+    tokens = TOKEN.findall(DIGITS.sub('0', text.casefold()))
+    if not tokens:
+        return set()
+    shingles = {' '.join(tokens[i:i + shingle_size]) for i in range(max(1, len(tokens) - shingle_size + 1))}
+    return {
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf8'), digest_size=8).digest(), 'little')
+        for shingle in shingles
+    }
+
+
+def minhash(hashes, num_perm=64) -> list[int]:
+    """MinHash signature of a set of 64-bit hashes (all `EMPTY` if it is empty).
+
+    Uses one permutation hashing: each hash is assigned to one of `num_perm` bins, which keep their
+    minimum, rather than rehashing every shingle `num_perm` times. Empty bins borrow the value of the
+    next non-empty bin, offset by the distance to it ('rotation' densification).
+    """
+    signature = [EMPTY] * num_perm
+    for h in hashes:
+        i = h % num_perm
+        value = h >> (64 - VALUE_BITS)
+        if value < signature[i]:
+            signature[i] = value
+    if EMPTY in signature and any(value != EMPTY for value in signature):
+        filled = list(signature)
+        for i in range(num_perm):
+            if signature[i] == EMPTY:
+                distance = 1
+                while signature[(i + distance) % num_perm] == EMPTY:
+                    distance += 1
+                filled[i] = signature[(i + distance) % num_perm] + (distance << VALUE_BITS)
+        signature = filled
+    return signature
+
+
+def similarity(a, b) -> float:
+    """Estimated Jaccard similarity of the shingles of two records from their signatures."""
+    if a == b:
+        return 1.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def build_clusters(corpus, num_perm=64, bands=16, threshold=0.6, shingle_size=3):
+    """Cluster the records of `corpus` and write them to its `<name>.clusters.idx`.
+
+    Args:
+        corpus: `Corpus` of pattern hits
+        num_perm: length of the MinHash signatures (at most 128)
+        bands: number of LSH bands (`num_perm` must be divisible by it); with more bands, less similar
+            records become candidates (about (1 / bands) ** (bands / num_perm))
+        threshold: minimum estimated similarity for candidates to be clustered
+        shingle_size: number of words in each shingle
+
+    Returns:
+        the `ClusterIndex`
+    """
+    if not 0 < num_perm <= 128 or num_perm % bands:
+        raise ValueError(f'Number of permutations ({num_perm}) must be at most 128 and divisible by bands ({bands}).')
+    path = Path(corpus.corpus_path)
+    index_path = ClusterIndex.index_path(path)
+    stat = path.stat()
+    n_rows = len(corpus)
+    band_size = 4 * num_perm // bands
+    n_partitions = min(MAX_PARTITIONS, max(1, math.ceil(n_rows * bands / PARTITION_PAIRS)))
+    logger.info(f'Clustering {n_rows} records of {path}')
+    with tempfile.TemporaryDirectory(dir=index_path.parent, prefix=f'{path.name}.clusters.') as tmp:
+        tmp = Path(tmp)
+        # signatures and band keys of each record, spilled to disk
+        signatures = array('I')
+        partitions = [array('Q') for _ in range(n_partitions)]
+        with open(tmp / 'signatures', 'wb') as sig_out:
+            part_outs = [open(tmp / f'partition{i}', 'wb') for i in range(n_partitions)]
+            try:
+                for rowid in range(n_rows):
+                    record = corpus.read(rowid)
+                    signature = array('I', minhash(shingle_hashes(record, shingle_size), num_perm))
+                    signatures.extend(signature)
+                    if signature[0] != EMPTY:
+                        data = signature.tobytes()
+                        category = record.get('category') or ''
+                        for band in range(bands):
+                            # keys are only compared within this run, so the (salted) builtin hash will do
+                            key = hash((band, category, data[band * band_size:(band + 1) * band_size])) & MASK
+                            partition = partitions[key % n_partitions]
+                            partition.append(key)
+                            partition.append(rowid)
+                            if len(partition) >= 2 * BUFFER_PAIRS:
+                                partition.tofile(part_outs[key % n_partitions])
+                                del partition[:]
+                    if len(signatures) >= num_perm * BUFFER_PAIRS:
+                        signatures.tofile(sig_out)
+                        del signatures[:]
+                signatures.tofile(sig_out)
+                for partition, out in zip(partitions, part_outs):
+                    partition.tofile(out)
+            finally:
+                for out in part_outs:
+                    out.close()
+        del signatures, partitions
+
+        # union candidates that share a band bucket; each cluster's root is its first row
+        parent = array('I', range(n_rows))
+
+        def find(rowid):
+            while parent[rowid] != rowid:
+                parent[rowid] = parent[parent[rowid]]
+                rowid = parent[rowid]
+            return rowid
+
+        n_candidates = 0
+        with open(tmp / 'signatures', 'rb') as fh:
+            sig_map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if n_rows else None
+            sigs = memoryview(sig_map).cast('I') if sig_map is not None else []
+            try:
+                for i in range(n_partitions):
+                    pairs = array('Q')
+                    with open(tmp / f'partition{i}', 'rb') as part:
+                        pairs.frombytes(part.read())
+                    # band key -> the bucket's last member, or (once it has several) its `BUCKET_RECENT` last
+                    # members: comparing with recent members, rather than only the first, lets chains of
+                    # near-duplicates (each similar to the one before) join a cluster
+                    buckets = {}
+                    for j in range(0, len(pairs), 2):
+                        key, rowid = pairs[j], pairs[j + 1]
+                        recent = buckets.get(key)
+                        if recent is None:
+                            buckets[key] = rowid
+                            continue
+                        if isinstance(recent, int):
+                            recent = buckets[key] = [recent]
+                        for member in reversed(recent):
+                            a, b = find(member), find(rowid)
+                            if a == b:
+                                continue  # already clustered together (e.g., through another band)
+                            n_candidates += 1
+                            if similarity(sigs[member * num_perm:(member + 1) * num_perm],
+                                          sigs[rowid * num_perm:(rowid + 1) * num_perm]) >= threshold:
+                                parent[max(a, b)] = min(a, b)
+                        recent.append(rowid)
+                        if len(recent) > BUCKET_RECENT:
+                            del recent[0]
+                    del pairs, buckets
+            finally:
+                if sig_map is not None:
+                    sigs.release()
+                    sig_map.close()
+
+    # number clusters of several records first (in order of their first row), then the others
+    for rowid in range(n_rows):
+        parent[rowid] = parent[parent[rowid]]  # roots precede their members: fully compressed
+    sizes = array('I', bytes(4 * n_rows))
+    for root in parent:
+        sizes[root] += 1
+    cluster_ids = array('I', bytes(4 * n_rows))
+    starts = array('I', [0])
+    for multi in (True, False):
+        for rowid in range(n_rows):
+            if parent[rowid] == rowid and (sizes[rowid] > 1) == multi:
+                cluster_ids[rowid] = len(starts) - 1
+                starts.append(starts[-1] + sizes[rowid])
+        if multi:
+            n_multi = len(starts) - 1
+    clusters = array('I', (cluster_ids[root] for root in parent))
+    del parent, sizes, cluster_ids
+    fill = array('I', starts[:-1])
+    members = array('I', bytes(4 * n_rows))
+    for rowid, cluster in enumerate(clusters):
+        members[fill[cluster]] = rowid
+        fill[cluster] += 1
+    del fill
+    logger.info(f'Found {n_multi} clusters of {starts[n_multi]} records'
+                f' ({n_candidates} candidate pairs compared)')
+
+    tmp_path = index_path.with_name(f'{index_path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as out:
+            out.write(ClusterIndex.HEADER.pack(ClusterIndex.MAGIC, stat.st_size, stat.st_mtime_ns, n_rows,
+                                               len(starts) - 1, n_multi, num_perm, bands))
+            clusters.tofile(out)
+            starts.tofile(out)
+            members.tofile(out)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return ClusterIndex(path)
+
+
+class ClusterIndex:
+    """Clusters of near-duplicate records of a corpus, written by `build_clusters` to `<corpus>.clusters.idx`.
+
+    Clusters of several records come first, numbered in order of their first row, followed by a
+    cluster for each remaining record. Layout: header (magic, corpus size, corpus mtime, number of rows,
+    number of clusters, number of clusters of several records, signature length, bands), the cluster of each
+    row (uint32), the start of each cluster in the members (uint32, one more than the number of clusters),
+    then the members (uint32 rowids, sorted within each cluster).
+    """
+    MAGIC = b'TRACLU1' + (b'L' if sys.byteorder == 'little' else b'B')
+    HEADER = struct.Struct('=8sQQQQQII')
+
+    def __init__(self, corpus_path: Path):
+        """
+        Raises:
+            FileNotFoundError: if the corpus hasn't been clustered
+            ValueError: if the corpus changed since it was clustered
+        """
+        self.path = Path(corpus_path)
+        self._mmap = None
+        stat = self.path.stat()
+        with open(self.index_path(self.path), 'rb') as fh:
+            try:
+                (magic, size, mtime_ns, n_rows, n_clusters, self.n_multi, self.num_perm,
+                 self.bands) = self.HEADER.unpack(fh.read(self.HEADER.size))
+            except struct.error:
+                raise ValueError(f'Invalid cluster index: {self.index_path(self.path)}')
+            if magic != self.MAGIC or os.fstat(fh.fileno()).st_size != \
+                    self.HEADER.size + (2 * n_rows + n_clusters + 1) * 4:
+                raise ValueError(f'Invalid cluster index: {self.index_path(self.path)}')
+            if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                raise ValueError(f'{self.path} changed since it was clustered.')
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        pos = self.HEADER.size
+        self.clusters = view[pos:pos + n_rows * 4].cast('I')
+        pos += n_rows * 4
+        self.starts = view[pos:pos + (n_clusters + 1) * 4].cast('I')
+        pos += (n_clusters + 1) * 4
+        self.members = view[pos:].cast('I')
+
+    @staticmethod
+    def index_path(corpus_path: Path) -> Path:
+        return corpus_path.with_name(f'{corpus_path.name}.clusters.idx')
+
+    def __len__(self):
+        """Number of clusters (including single records)."""
+        return len(self.starts) - 1
+
+    def cluster(self, rowid: int):
+        """Sorted rowids of the cluster of `rowid` (including itself)."""
+        cluster = self.clusters[rowid]
+        return self.members[self.starts[cluster]:self.starts[cluster + 1]]
+
+    def cluster_size(self, rowid: int) -> int:
+        cluster = self.clusters[rowid]
+        return self.starts[cluster + 1] - self.starts[cluster]
+
+    @property
+    def n_clustered(self) -> int:
+        """Number of records in clusters of several records."""
+        return self.starts[self.n_multi]
+
+    def queue(self) -> 'ClusterQueue':
+        return ClusterQueue(self)
+
+    def close(self):
+        if self._mmap is not None:
+            for view in (self.clusters, self.starts, self.members):
+                view.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+def open_clusters(corpus_path: Path) -> ClusterIndex | None:
+    """The corpus's `ClusterIndex`, or None if it hasn't been clustered since it last changed."""
+    try:
+        return ClusterIndex(corpus_path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logger.warning(f'Ignoring clusters ({exc}); rerun `textual-review-cluster`.')
+        return None
+
+
+class _FirstRows:
+    """First row of each cluster of several records (sorted), for bisecting."""
+
+    def __init__(self, index: ClusterIndex):
+        self.index = index
+
+    def __getitem__(self, cluster):
+        return self.index.members[self.index.starts[cluster]]
+
+    def __len__(self):
+        return self.index.n_multi
+
+
+class ClusterQueue(ReviewQueue):
+    """Records in clusters of several records, a cluster at a time (clusters in order of their first row).
+
+    From a record outside of the queue, `next` goes to the following cluster (by first row) and `previous`
+    to the end of the preceding one.
+    """
+    name = 'Clusters'
+
+    def __init__(self, index: ClusterIndex):
+        self.index = index
+        self.first_rows = _FirstRows(index)
+
+    def _position(self, rowid: int) -> int | None:
+        """Position of `rowid` in the queue (None if it isn't in it)."""
+        if not 0 <= rowid < len(self.index.clusters) or (cluster := self.index.clusters[rowid]) >= self.index.n_multi:
+            return None
+        start = self.index.starts[cluster]
+        return start + bisect_left(self.index.members[start:self.index.starts[cluster + 1]], rowid)
+
+    def next(self, after: int) -> int | None:
+        position = self._position(after)
+        if position is None:
+            cluster = bisect_right(self.first_rows, after)
+            position = self.index.starts[cluster] if cluster < self.index.n_multi else len(self)
+        else:
+            position += 1
+        return self.index.members[position] if position < len(self) else None
+
+    def previous(self, before: int) -> int | None:
+        position = self._position(before)
+        if position is None:
+            position = self.index.starts[bisect_left(self.first_rows, before)]
+        return self.index.members[position - 1] if position > 0 else None
+
+    def __len__(self):
+        return self.index.n_clustered
+
+
+def main():
+    import argparse
+
+    from textual_review_app.config import Config
+    from textual_review_app.corpus import Corpus
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('config_path', type=Path,
+                        help='Path to config file (its corpus will be clustered).')
+    parser.add_argument('--num-perm', dest='num_perm', type=int, default=64,
+                        help='Length of the MinHash signature of each record (at most 128).')
+    parser.add_argument('--bands', type=int, default=16,
+                        help='Number of LSH bands; more bands find less similar candidates (divides --num-perm).')
+    parser.add_argument('--threshold', type=float, default=0.6,
+                        help='Minimum estimated (Jaccard) similarity of clustered records.')
+    parser.add_argument('--shingle-size', dest='shingle_size', type=int, default=3,
+                        help='Number of words in each shingle.')
+    args = parser.parse_args()
+
+    config = Config(args.config_path)
+    corpus = Corpus(config.corpus_path, source_path=config.source_corpus_path,
+                    context_length=config.context_length, max_window=config.max_window, prefetch=0)
+    try:
+        build_clusters(corpus, num_perm=args.num_perm, bands=args.bands, threshold=args.threshold,
+                       shingle_size=args.shingle_size).close()
+    finally:
+        corpus.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
+import os
 import random
+from contextlib import contextmanager
 from pathlib import Path
 
 import tomlkit
@@ -6,6 +8,9 @@ from rich.text import Text
 from textual.style import Style
 from textual.widgets import Label
 
+from textual_review_app.profiling import timed
+from textual_review_app.state import SessionState
+
 
 def _generate_username():
     names = ['marjatta', 'louhi', 'ukko', 'kaleva', 'hiisi', 'aino',
@@ -22,6 +27,16 @@ class Config:
             'title': 'Review App',
             'offset': 0,
             'corpus': 'review.jsonl',
+            'context_length': 180,
+            'max_window': 500,
+            'cache_size': 128,
+            'prefetch': 3,
+            'write_behind': False,
+            'flush_interval_ms': 500,
+            'flush_max_records': 20,
+            'per_user': False,
+            'lease_size': 0,
+            'lease_minutes': 60,
             'highlights': [],
             'instructions': [],
             'options': [],
@@ -38,6 +53,11 @@ class Config:
         self.load()
         if not self.data['user']:
             self.data['user'] = _generate_username()
+        # offset and font scale change often; they are stored separately from the toml
+        self.state = SessionState(self.path.with_name(f'.{self.path.stem}.state.json'))
+        self._batch_depth = 0
+        self._dirty = False
+        self.highlights_version = 0  # incremented whenever the highlights change
 
     def load(self):
         if self.path.exists():
@@ -47,11 +67,46 @@ class Config:
             raise ValueError(f'Configuration file does not exist: {self.path}')
 
     def save(self):
-        with open(self.path, 'w', encoding='utf8') as out:
-            tomlkit.dump(self.data, out)
+        """Rewrite the config file (via a temporary file, so a crash cannot truncate it)."""
+        if self._batch_depth:
+            self._dirty = True
+            return
+        tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf8') as out:
+                tomlkit.dump(self.data, out)
+            os.replace(tmp_path, self.path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self._dirty = False
+
+    @contextmanager
+    def batch(self):
+        """Save once, at the end of the block, rather than on each assignment; also flushes session state.
+
+        ```
+        with config.batch():
+            config.user = 'tapio'
+            config.canned_responses = [...]
+        ```
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                if self._dirty:
+                    self.save()
+                self.state.flush()
+
+    def flush(self):
+        """Write any pending session state."""
+        self.state.flush()
 
     def add_highlight(self, value, color):
         self.data['highlights'].append({'regex': value, 'color': color})
+        self.highlights_version += 1
         self.save()
 
     def add_snippet(self, text: str):
@@ -89,6 +144,57 @@ class Config:
     def corpus_path(self):
         return self.path.parent / self.data['corpus']
 
+    @property
+    def source_corpus_path(self):
+        """Corpus searched by `textual-review-search`; needed to display 'pointer' format hits."""
+        if self.data.get('source_corpus'):
+            return self.path.parent / self.data['source_corpus']
+        # search outputs /path/to/corpus.pattern.jsonl for /path/to/corpus.jsonl
+        name = self.corpus_path.name
+        if name.endswith('.pattern.jsonl'):
+            return self.corpus_path.with_name(name[:-len('.pattern.jsonl')] + '.jsonl')
+        return None
+
+    @property
+    def context_length(self) -> int:
+        return int(self.data.get('context_length', 180))
+
+    @property
+    def max_window(self) -> int:
+        return int(self.data.get('max_window', 500))
+
+    @property
+    def cache_size(self) -> int:
+        return int(self.data.get('cache_size', 128))
+
+    @property
+    def prefetch(self) -> int:
+        return int(self.data.get('prefetch', 3))
+
+    @property
+    def write_behind(self) -> bool:
+        return bool(self.data.get('write_behind', False))
+
+    @property
+    def flush_interval_ms(self) -> int:
+        return int(self.data.get('flush_interval_ms', 500))
+
+    @property
+    def flush_max_records(self) -> int:
+        return int(self.data.get('flush_max_records', 20))
+
+    @property
+    def per_user(self) -> bool:
+        return bool(self.data.get('per_user', False))
+
+    @property
+    def lease_size(self) -> int:
+        return int(self.data.get('lease_size', 0))
+
+    @property
+    def lease_minutes(self) -> float:
+        return float(self.data.get('lease_minutes', 60))
+
     @property
     def title(self):
         return self.data['title']
@@ -100,12 +206,12 @@ class Config:
 
     @property
     def offset(self):
-        return self.data['offset']
+        return self.state.get('offset', self.data['offset'])
 
     @offset.setter
+    @timed('config.offset')
     def offset(self, value: int):
-        self.data['offset'] = value
-        self.save()
+        self.state.set('offset', value)
 
     @property
     def highlights(self):
@@ -114,6 +220,7 @@ class Config:
     @highlights.setter
     def highlights(self, value: list[dict]):
         self.data['highlights'] = value
+        self.highlights_version += 1
         self.save()
 
     @property
@@ -127,12 +234,11 @@ class Config:
 
     @property
     def font_scale(self) -> float:
-        return float(self.data.get('font_scale', 1.0))
+        return float(self.state.get('font_scale', self.data.get('font_scale', 1.0)))
 
     @font_scale.setter
     def font_scale(self, value: float):
-        self.data['font_scale'] = float(value)
-        self.save()
+        self.state.set('font_scale', float(value))
 
     @property
     def first_run(self) -> bool:
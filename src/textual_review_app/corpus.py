@@ -1,14 +1,242 @@
-from jsonl_index import JsonlIndex
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from loguru import logger
+
+from textual_review_app.profiling import timed
+
+
+def make_hit(data: dict, text: str, category: str, start: int, end: int, context_length=180, max_window=500):
+    """Build a review record for the match `text[start:end]` in the document `data`."""
+    return data | {
+        'category': category,
+        'precontext': text[max(start - context_length, 0): start],
+        'match': text[start:end],
+        'postcontext': text[end: end + context_length],
+        'pretext': text[max(start - max_window, 0): start],
+        'posttext': text[end: end + max_window],
+        'start_index': start,
+        'end_index': end,
+    }
+
+
+class OffsetIndex:
+    """Byte offset of each line of a jsonlines file, persisted in a sidecar file (`<name>.idx`).
+
+    The sidecar is a header (magic, source size, source mtime, line count) followed by one
+    unsigned 64-bit offset per line. It is built once and memory-mapped on later opens, so
+    opening is O(1) regardless of corpus size. If the source file's size or mtime no longer
+    match the header, the sidecar is rebuilt.
+    """
+    MAGIC = b'TRAIDX1' + (b'L' if sys.byteorder == 'little' else b'B')
+    HEADER = struct.Struct('=8sQQQ')
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(f'{self.path.name}.idx')
+        self._mmap = None
+        self.offsets = self._load()
+        if self.offsets is None:
+            self.offsets = self._build()
+
+    def _load(self):
+        try:
+            stat = self.path.stat()
+            with open(self.index_path, 'rb') as fh:
+                magic, size, mtime_ns, count = self.HEADER.unpack(fh.read(self.HEADER.size))
+                if (magic, size, mtime_ns) != (self.MAGIC, stat.st_size, stat.st_mtime_ns):
+                    return None
+                if os.fstat(fh.fileno()).st_size != self.HEADER.size + count * 8:
+                    return None  # truncated
+                if count == 0:
+                    return array('Q')
+                self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, struct.error):
+            return None
+        return memoryview(self._mmap)[self.HEADER.size:].cast('Q')
+
+    def _build(self):
+        stat = self.path.stat()
+        offsets = array('Q')
+        pos = 0
+        with open(self.path, 'rb') as fh:
+            for line in fh:
+                if line.strip():
+                    offsets.append(pos)
+                pos += len(line)
+        tmp_path = self.index_path.with_name(f'{self.index_path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as out:
+                out.write(self.HEADER.pack(self.MAGIC, stat.st_size, stat.st_mtime_ns, len(offsets)))
+                offsets.tofile(out)
+            os.replace(tmp_path, self.index_path)
+        except OSError as exc:
+            logger.warning(f'Unable to write corpus index {self.index_path}: {exc}')
+            tmp_path.unlink(missing_ok=True)
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, item):
+        return self.offsets[item]
+
+    def close(self):
+        if self._mmap is not None:
+            if isinstance(self.offsets, memoryview):
+                self.offsets.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'prefetched', 'currsize', 'maxsize'])
 
 
 class Corpus:
 
-    def __init__(self, corpus_path):
+    def __init__(self, corpus_path, source_path: Path = None, context_length=180, max_window=500,
+                 cache_size=128, prefetch=3, index: OffsetIndex = None):
+        """
+
+        Args:
+            corpus_path: jsonlines file of pattern hits (output of `textual-review-search`)
+            source_path: jsonlines corpus that was searched; required for 'pointer' format hits
+            context_length: size of immediate context rebuilt for 'pointer' format hits
+            max_window: size of 'Show Before'/'Show After' context rebuilt for 'pointer' format hits
+            cache_size: maximum number of parsed records to keep in memory
+            prefetch: number of records on either side of the current one to load in the background
+            index: already opened `OffsetIndex` of `corpus_path` (e.g., shared by forked sessions)
+        """
         self.corpus_path = corpus_path
-        self.idx = JsonlIndex(self.corpus_path, load=True)
+        self.source_path = source_path
+        self.context_length = context_length
+        self.max_window = max_window
+        self.cache_size = max(cache_size, 2 * prefetch + 1)
+        self.prefetch_count = prefetch
+        self.idx = OffsetIndex(self.corpus_path) if index is None else index
+        self._fh = open(self.corpus_path, 'rb')
+        self._source_fh = None
+        self._source_doc = (None, None)  # (offset, document) of the last document read
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._read_lock = threading.Lock()  # file handles are shared with the prefetch thread
+        self._executor = None
+        self._pending = set()
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
 
     def __len__(self):
         return len(self.idx)
 
+    @timed('corpus.get')
     def __getitem__(self, item):
-        return self.idx.get(item)
+        item = range(len(self))[item]  # normalize negative indices/raise IndexError
+        with self._cache_lock:
+            if item in self._cache:
+                self._cache.move_to_end(item)
+                self.hits += 1
+                return dict(self._cache[item])
+            self.misses += 1
+        record = self._load(item)
+        self._store(item, record)
+        return dict(record)
+
+    def read(self, item) -> dict:
+        """Read a record without adding it to the cache (e.g., when scanning the corpus)."""
+        with self._cache_lock:
+            if item in self._cache:
+                return dict(self._cache[item])
+        return self._load(item)
+
+    def _load(self, item) -> dict:
+        with self._read_lock:
+            self._fh.seek(self.idx[item])
+            record = json.loads(self._fh.readline())
+            if 'doc_offset' in record:
+                return self._resolve_pointer(record)
+            return record
+
+    def _store(self, item, record):
+        with self._cache_lock:
+            self._cache[item] = record
+            self._cache.move_to_end(item)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def prefetch(self, item):
+        """Load the `prefetch` records before and after `item` into the cache in a background thread."""
+        if self.prefetch_count <= 0:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='corpus-prefetch')
+        # nearest records first, alternating forwards/backwards
+        for distance in range(1, self.prefetch_count + 1):
+            for neighbor in (item + distance, item - distance):
+                if 0 <= neighbor < len(self):
+                    with self._cache_lock:
+                        if neighbor in self._cache or neighbor in self._pending:
+                            continue
+                        self._pending.add(neighbor)
+                    self._executor.submit(self._prefetch_one, neighbor)
+
+    def _prefetch_one(self, item):
+        try:
+            with self._cache_lock:
+                if item in self._cache:
+                    return
+            record = self._load(item)
+            with self._cache_lock:
+                if item not in self._cache:
+                    # make room by evicting the least recently used records, then keep this one as recently
+                    # used: it's likely to be the next record visited (`cache_size` leaves room for the current
+                    # record and all of its prefetched neighbors)
+                    while len(self._cache) >= self.cache_size:
+                        self._cache.popitem(last=False)
+                    self._cache[item] = record
+                    self.prefetched += 1
+        except Exception as exc:
+            logger.warning(f'Failed to prefetch record {item}: {exc}')
+        finally:
+            with self._cache_lock:
+                self._pending.discard(item)
+
+    def cache_info(self) -> CacheInfo:
+        with self._cache_lock:
+            return CacheInfo(self.hits, self.misses, self.prefetched, len(self._cache), self.cache_size)
+
+    def _read_source(self, offset: int) -> dict:
+        # consecutive hits usually come from the same document
+        if self._source_doc[0] != offset:
+            if self._source_fh is None:
+                if self.source_path is None:
+                    raise ValueError(f'Corpus {self.corpus_path} has pointer records but no source corpus is set.')
+                self._source_fh = open(self.source_path, 'rb')
+            self._source_fh.seek(offset)
+            self._source_doc = (offset, json.loads(self._source_fh.readline()))
+        return self._source_doc[1]
+
+    def _resolve_pointer(self, record: dict) -> dict:
+        """Rebuild the context windows of a 'pointer' format hit from the source corpus."""
+        data = dict(self._read_source(record['doc_offset']))
+        text = data.pop('text')
+        return make_hit(data, text, record['category'], record['start_index'], record['end_index'],
+                        self.context_length, self.max_window)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._fh.close()
+        self.idx.close()
+        if self._source_fh is not None:
+            self._source_fh.close()
+            self._source_fh = None
@@ -0,0 +1,122 @@
+"""
+Groups of records that show the reviewer the same snippet.
+
+Pattern corpora often contain many hits whose match and surrounding context are identical (e.g.,
+boilerplate templates, notes copied forward), which only need to be reviewed once. Records are
+grouped by a hash of their category and normalized `precontext`/`match`/`postcontext` (whitespace
+collapsed, casefolded) so a reviewer can apply one annotation to the whole group.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+from loguru import logger
+
+DEDUP_FIELDS = ('category', 'precontext', 'match', 'postcontext')
+
+
+def context_hash(record: dict) -> int:
+    """64-bit hash of what the reviewer sees of a record."""
+    text = '\x00'.join(' '.join((record.get(field) or '').split()).casefold() for field in DEDUP_FIELDS)
+    return int.from_bytes(hashlib.blake2b(text.encode('utf8'), digest_size=8).digest(), 'little')
+
+
+class DedupIndex:
+    """Rows of a `Corpus` grouped by `context_hash`, persisted in `<corpus>.dedup.idx`.
+
+    Groups are numbered in order of their first row. Layout: header (magic, corpus size, corpus mtime,
+    number of rows, number of groups), the group of each row (uint32), the start of each group in the
+    members (uint32, one more than the number of groups), then the members (uint32 rowids, sorted within
+    each group).
+    """
+    MAGIC = b'TRADUP1' + (b'L' if sys.byteorder == 'little' else b'B')
+    HEADER = struct.Struct('=8sQQQQ')
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.path = Path(corpus.corpus_path)
+        self.index_path = self.path.with_name(f'{self.path.name}.dedup.idx')
+        self._mmap = None
+        if not self._load():
+            self._build()
+
+    def _load(self) -> bool:
+        try:
+            stat = self.path.stat()
+            with open(self.index_path, 'rb') as fh:
+                magic, size, mtime_ns, n_rows, n_groups = self.HEADER.unpack(fh.read(self.HEADER.size))
+                if (magic, size, mtime_ns) != (self.MAGIC, stat.st_size, stat.st_mtime_ns):
+                    return False
+                if os.fstat(fh.fileno()).st_size != self.HEADER.size + (2 * n_rows + n_groups + 1) * 4:
+                    return False  # truncated
+                self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, struct.error):
+            return False
+        view = memoryview(self._mmap)
+        pos = self.HEADER.size
+        self.groups = view[pos:pos + n_rows * 4].cast('I')
+        pos += n_rows * 4
+        self.starts = view[pos:pos + (n_groups + 1) * 4].cast('I')
+        pos += (n_groups + 1) * 4
+        self.members = view[pos:].cast('I')
+        return True
+
+    def _build(self):
+        logger.info(f'Building dedup index for {self.path}')
+        stat = self.path.stat()
+        group_ids = {}  # hash -> group
+        self.groups = array('I')
+        for rowid in range(len(self.corpus)):
+            key = context_hash(self.corpus.read(rowid))
+            if (group := group_ids.get(key)) is None:
+                group = group_ids[key] = len(group_ids)
+            self.groups.append(group)
+        del group_ids
+        # counting sort of rowids by group
+        counts = array('I', bytes(4 * (max(self.groups, default=-1) + 1)))
+        for group in self.groups:
+            counts[group] += 1
+        self.starts = array('I', [0])
+        for count in counts:
+            self.starts.append(self.starts[-1] + count)
+        fill = array('I', self.starts[:-1])
+        self.members = array('I', bytes(4 * len(self.groups)))
+        for rowid, group in enumerate(self.groups):
+            self.members[fill[group]] = rowid
+            fill[group] += 1
+        tmp_path = self.index_path.with_name(f'{self.index_path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as out:
+                out.write(self.HEADER.pack(self.MAGIC, stat.st_size, stat.st_mtime_ns,
+                                           len(self.groups), len(self.starts) - 1))
+                self.groups.tofile(out)
+                self.starts.tofile(out)
+                self.members.tofile(out)
+            os.replace(tmp_path, self.index_path)
+        except OSError as exc:
+            logger.warning(f'Unable to write dedup index {self.index_path}: {exc}')
+            tmp_path.unlink(missing_ok=True)
+
+    def __len__(self):
+        """Number of groups (distinct snippets)."""
+        return len(self.starts) - 1
+
+    def group(self, rowid: int):
+        """Sorted rowids of the records identical to `rowid` (including itself)."""
+        group = self.groups[rowid]
+        return self.members[self.starts[group]:self.starts[group + 1]]
+
+    def group_size(self, rowid: int) -> int:
+        group = self.groups[rowid]
+        return self.starts[group + 1] - self.starts[group]
+
+    def close(self):
+        if self._mmap is not None:
+            for view in (self.groups, self.starts, self.members):
+                view.release()
+            self._mmap.close()
+            self._mmap = None
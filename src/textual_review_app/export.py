@@ -0,0 +1,247 @@
+"""
+Export annotations from a workspace's `annotations.db`.
+
+Rows are streamed from SQLite in chunks, so memory use does not grow with the number of annotations.
+Incremental exports only include rows committed since the last export of the same format; the
+watermark (the change sequence `seq` of the last row exported, see `AnnotationStore._migrate_v3`) is
+kept in the `export_watermarks` table of the database.
+
+Formats:
+* jsonl: one annotation per line, with `row` and `user` keys (the original export format)
+* csv: one annotation per line; `selected` is joined with '; ' and `marks` is JSON-encoded
+* joined: one line per annotation, with the corpus record and its `annotation`
+
+`user` is the reviewer who saved the annotation (see `AnnotationStore.per_user`); annotations saved before
+users were recorded are attributed to the user running the export.
+
+Usage:
+* `textual-review-export /path/to/config.toml`
+* `textual-review-export /path/to/config.toml --format csv --incremental`
+* `textual-review-export /path/to/config.toml --format joined --output /path/to/review.jsonl`
+"""
+import csv
+import json
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+FORMATS = ('jsonl', 'csv', 'joined')
+CSV_COLUMNS = ['row', 'user', 'last_update_utc', 'flagged', 'selected', 'comment', 'marks']
+CHUNK_SIZE = 1000
+
+
+def default_export_path(dbpath: Path, fmt='jsonl', incremental=False) -> Path:
+    suffix = {'jsonl': 'db.jsonl', 'csv': 'db.csv', 'joined': 'joined.jsonl'}[fmt]
+    kind = '_incremental' if incremental else ''
+    return Path(dbpath).parent / f'export_{datetime.now().strftime("%Y%m%d_%H%M%S")}{kind}.{suffix}'
+
+
+def _create_watermark_table(conn):
+    conn.execute('''
+                 CREATE TABLE IF NOT EXISTS export_watermarks
+                 (
+                     format TEXT PRIMARY KEY,
+                     last_update_utc TEXT NOT NULL,
+                     exported_utc TEXT NOT NULL,
+                     seq INTEGER
+                 )
+                 ''')
+    # watermarks written before change sequences only have `last_update_utc`
+    if 'seq' not in {row[1] for row in conn.execute('PRAGMA table_info(export_watermarks)')}:
+        conn.execute('ALTER TABLE export_watermarks ADD COLUMN seq INTEGER')
+    conn.commit()
+
+
+def get_watermark(conn, fmt) -> tuple[str, int | None] | None:
+    """Latest (`last_update_utc`, `seq`) included in an export of `fmt`."""
+    row = conn.execute('SELECT last_update_utc, seq FROM export_watermarks WHERE format = ?', (fmt,)).fetchone()
+    return tuple(row) if row else None
+
+
+def _set_watermark(conn, fmt, last_update_utc: str, seq: int | None):
+    conn.execute('''
+                 INSERT INTO export_watermarks (format, last_update_utc, exported_utc, seq)
+                 VALUES (?, ?, ?, ?) ON CONFLICT(format) DO
+                 UPDATE SET
+                     last_update_utc = excluded.last_update_utc,
+                     exported_utc = excluded.exported_utc,
+                     seq = excluded.seq
+                 ''', (fmt, last_update_utc, datetime.now().isoformat(), seq))
+    conn.commit()
+
+
+def _annotation_columns(conn) -> set[str]:
+    return {row[1] for row in conn.execute('PRAGMA table_info(annotations)')}
+
+
+def _since_clause(columns, since: tuple[str, int | None] | None) -> tuple[str, tuple]:
+    """WHERE clause (and parameters) selecting the rows committed after the watermark `since`."""
+    if since is None:
+        return '', ()
+    last_update, seq = since
+    if 'seq' in columns and seq is not None:
+        return 'WHERE seq > ?', (seq,)
+    # timestamps are stored in a fixed ISO format, so they compare correctly as text
+    if 'seq' in columns:  # watermark from before change sequences: every row written since has a seq
+        return 'WHERE seq > 0 OR CAST(last_update_utc AS TEXT) > ?', (last_update,)
+    # databases before schema version 3 have no change sequence
+    return 'WHERE CAST(last_update_utc AS TEXT) > ?', (last_update,)
+
+
+def iter_chunks(conn, since: tuple[str, int | None] | None = None, chunk_size=CHUNK_SIZE):
+    """Yield lists of (rowid, annotation json, last_update_utc, user), in rowid order, committed after the
+    watermark `since` (see `get_watermark`).
+
+    `user` is the owner of a per-user annotation, or the user who saved a shared one; it is '' for shared
+    annotations saved before users were recorded (see `AnnotationStore.per_user`).
+    """
+    columns = _annotation_columns(conn)
+    # databases before schema version 4 have no user (or saved_by) column
+    user = 'user' if 'user' in columns else "''"
+    saved_by = "COALESCE(NULLIF(user, ''), saved_by)" if 'saved_by' in columns else user
+    where, params = _since_clause(columns, since)
+    cur = conn.execute(f'SELECT rowid, annotation, CAST(last_update_utc AS TEXT), {saved_by} FROM annotations '
+                       f'{where} ORDER BY rowid, {user}', params)
+    while chunk := cur.fetchmany(chunk_size):
+        yield chunk
+
+
+def _jsonl_line(rowid, annotation: str, user: str) -> str:
+    # splice keys into the stored object rather than re-parsing it
+    extra = f'"row": {rowid}, "user": {json.dumps(user)}'
+    annotation = annotation.rstrip()
+    if annotation == '{}':
+        return f'{{{extra}}}\n'
+    return f'{annotation[:-1]}, {extra}}}\n'
+
+
+def _write_jsonl(out, chunks, user, **kwargs):
+    for chunk in chunks:
+        out.writelines(_jsonl_line(rowid, annotation, saved_by or user) for rowid, annotation, _, saved_by in chunk)
+
+
+def _write_csv(out, chunks, user, **kwargs):
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    for chunk in chunks:
+        rows = []
+        for rowid, annotation, last_update, saved_by in chunk:
+            d = json.loads(annotation)
+            rows.append([
+                rowid, saved_by or user, last_update, int(bool(d.get('flagged'))), '; '.join(d.get('selected', [])),
+                d.get('comment', ''), json.dumps(d.get('marks', [])),
+            ])
+        writer.writerows(rows)
+
+
+def _write_joined(out, chunks, user, corpus=None):
+    if corpus is None:
+        raise ValueError('The joined export format requires the corpus.')
+    for chunk in chunks:
+        out.writelines(
+            json.dumps(corpus[rowid] | {'row': rowid, 'user': saved_by or user, 'annotation': json.loads(annotation)})
+            + '\n'
+            for rowid, annotation, _, saved_by in chunk
+        )
+
+
+WRITERS = {
+    'jsonl': _write_jsonl,
+    'csv': _write_csv,
+    'joined': _write_joined,
+}
+
+
+def export_annotations(dbpath: Path, out_path: Path = None, fmt='jsonl', incremental=False, user='anonymous',
+                       corpus=None, chunk_size=CHUNK_SIZE) -> Path | None:
+    """Export annotations from `dbpath`.
+
+    Args:
+        dbpath: sqlite database of annotations
+        out_path: output file; defaults to a timestamped `export_*` file alongside the database
+        fmt: one of `FORMATS`
+        incremental: only export rows committed since the last export in `fmt`
+        user: reviewer name written with annotations saved before users were recorded
+        corpus: `Corpus` the annotations refer to (required for 'joined')
+        chunk_size: number of rows read from the database at a time
+
+    Returns:
+        path of the export, or None if `incremental` and no rows have changed
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f'Unknown export format: {fmt}; expected one of {", ".join(FORMATS)}')
+    dbpath = Path(dbpath)
+    # separate connection: under WAL, this reads a consistent snapshot without blocking the app
+    conn = sqlite3.connect(dbpath)
+    try:
+        _create_watermark_table(conn)
+        since = get_watermark(conn, fmt) if incremental else None
+        columns = _annotation_columns(conn)
+        # read the watermark and the rows from the same snapshot
+        conn.execute('BEGIN')
+        max_seq = 'MAX(seq)' if 'seq' in columns else 'NULL'
+        max_update, max_seq = conn.execute(
+            f'SELECT MAX(CAST(last_update_utc AS TEXT)), {max_seq} FROM annotations').fetchone()
+        if incremental:
+            where, params = _since_clause(columns, since)
+            if conn.execute(f'SELECT 1 FROM annotations {where} LIMIT 1', params).fetchone() is None:
+                logger.info(f'No annotations changed since the last {fmt} export.')
+                return None
+        out_path = Path(out_path) if out_path else default_export_path(dbpath, fmt, incremental)
+        tmp_path = out_path.with_name(f'{out_path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf8', newline='') as out:
+                WRITERS[fmt](out, iter_chunks(conn, since, chunk_size), user, corpus=corpus)
+            os.replace(tmp_path, out_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        conn.commit()  # end the read snapshot
+        if max_update is not None:
+            _set_watermark(conn, fmt, max_update, max_seq)
+    finally:
+        conn.close()
+    logger.info(f'Exported annotations to {out_path}')
+    return out_path
+
+
+def main():
+    import argparse
+
+    from textual_review_app.config import Config
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('config_path', type=Path,
+                        help='Path to config file (its directory is the workspace directory).')
+    parser.add_argument('--format', dest='fmt', choices=FORMATS, default='jsonl',
+                        help='Output format.')
+    parser.add_argument('--incremental', action='store_true', default=False,
+                        help='Only export annotations saved since the last export in this format.')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='Output file (default: timestamped export_* file in the workspace).')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=CHUNK_SIZE,
+                        help='Number of rows read from the database at a time.')
+    args = parser.parse_args()
+
+    config = Config(args.config_path)
+    dbpath = config.corpus_path.parent / 'annotations.db'
+    if not dbpath.exists():
+        logger.error(f'No annotations found: {dbpath}')
+        return
+    corpus = None
+    if args.fmt == 'joined':
+        from textual_review_app.corpus import Corpus
+        corpus = Corpus(config.corpus_path, source_path=config.source_corpus_path,
+                        context_length=config.context_length, max_window=config.max_window, prefetch=0)
+    try:
+        export_annotations(dbpath, args.output, args.fmt, args.incremental, user=config.user,
+                           corpus=corpus, chunk_size=args.chunk_size)
+    finally:
+        if corpus is not None:
+            corpus.close()
+
+
+if __name__ == '__main__':
+    main()
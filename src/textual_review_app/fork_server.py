@@ -0,0 +1,179 @@
+"""
+Fork server for serving the review app to many browser sessions.
+
+Run by `serve.py --fork`. Rather than starting a new interpreter per browser tab (which re-imports
+Textual and re-opens the corpus each time), a single long-lived process imports the app and opens
+the corpus's `OffsetIndex` once, then forks a worker for each session. Workers share the preloaded
+pages copy-on-write; each opens its own `AnnotationStore` (SQLite connections can't cross a fork).
+
+Protocol (over a unix socket): the client sends one json line of environment variables to set in
+the worker (e.g., `COLUMNS`/`ROWS`) along with three file descriptors (stdin, stdout, stderr) using
+SCM_RIGHTS, and receives the worker's pid. The worker talks to textual-serve over those descriptors
+exactly as a subprocess would.
+
+Environment variables read by Textual when it is imported (e.g., `TEXTUAL_DRIVER`) must already be
+set when this process is started.
+"""
+import gc
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+from pathlib import Path
+
+from loguru import logger
+
+# modules the app imports on demand; loaded before forking so sessions don't each import them
+PRELOAD = (
+    'textual_review_app.app',
+    'textual_review_app.clusters',
+    'textual_review_app.dedup',
+    'textual_review_app.queues',
+    'textual_review_app.search_index',
+    'textual_review_app.widgets.add_keyword_modal',
+    'textual_review_app.widgets.canned_response_modal',
+    'textual_review_app.widgets.diagnostics_modal',
+    'textual_review_app.widgets.goto_modal',
+    'textual_review_app.widgets.info_modal',
+    'textual_review_app.widgets.mark_modal',
+    'textual_review_app.widgets.metadata_modal',
+    'textual_review_app.widgets.queue_modal',
+    'textual_review_app.widgets.search_modal',
+    'textual_review_app.widgets.settings_modal',
+)
+READY = b'ready\n'
+
+
+class ForkServer:
+
+    def __init__(self, config_path: Path, socket_path: Path):
+        """
+
+        Args:
+            config_path: path to the toml config served to every session
+            socket_path: unix socket on which to accept session requests
+        """
+        self.config_path = Path(config_path)
+        self.socket_path = Path(socket_path)
+        self.index = None
+
+    def preload(self):
+        from textual_review_app.config import Config
+        from textual_review_app.corpus import OffsetIndex
+
+        for module in PRELOAD:
+            try:
+                importlib.import_module(module)
+            except ImportError as exc:
+                # sessions import it on demand (and report the error) if it is ever needed
+                logger.warning(f'Unable to preload {module}: {exc}')
+        self.index = OffsetIndex(Config(self.config_path).corpus_path)
+        # keep the collector from touching (and so copying) the preloaded objects in every worker
+        gc.collect()
+        gc.freeze()
+
+    def serve_forever(self):
+        """Preload, signal readiness on stdout, then fork a worker for each request."""
+        self.preload()
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # workers are reaped automatically
+        self.socket_path.unlink(missing_ok=True)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(self.socket_path))
+        listener.listen()
+        sys.stdout.buffer.write(READY)
+        sys.stdout.flush()
+        logger.info(f'Fork server listening on {self.socket_path}')
+        try:
+            while True:
+                conn, _ = listener.accept()
+                with conn:
+                    self._handle(listener, conn)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            self.socket_path.unlink(missing_ok=True)
+
+    def _handle(self, listener: socket.socket, conn: socket.socket):
+        fds = []
+        try:
+            msg, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+            while msg and not msg.endswith(b'\n'):
+                if not (chunk := conn.recv(65536)):
+                    break
+                msg += chunk
+            if len(fds) != 3:
+                raise ValueError(f'expected 3 file descriptors, received {len(fds)}')
+            environment = json.loads(msg)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            if (pid := os.fork()) == 0:
+                listener.close()
+                conn.close()
+                self._run_session(fds, environment)  # does not return
+            conn.sendall(f'{pid}\n'.encode('utf8'))
+        except (OSError, ValueError) as exc:
+            logger.error(f'Unable to start session: {exc}')
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def _run_session(self, fds: list[int], environment: dict[str, str]):
+        code = 1
+        try:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            for target, fd in enumerate(fds):
+                if fd != target:
+                    os.dup2(fd, target)
+                    os.close(fd)
+            os.environ.update(environment)
+            from textual_review_app.app import run_app
+            run_app(self.config_path, corpus_index=self.index)
+            code = 0
+        except BaseException as exc:
+            logger.exception(f'Session failed: {exc}')
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+
+def fork_session(socket_path: Path, environment: dict[str, str], fds: tuple[int, int, int]) -> int:
+    """Ask the fork server at `socket_path` for a new session, returning the worker's pid.
+
+    Args:
+        socket_path: the fork server's socket
+        environment: variables to set in the worker
+        fds: the worker's stdin, stdout and stderr; the caller still owns (and should close) them
+
+    Raises:
+        OSError: if the fork server could not start a session
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        socket.send_fds(sock, [json.dumps(environment).encode('utf8') + b'\n'], list(fds))
+        reply = b''
+        while not reply.endswith(b'\n'):
+            if not (chunk := sock.recv(64)):
+                raise OSError(f'Fork server at {socket_path} failed to start a session.')
+            reply += chunk
+    return int(reply)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
+    parser.add_argument('config_path', type=Path,
+                        help='Path to toml file.')
+    parser.add_argument('socket_path', type=Path,
+                        help='Unix socket on which to accept sessions.')
+    args = parser.parse_args()
+
+    ForkServer(args.config_path, args.socket_path).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
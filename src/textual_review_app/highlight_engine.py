@@ -0,0 +1,73 @@
+import re
+from collections import OrderedDict
+
+from loguru import logger
+
+
+class HighlightEngine:
+    """Compile highlight patterns once, and cache the spans they produce for each text.
+
+    Patterns are only recompiled when `set_patterns` is given a new `key` (e.g., when the
+    configured highlights change), so re-rendering a record, or toggling 'Show Before'/'Show After'
+    back to a window that was already shown, does no regex work.
+    """
+
+    def __init__(self, cache_size=32):
+        self.cache_size = cache_size
+        self.compiled = []  # [(pattern, color)]
+        self._key = None
+        self._cache = OrderedDict()
+
+    def set_patterns(self, patterns: list[dict], key=None):
+        """Compile `patterns` ({'regex': str, 'color': str}) unless `key` matches the current patterns.
+
+        Args:
+            patterns: highlight patterns
+            key: hashable identifier of this set of patterns; defaults to the (regex, color) pairs
+        """
+        if key is None:
+            key = tuple((pat['regex'], pat['color']) for pat in patterns)
+        if key == self._key:
+            return
+        self.compiled = []
+        for pat in patterns:
+            try:
+                # MULTILINE: ^ and $ still match at line boundaries, as when lines were matched one at a time
+                self.compiled.append((re.compile(pat['regex'], re.I | re.MULTILINE), pat['color']))
+            except re.error as exc:
+                logger.warning(f'Skipping invalid highlight pattern {pat["regex"]!r}: {exc}')
+        self._key = key
+        self._cache.clear()
+
+    def spans(self, text: str) -> list[tuple[int, int, str]]:
+        """Return (start, end, color) for each highlight in `text`, grouped by pattern and sorted within each.
+
+        Patterns are matched once over the whole text, so matches may cross lines.
+        """
+        if (spans := self._cache.get(text)) is not None:
+            self._cache.move_to_end(text)
+            return spans
+        spans = [
+            (m.start(), m.end(), color)
+            for pattern, color in self.compiled
+            for m in pattern.finditer(text)
+            if m.end() > m.start()
+        ]
+        self._cache[text] = spans
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return spans
+
+    def spans_between(self, text: str, start: int, end: int, overlap=1000) -> list[tuple[int, int, str]]:
+        """Return (start, end, color) for each highlight starting in `text[start:end]` (used for windowed rendering).
+
+        Only `text[start - overlap:end + overlap]` is searched, so matches longer than `overlap` may be truncated.
+        """
+        lo = max(start - overlap, 0)
+        hi = min(end + overlap, len(text))
+        return [
+            (m.start(), m.end(), color)
+            for pattern, color in self.compiled
+            for m in pattern.finditer(text, lo, hi)
+            if start <= m.start() < end and m.end() > m.start()
+        ]
@@ -0,0 +1,149 @@
+"""
+Opt-in timing of the review app's hot paths.
+
+Enable with `textual-review-app config.toml --profile [trace.jsonl]` or by setting the environment
+variable `TEXTUAL_REVIEW_PROFILE` (to 1, or to the trace path; e.g., for `textual-review-web`).
+Functions decorated with `timed` then record a span for each call:
+* the last `WINDOW` durations of each stage are kept for p50/p95/p99 (see `Profiler.summary`),
+  shown in the app's diagnostics modal (F9)
+* spans are kept (up to `MAX_SPANS`) and written to a jsonlines trace on exit
+
+When profiling is disabled, a decorated function costs one attribute check per call.
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from loguru import logger
+
+ENV_VAR = 'TEXTUAL_REVIEW_PROFILE'
+WINDOW = 1000
+MAX_SPANS = 100_000
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Profiler:
+
+    def __init__(self, window=WINDOW, max_spans=MAX_SPANS):
+        self.enabled = False
+        self.trace_path = None
+        self.window = window
+        self._lock = threading.Lock()
+        self._durations = {}  # stage -> deque of recent durations (ms)
+        self._totals = {}  # stage -> [count, total ms, max ms]
+        self._spans = deque(maxlen=max_spans)
+
+    def enable(self, trace_path: Path | None = None):
+        """Start recording spans; they will be written to `trace_path` by `dump` (if given)."""
+        self.enabled = True
+        if trace_path is not None:
+            self.trace_path = Path(trace_path)
+
+    def record(self, stage: str, start: float, duration: float):
+        """Record a span of `duration` seconds that began at `start` (epoch seconds)."""
+        ms = duration * 1000
+        with self._lock:
+            if (durations := self._durations.get(stage)) is None:
+                durations = self._durations[stage] = deque(maxlen=self.window)
+                self._totals[stage] = [0, 0.0, 0.0]
+            durations.append(ms)
+            totals = self._totals[stage]
+            totals[0] += 1
+            totals[1] += ms
+            totals[2] = max(totals[2], ms)
+            self._spans.append((stage, start, ms, threading.current_thread().name))
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Per stage: number of calls, mean and max (ms) over all calls; p50/p95/p99 (ms) over the last `window`."""
+        with self._lock:
+            recent = {stage: sorted(durations) for stage, durations in self._durations.items()}
+            totals = {stage: list(values) for stage, values in self._totals.items()}
+        return {
+            stage: {
+                'count': totals[stage][0],
+                'mean': totals[stage][1] / totals[stage][0],
+                'p50': percentile(ordered, 0.5),
+                'p95': percentile(ordered, 0.95),
+                'p99': percentile(ordered, 0.99),
+                'max': totals[stage][2],
+            }
+            for stage, ordered in sorted(recent.items())
+        }
+
+    def dump(self, path: Path | None = None) -> Path | None:
+        """Write the recorded spans, then a summary line per stage, to `path` (default: `trace_path`) as jsonlines."""
+        path = Path(path) if path is not None else self.trace_path
+        if path is None:
+            return None
+        with self._lock:
+            spans = list(self._spans)
+        with open(path, 'w', encoding='utf8') as out:
+            for stage, start, ms, thread in spans:
+                out.write(json.dumps({'type': 'span', 'stage': stage, 'start': start, 'ms': ms, 'thread': thread}) + '\n')
+            for stage, stats in self.summary().items():
+                out.write(json.dumps({'type': 'summary', 'stage': stage} | stats) + '\n')
+        logger.info(f'Wrote profile trace to {path}')
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._totals.clear()
+            self._spans.clear()
+
+
+PROFILER = Profiler()
+if os.environ.get(ENV_VAR, '').strip() not in ('', '0'):
+    value = os.environ[ENV_VAR].strip()
+    PROFILER.enable(None if value.lower() in ('1', 'true', 'yes') else value)
+
+
+def timed(stage: str):
+    """Record each call of the decorated function (or coroutine/generator function) as a span of `stage`."""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not PROFILER.enabled:
+                    return await func(*args, **kwargs)
+                start, t0 = time.time(), time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    PROFILER.record(stage, start, time.perf_counter() - t0)
+        elif inspect.isgeneratorfunction(func):
+            # e.g., `compose`: the work happens while the generator is consumed
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not PROFILER.enabled:
+                    return (yield from func(*args, **kwargs))
+                start, t0 = time.time(), time.perf_counter()
+                try:
+                    return (yield from func(*args, **kwargs))
+                finally:
+                    PROFILER.record(stage, start, time.perf_counter() - t0)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not PROFILER.enabled:
+                    return func(*args, **kwargs)
+                start, t0 = time.time(), time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    PROFILER.record(stage, start, time.perf_counter() - t0)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,250 @@
+"""
+Review queues: ordered subsets of the corpus a reviewer can step through.
+
+Each queue answers `next(after)`/`previous(before)` from an index rather than by visiting the
+rows in between:
+* `UnreviewedQueue`/`FlaggedQueue`: the annotation store's in-memory bitmaps
+* `OptionQueue`: an index seek on `annotation_selected(user, option, rowid)`
+* `LeaseQueue`: an index seek on `leases(user, rowid)`
+* `CategoryQueue`: sorted rowids per category, kept in a sidecar next to the corpus (`<name>.categories.idx`)
+* `ClusterQueue` (see `clusters`): near-duplicate records, a cluster at a time (`<name>.clusters.idx`)
+"""
+import abc
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from loguru import logger
+
+
+class ReviewQueue(abc.ABC):
+    name = ''
+
+    @abc.abstractmethod
+    def next(self, after: int) -> int | None:
+        """First rowid in the queue after `after`, or None."""
+
+    @abc.abstractmethod
+    def previous(self, before: int) -> int | None:
+        """Last rowid in the queue before `before`, or None."""
+
+    @abc.abstractmethod
+    def __len__(self):
+        """Number of records in the queue."""
+
+
+class UnreviewedQueue(ReviewQueue):
+    name = 'Unreviewed'
+
+    def __init__(self, store, total: int):
+        self.store = store
+        self.total = total
+
+    def next(self, after: int) -> int | None:
+        return self.store.next_unreviewed(after, total=self.total)
+
+    def previous(self, before: int) -> int | None:
+        return self.store.previous_unreviewed(min(before, self.total))
+
+    def __len__(self):
+        return self.total - self.store.count_reviewed()
+
+
+class FlaggedQueue(ReviewQueue):
+    name = 'Flagged'
+
+    def __init__(self, store):
+        self.store = store
+
+    def next(self, after: int) -> int | None:
+        return self.store.flagged.next_set(after)
+
+    def previous(self, before: int) -> int | None:
+        return self.store.flagged.previous_set(before)
+
+    def __len__(self):
+        return self.store.count_flagged()
+
+
+class OptionQueue(ReviewQueue):
+
+    def __init__(self, store, option: str):
+        self.store = store
+        self.option = option
+        self.name = f'Option: {option}'
+
+    def next(self, after: int) -> int | None:
+        return self.store.next_with_option(self.option, after)
+
+    def previous(self, before: int) -> int | None:
+        return self.store.previous_with_option(self.option, before)
+
+    def __len__(self):
+        return self.store.option_counts().get(self.option, 0)
+
+
+class LeaseQueue(ReviewQueue):
+    """Records leased to this reviewer and not yet reviewed.
+
+    When only `refill_at` of them are left, the next batch is leased in a background thread, so Save & Next
+    doesn't wait on the lease transaction (which may wait on other sessions' leases).
+    """
+    name = 'Assigned to Me'
+
+    def __init__(self, store, total: int, size: int, refill_at: int = None):
+        """
+
+        Args:
+            store: `AnnotationStore` of this reviewer
+            total: number of records in the corpus
+            size: number of records to hold leases on (see `AnnotationStore.acquire_leases`)
+            refill_at: lease the next batch once this many leased records are left (default: a quarter of `size`)
+        """
+        self.store = store
+        self.total = total
+        self.size = size
+        self.refill_at = max(size // 4, 1) if refill_at is None else refill_at
+        self._executor = None
+        self._refill = None  # `Future` of the background `acquire_leases`
+
+    def next(self, after: int) -> int | None:
+        rowid = self.store.next_leased(after)
+        if rowid is None:
+            # this batch is done (or expired and was reassigned)
+            if self._refill is not None and not self._refill.done():
+                self._wait_for_refill()
+            else:
+                self.store.acquire_leases(self.size, self.total)
+            rowid = self.store.next_leased(after)
+        if rowid is None:
+            rowid = self.store.next_leased(-1)  # wrap to leases before `after`
+        if (self._refill is None or self._refill.done()) and len(self) <= self.refill_at:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lease-refill')
+            self._refill = self._executor.submit(self.store.acquire_leases, self.size, self.total)
+        return rowid
+
+    def _wait_for_refill(self):
+        try:
+            self._refill.result()
+        except Exception as exc:
+            logger.warning(f'Unable to lease the next batch in the background: {exc}')
+            self.store.acquire_leases(self.size, self.total)
+
+    def previous(self, before: int) -> int | None:
+        return self.store.previous_leased(before)
+
+    def __len__(self):
+        return self.store.count_leased()
+
+
+class SortedQueue(ReviewQueue):
+    """Queue over a fixed, sorted sequence of rowids."""
+
+    def __init__(self, name: str, rowids):
+        self.name = name
+        self.rowids = rowids
+
+    def next(self, after: int) -> int | None:
+        i = bisect_right(self.rowids, after)
+        return self.rowids[i] if i < len(self.rowids) else None
+
+    def previous(self, before: int) -> int | None:
+        i = bisect_left(self.rowids, before)
+        return self.rowids[i - 1] if i > 0 else None
+
+    def __len__(self):
+        return len(self.rowids)
+
+
+class CategoryIndex:
+    """Sorted rowids of each `category` in a corpus of pattern hits, persisted in `<name>.categories.idx`.
+
+    Layout: header (magic, corpus size, corpus mtime, length of json), json mapping each category
+    to its [start, end) in the rowids, then the rowids (uint32) grouped by category.
+    """
+    MAGIC = b'TRACAT1' + (b'L' if sys.byteorder == 'little' else b'B')
+    HEADER = struct.Struct('=8sQQQ')
+
+    def __init__(self, corpus_path: Path):
+        self.path = Path(corpus_path)
+        self.index_path = self.path.with_name(f'{self.path.name}.categories.idx')
+        self._mmap = None
+        if not self._load():
+            self._build()
+
+    def _load(self) -> bool:
+        try:
+            stat = self.path.stat()
+            with open(self.index_path, 'rb') as fh:
+                magic, size, mtime_ns, json_length = self.HEADER.unpack(fh.read(self.HEADER.size))
+                if (magic, size, mtime_ns) != (self.MAGIC, stat.st_size, stat.st_mtime_ns):
+                    return False
+                self.ranges = json.loads(fh.read(json_length))
+                n_rows = max((end for _, end in self.ranges.values()), default=0)
+                if os.fstat(fh.fileno()).st_size != self.HEADER.size + json_length + n_rows * 4:
+                    return False  # truncated
+                if n_rows == 0:
+                    self.rowids = array('I')
+                    return True
+                self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, struct.error):
+            return False
+        self.rowids = memoryview(self._mmap)[self.HEADER.size + json_length:].cast('I')
+        return True
+
+    def _build(self):
+        stat = self.path.stat()
+        by_category = {}
+        rowid = 0
+        # rows are numbered as in `OffsetIndex`: blank lines are skipped
+        with open(self.path, 'rb') as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                category = json.loads(line).get('category') or ''
+                if (rows := by_category.get(category)) is None:
+                    rows = by_category[category] = array('I')
+                rows.append(rowid)
+                rowid += 1
+        self.rowids = array('I')
+        self.ranges = {}
+        for category in sorted(by_category):
+            start = len(self.rowids)
+            self.rowids.extend(by_category[category])
+            self.ranges[category] = [start, len(self.rowids)]
+        data = json.dumps(self.ranges).encode('utf8')
+        tmp_path = self.index_path.with_name(f'{self.index_path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as out:
+                out.write(self.HEADER.pack(self.MAGIC, stat.st_size, stat.st_mtime_ns, len(data)))
+                out.write(data)
+                self.rowids.tofile(out)
+            os.replace(tmp_path, self.index_path)
+        except OSError as exc:
+            logger.warning(f'Unable to write category index {self.index_path}: {exc}')
+            tmp_path.unlink(missing_ok=True)
+
+    @property
+    def categories(self) -> list[str]:
+        return list(self.ranges)
+
+    def rows(self, category: str):
+        """Sorted rowids of `category`."""
+        start, end = self.ranges.get(category, (0, 0))
+        return self.rowids[start:end]
+
+    def queue(self, category: str) -> SortedQueue:
+        return SortedQueue(f'Category: {category}', self.rows(category))
+
+    def close(self):
+        if self._mmap is not None:
+            self.rowids.release()
+            self._mmap.close()
+            self._mmap = None
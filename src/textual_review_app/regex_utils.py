@@ -0,0 +1,70 @@
+"""
+Static analysis of user-supplied regular expressions.
+
+* `required_literals`: literal strings that must appear in any match. These are used as cheap
+  prefilters: if none of a pattern's required literals occur in a (casefolded) text, the
+  pattern cannot match it and the regex scan can be skipped.
+"""
+import re
+
+try:
+    import re._parser as sre_parse  # python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+if hasattr(sre_parse, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_parse.POSSESSIVE_REPEAT)
+_ZERO_WIDTH = {sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT}
+
+
+def _best(candidates):
+    """Pick the alternative set whose shortest literal is longest (i.e., the most selective)."""
+    candidates = [c for c in candidates if c]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: (min(len(s) for s in c), -len(c)))
+
+
+def _sequence_literals(items):
+    candidates = []
+    run = []
+    for op, av in items:
+        if op is sre_parse.LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+        if run:
+            candidates.append({''.join(run)})
+            run = []
+        if op in _ZERO_WIDTH:
+            continue
+        if op is sre_parse.SUBPATTERN:
+            candidates.append(_sequence_literals(av[-1]))
+        elif op is sre_parse.BRANCH:
+            alternatives = [_sequence_literals(branch) for branch in av[1]]
+            if all(alternatives):
+                candidates.append(set().union(*alternatives))
+        elif op in _REPEATS:
+            min_repeat, _, subpattern = av
+            if min_repeat >= 1:
+                candidates.append(_sequence_literals(subpattern))
+    if run:
+        candidates.append({''.join(run)})
+    return _best(candidates)
+
+
+def required_literals(regex: str, flags=re.I | re.MULTILINE) -> set[str] | None:
+    """Return a set of casefolded literals, at least one of which occurs in every match.
+
+    Returns None when no such set can be derived (e.g., `\\d+` or an empty-matching pattern),
+    in which case the regex must always be run.
+    """
+    try:
+        parsed = sre_parse.parse(regex, flags)
+    except re.error:
+        return None
+    literals = _sequence_literals(parsed.data)
+    if not literals:
+        return None
+    return {literal.casefold() for literal in literals}
+
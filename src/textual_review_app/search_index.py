@@ -0,0 +1,172 @@
+"""
+Corpus-wide regex search backed by a token inverted index.
+
+The index maps each (casefolded) word token in a record's displayed text to the sorted rowids
+containing it. It is stored next to the corpus (`<name>.search.idx`) and memory-mapped on later
+opens. A search narrows the candidate rows using the regex's required literals
+(see `regex_utils.required_literals`) and then verifies each candidate with the regex itself.
+Patterns without required literals (e.g., `\\d{3}`) fall back to scanning every row.
+"""
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import chain, islice
+from pathlib import Path
+
+from loguru import logger
+
+from textual_review_app.regex_utils import required_literals
+
+SEARCH_FIELDS = ('precontext', 'match', 'postcontext')
+TOKEN_RE = re.compile(r'\w+')
+
+
+def record_text(record: dict) -> str:
+    """Text of a record that is searched (what the reviewer sees by default)."""
+    return ''.join(record.get(field) or '' for field in SEARCH_FIELDS)
+
+
+class SearchIndex:
+    """Token -> rowids inverted index over a `Corpus`, persisted in `<corpus>.search.idx`.
+
+    Layout: header (magic, corpus size, corpus mtime, number of tokens, number of postings),
+    token offsets into the postings (uint64, one more than the number of tokens), postings (uint32
+    rowids), then the newline-separated, sorted vocabulary.
+    """
+    MAGIC = b'TRASRC1' + (b'L' if sys.byteorder == 'little' else b'B')
+    HEADER = struct.Struct('=8sQQQQ')
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.path = Path(corpus.corpus_path)
+        self.index_path = self.path.with_name(f'{self.path.name}.search.idx')
+        self._mmap = None
+        if not self._load():
+            self._build()
+
+    def _load(self) -> bool:
+        try:
+            stat = self.path.stat()
+            with open(self.index_path, 'rb') as fh:
+                magic, size, mtime_ns, n_tokens, n_postings = self.HEADER.unpack(fh.read(self.HEADER.size))
+                if (magic, size, mtime_ns) != (self.MAGIC, stat.st_size, stat.st_mtime_ns):
+                    return False
+                vocabulary_pos = self.HEADER.size + (n_tokens + 1) * 8 + n_postings * 4
+                if os.fstat(fh.fileno()).st_size < vocabulary_pos:
+                    return False  # truncated: too short for the offsets and postings
+                self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, struct.error):
+            return False
+        view = memoryview(self._mmap)
+        pos = self.HEADER.size
+        self.offsets = view[pos:pos + (n_tokens + 1) * 8].cast('Q')
+        self.postings = view[pos + (n_tokens + 1) * 8:vocabulary_pos].cast('I')
+        # a vocabulary truncated mid-character decodes with a replacement, and fails the token count below
+        self._set_vocabulary(bytes(view[vocabulary_pos:]).decode('utf8', errors='replace'))
+        if len(self.tokens) != n_tokens:
+            self.close()
+            return False  # truncated
+        return True
+
+    def _build(self):
+        logger.info(f'Building search index for {self.path}')
+        stat = self.path.stat()
+        index = {}
+        for rowid in range(len(self.corpus)):
+            for token in set(TOKEN_RE.findall(record_text(self.corpus.read(rowid)).casefold())):
+                if (rows := index.get(token)) is None:
+                    rows = index[token] = array('I')
+                rows.append(rowid)
+        tokens = sorted(index)
+        self.offsets = array('Q', [0])
+        self.postings = array('I')
+        for token in tokens:
+            self.postings.extend(index[token])
+            self.offsets.append(len(self.postings))
+        vocabulary = '\n'.join(tokens)
+        self._set_vocabulary(vocabulary)
+        tmp_path = self.index_path.with_name(f'{self.index_path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as out:
+                out.write(self.HEADER.pack(self.MAGIC, stat.st_size, stat.st_mtime_ns, len(tokens), len(self.postings)))
+                self.offsets.tofile(out)
+                self.postings.tofile(out)
+                out.write(vocabulary.encode('utf8'))
+            os.replace(tmp_path, self.index_path)
+        except OSError as exc:
+            logger.warning(f'Unable to write search index {self.index_path}: {exc}')
+            tmp_path.unlink(missing_ok=True)
+
+    def _set_vocabulary(self, vocabulary: str):
+        # a single string, so substring lookups run in C rather than looping over tokens
+        self.vocabulary = f'\n{vocabulary}\n' if vocabulary else '\n'
+        self.tokens = vocabulary.split('\n') if vocabulary else []
+        self._token_starts = array('Q')
+        pos = 1
+        for token in self.tokens:
+            self._token_starts.append(pos)
+            pos += len(token) + 1
+
+    def _rows_with_token(self, i: int):
+        return self.postings[self.offsets[i]:self.offsets[i + 1]]
+
+    def rows_containing(self, substring: str) -> set[int]:
+        """Rowids with a token containing `substring` (casefolded, word characters only)."""
+        rows = set()
+        start = 0
+        while (pos := self.vocabulary.find(substring, start)) >= 0:
+            i = bisect_right(self._token_starts, pos) - 1
+            rows.update(self._rows_with_token(i))
+            # continue from the next token
+            start = self._token_starts[i + 1] if i + 1 < len(self._token_starts) else len(self.vocabulary)
+        return rows
+
+    def candidates(self, regex: str) -> list[int] | None:
+        """Sorted rowids that may match `regex`, or None if the index can't narrow the search."""
+        literals = required_literals(regex)
+        if not literals:
+            return None
+        rows = set()
+        for literal in literals:
+            pieces = TOKEN_RE.findall(literal)
+            if not pieces:
+                return None  # e.g., only punctuation
+            # every piece of the literal occurs within some token of the row
+            literal_rows = None
+            for piece in sorted(pieces, key=len, reverse=True):
+                piece_rows = self.rows_containing(piece)
+                literal_rows = piece_rows if literal_rows is None else literal_rows & piece_rows
+                if not literal_rows:
+                    break
+            rows |= literal_rows
+        return sorted(rows)
+
+    def search(self, regex: str, start=0, limit=100) -> list[tuple[int, str]]:
+        """Return up to `limit` (rowid, matched text) for rows matching `regex`, in row order from `start`, wrapping.
+
+        Raises:
+            re.error: if `regex` is invalid
+        """
+        pattern = re.compile(regex, re.I | re.MULTILINE)
+        rowids = self.candidates(regex)
+        if rowids is None:
+            rowids = range(len(self.corpus))
+        split = bisect_right(rowids, start - 1)
+        results = []
+        for rowid in chain(islice(rowids, split, None), islice(rowids, split)):
+            if m := pattern.search(record_text(self.corpus.read(rowid))):
+                results.append((rowid, m.group()))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def close(self):
+        if self._mmap is not None:
+            self.offsets.release()
+            self.postings.release()
+            self._mmap.close()
+            self._mmap = None
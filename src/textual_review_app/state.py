@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from loguru import logger
+
+
+class SessionState:
+    """Volatile session state (current record, font scale, etc.) kept in a small JSON file.
+
+    Unlike `Config`, which rewrites the whole toml file, changes here are coalesced: `set` updates
+    memory and schedules a single write `delay` seconds later. Writes go to a temporary file which
+    is then renamed over the state file, so a crash never leaves a partially-written file.
+    """
+
+    def __init__(self, path: Path, delay=1.0):
+        self.path = Path(path)
+        self.delay = delay
+        self.data = self._load()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._dirty = False
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding='utf8') as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            logger.warning(f'Ignoring unreadable session state {self.path}: {exc}')
+            return {}
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self.data and self.data[key] == value:
+                return
+            self.data[key] = value
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write pending changes now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+            try:
+                with open(tmp_path, 'w', encoding='utf8') as out:
+                    json.dump(self.data, out)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as exc:
+                logger.error(f'Unable to save session state to {self.path}: {exc}')
+                tmp_path.unlink(missing_ok=True)
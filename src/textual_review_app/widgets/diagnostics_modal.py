@@ -0,0 +1,61 @@
+from rich.style import Style
+from rich.text import Text
+from textual.app import ComposeResult
+from textual.containers import Horizontal
+from textual.screen import ModalScreen
+from textual.widgets import Button, DataTable, Label
+
+from textual_review_app.profiling import ENV_VAR, PROFILER
+
+
+class DiagnosticsModal(ModalScreen):
+    """Latency of each profiled stage (see `profiling`), and the state of the corpus cache and annotation store."""
+    BINDINGS = [('escape', 'dismiss', 'Close')]
+
+    def __init__(self, cache_info=None, pending: int = 0):
+        """
+
+        Args:
+            cache_info: `Corpus.cache_info()`
+            pending: annotations saved but not yet written to the database
+        """
+        super().__init__()
+        self.cache_info = cache_info
+        self.pending = pending
+
+    def compose(self) -> ComposeResult:
+        yield Label(Text('Diagnostics', style=Style(bold=True, underline=True)))
+        if self.cache_info is not None:
+            lookups = self.cache_info.hits + self.cache_info.misses
+            hit_rate = self.cache_info.hits / lookups * 100 if lookups else 0
+            yield Label(f'Corpus cache: {self.cache_info.hits} hits, {self.cache_info.misses} misses ({hit_rate:.0f}%),'
+                        f' {self.cache_info.prefetched} prefetched, {self.cache_info.currsize}/{self.cache_info.maxsize} records')
+        yield Label(f'Annotations pending write: {self.pending}')
+        if not PROFILER.enabled:
+            yield Label(f'Profiling is off: start with --profile, or set {ENV_VAR}=1.')
+        yield DataTable(id='profile-table', zebra_stripes=True)
+        with Horizontal():
+            yield Button('Refresh', id='refresh', variant='primary')
+            yield Button('Close', id='close', variant='error')
+
+    def on_mount(self):
+        table = self.query_one('#profile-table', DataTable)
+        table.add_columns('Stage', 'Calls', 'Mean (ms)', 'p50', 'p95', 'p99', 'Max')
+        self.refresh_table()
+
+    def refresh_table(self):
+        table = self.query_one('#profile-table', DataTable)
+        table.clear()
+        for stage, stats in PROFILER.summary().items():
+            table.add_row(stage, str(stats['count']), *(
+                f'{stats[key]:.1f}' for key in ('mean', 'p50', 'p95', 'p99', 'max')
+            ))
+
+    def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == 'refresh':
+            self.refresh_table()
+        elif event.button.id == 'close':
+            self.dismiss()
+
+    def action_dismiss(self):
+        self.dismiss()
@@ -1,12 +1,18 @@
-import re
 import sys
+from bisect import bisect_right
+from collections import defaultdict
+from functools import partial
+from itertools import accumulate
 
 from rich._palettes import EIGHT_BIT_PALETTE, STANDARD_PALETTE, WINDOWS_PALETTE
 from rich.color import ANSI_COLOR_NAMES
 from rich.style import Style
+from textual.geometry import Offset
 from textual.widgets import Static, TextArea
 
 from textual_review_app.color import COLOR_TO_TEXT_COLOR, COLOR_TO_BG_COLOR, COLOR_NAMES
+from textual_review_app.highlight_engine import HighlightEngine
+from textual_review_app.profiling import timed
 
 IS_WINDOWS = sys.platform == 'win32'
 
@@ -19,10 +25,13 @@ def style_from_color(color, bold=True):
 
 class HighlightTextArea(TextArea):
     """Adapted from https://github.com/Textualize/textual/discussions/5336"""
+    CHUNK_SIZE = 4096  # characters highlighted at a time in windowed mode
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.lines = self.text.splitlines(keepends=True)
+        self._index_lines()
+        self._spans_between = None
+        self._highlighted_chunks = set()
         rich_colors = sorted((v, k) for k, v in ANSI_COLOR_NAMES.items() if k in COLOR_NAMES)
 
         for color_number, name in rich_colors:
@@ -37,43 +46,128 @@ class HighlightTextArea(TextArea):
             self._theme.syntax_styles[name] = style_from_color(name)
         self._theme.syntax_styles['target'] = Style(bgcolor='red', bold=True, underline=True, reverse=True)
 
+    def _index_lines(self):
+        self.lines = self.text.splitlines(keepends=True)
+        # line_starts[row] is the offset of the first character of `row`; the last item is len(text)
+        self.line_starts = list(accumulate(map(len, self.lines), initial=0))
+
+    def set_text(self, text: str) -> None:
+        """Replace the text in place (clearing all highlights) rather than creating a new widget."""
+        self.load_text(text)
+        self._index_lines()
+        self.set_lazy_spans(None)
+
+    def set_lazy_spans(self, spans_between) -> None:
+        """Windowed mode: only highlight the text on screen (plus a screen above and below) as it is scrolled to.
+
+        Args:
+            spans_between: function (start, end) returning the (start, end, color) spans which start in
+                `text[start:end]`; these are drawn beneath any other highlights. None to disable.
+        """
+        self._spans_between = spans_between
+        self._highlighted_chunks = set()
+
+    def _y_to_offset(self, y: int) -> int:
+        """Index in text of the start of (wrapped) line `y`."""
+        if y >= self.wrapped_document.height:
+            return len(self.text)
+        row, column = self.wrapped_document.offset_to_location(Offset(0, y))
+        return self.line_starts[min(row, len(self.line_starts) - 1)] + column
+
+    def _highlight_visible(self) -> None:
+        _, scroll_y = self.scroll_offset
+        margin = self.size.height
+        start = self._y_to_offset(max(scroll_y - margin, 0))
+        end = self._y_to_offset(scroll_y + self.size.height + margin)
+        added = False
+        for chunk in range(start // self.CHUNK_SIZE, end // self.CHUNK_SIZE + 1):
+            chunk_start = chunk * self.CHUNK_SIZE
+            if chunk in self._highlighted_chunks or chunk_start >= len(self.text):
+                continue
+            self._highlighted_chunks.add(chunk)
+            spans = self._spans_between(chunk_start, min(chunk_start + self.CHUNK_SIZE, len(self.text)))
+            # draw beneath marks/target, which were added first
+            highlights = self._highlights
+            self._highlights = defaultdict(list)
+            try:
+                self.stylize_many(spans)
+                new_highlights = self._highlights
+            finally:
+                self._highlights = highlights
+            for row, row_highlights in new_highlights.items():
+                highlights[row][:0] = row_highlights
+            added = True
+        if added:
+            self._line_cache.clear()
+
+    def render_lines(self, crop):
+        if self._spans_between is not None:
+            self._highlight_visible()
+        return super().render_lines(crop)
+
+    def refresh_highlights(self) -> None:
+        """Redraw after highlights were added to a mounted text area."""
+        self._line_cache.clear()
+        self.refresh()
+
     def stylize_by_row(self, color: str, row: int, start_column: int, end_column: int) -> None:
         self._highlights[row].append((start_column, end_column, color))
 
+    def offset_to_location(self, offset: int) -> tuple[int, int]:
+        """Convert an index in text to (row, column)."""
+        row = min(max(bisect_right(self.line_starts, offset) - 1, 0), max(len(self.lines) - 1, 0))
+        return row, offset - self.line_starts[row]
+
+    def _stylize_from_row(self, color: str, row: int, start: int, end: int) -> None:
+        """Stylize `start` to `end` (indices in text), where `start` is on `row`; spans may cross rows."""
+        last_row = len(self.lines) - 1
+        while row < last_row and end > self.line_starts[row + 1]:  # across two lines
+            line_end = self.line_starts[row + 1]
+            self.stylize_by_row(color, row, start - self.line_starts[row], line_end - self.line_starts[row])
+            start = line_end
+            row += 1
+        if row <= last_row:
+            self.stylize_by_row(color, row, start - self.line_starts[row], end - self.line_starts[row])
+
     def stylize(self, color: str, start: int, end: int) -> None:
         """Stylize by index in text"""
-        line_start = 0
-        for row, line in enumerate(self.lines):
-            line_end = line_start + len(line)
-            if start > line_end:
-                pass  # need to increment
-            elif end > line_end:  # across two lines
-                self.stylize_by_row(color, row, start - line_start, line_end)
-                start = line_end  # set for next line
-            else:
-                self.stylize_by_row(color, row, start - line_start, end - line_start)
-                break
-            line_start = line_end
+        self._stylize_from_row(color, self.offset_to_location(start)[0], start, end)
+
+    def stylize_many(self, spans) -> None:
+        """Stylize (start, end, color) spans, sorted by start, in a single pass over the rows.
+
+        Spans may also be several sorted runs one after another (e.g., one per pattern, keeping their
+        drawing order); each time `start` goes backwards, the row is found again by bisection.
+        """
+        row = 0
+        last_row = len(self.lines) - 1
+        for start, end, color in spans:
+            if start < self.line_starts[row]:
+                row = self.offset_to_location(start)[0]
+            while row < last_row and self.line_starts[row + 1] <= start:
+                row += 1
+            self._stylize_from_row(color, row, start, end)
 
     def get_char_offset(self, row: int, row_index: int):
-        curr_chars = 0
         if row >= len(self.lines):
             raise ValueError(f'Requested row is too large!')
-        for _row, line in enumerate(self.lines):
-            if _row == row:
-                return curr_chars + row_index
-            curr_chars += len(line)
-
+        return self.line_starts[row] + row_index
 
 
 class HighlighterWidget(Static):
+    WINDOWED_THRESHOLD = 50_000  # characters; longer texts are only highlighted as they are scrolled into view
+
     def __init__(self, precontext, match, postcontext, patterns: list[dict], marks: list[dict], mark_colors: dict,
-                 **kwargs):
+                 engine: HighlightEngine = None, **kwargs):
         super().__init__(**kwargs)
         self.precontext = precontext
         self.match = match
         self.postcontext = postcontext
         self.patterns = patterns
+        if engine is None:
+            engine = HighlightEngine()
+            engine.set_patterns(patterns)
+        self.engine = engine
         self.marks = marks
         self.mark_colors = mark_colors
         self.text = f'{self.precontext}{self.match}{self.postcontext}'
@@ -91,12 +185,13 @@ class HighlighterWidget(Static):
     def selection(self):
         return self.textbox.get_text_range(self.textbox.selection.start, self.textbox.selection.end)
 
-    def compose(self):
-        self.textbox = HighlightTextArea(self.text, read_only=True)
-        for pat in self.patterns:
-            for row, line in enumerate(self.textbox.lines):
-                for m in re.finditer(pat['regex'], line, re.I):
-                    self.textbox.stylize_by_row(pat['color'], row, m.start(), m.end())
+    def _apply_highlights(self):
+        if len(self.text) > self.WINDOWED_THRESHOLD:
+            self.textbox.set_lazy_spans(partial(self.engine.spans_between, self.text))
+        else:
+            self.textbox.set_lazy_spans(None)
+            self.textbox.stylize_many(self.engine.spans(self.text))
+        spans = []
         for mark in self.marks:
             # indices are based on the 'match' section
             start = mark['start'] + len(self.precontext)
@@ -107,10 +202,28 @@ class HighlighterWidget(Static):
             elif start < 0:
                 # is in precontext and precontext not shown
                 continue
-
-            self.textbox.stylize(
-                self.mark_colors.get(mark['kind'], 'skyblue'),
-                start,
-                end)
+            spans.append((start, end, self.mark_colors.get(mark['kind'], 'skyblue')))
+        self.textbox.stylize_many(sorted(spans))
         self.textbox.stylize('target', len(self.precontext), len(self.precontext) + len(self.match))
+
+    @timed('highlighter.set_entry')
+    def set_entry(self, precontext, match, postcontext, marks: list[dict]):
+        """Show a new record (or context window) in the existing text area."""
+        self.precontext = precontext
+        self.match = match
+        self.postcontext = postcontext
+        self.marks = marks
+        text = f'{self.precontext}{self.match}{self.postcontext}'
+        if text != self.text:
+            self.text = text
+            self.textbox.set_text(text)
+        else:
+            self.textbox._highlights.clear()
+        self._apply_highlights()
+        self.textbox.refresh_highlights()
+
+    @timed('highlighter.compose')
+    def compose(self):
+        self.textbox = HighlightTextArea(self.text, read_only=True)
+        self._apply_highlights()
         yield self.textbox
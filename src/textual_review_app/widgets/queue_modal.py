@@ -0,0 +1,45 @@
+from textual import on
+from textual.app import ComposeResult
+from textual.containers import Horizontal
+from textual.screen import ModalScreen
+from textual.widgets import Button, Label, OptionList
+from textual.widgets.option_list import Option
+
+
+class QueueModal(ModalScreen[str | None]):
+    """Pick a review queue; dismisses with the queue's key, or None."""
+    BINDINGS = [('escape', 'dismiss', 'Close')]
+
+    def __init__(self, queues: list[tuple[str, str]], current: str | None = None):
+        """
+
+        Args:
+            queues: (key, label) of each available queue
+            current: key of the active queue
+        """
+        super().__init__()
+        self.queues = queues
+        self.current = current
+
+    def compose(self) -> ComposeResult:
+        yield Label('Review Queue (Ctrl+Down/Ctrl+Up: save and go to the next/previous record in the queue)')
+        yield OptionList(
+            *[Option(f'{"* " if key == self.current else ""}{label}', id=key) for key, label in self.queues],
+            id='queues',
+        )
+        with Horizontal():
+            yield Button('Clear Queue', id='clear', variant='warning')
+            yield Button('Cancel', id='cancel', variant='error')
+
+    @on(OptionList.OptionSelected, '#queues')
+    def on_queue_selected(self, event: OptionList.OptionSelected):
+        self.dismiss(event.option.id)
+
+    def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == 'clear':
+            self.dismiss('')
+        elif event.button.id == 'cancel':
+            self.dismiss(None)
+
+    def action_dismiss(self):
+        self.dismiss(None)
@@ -1,30 +1,95 @@
+from textual import on, work
 from textual.app import ComposeResult
 from textual.containers import Vertical, Horizontal
 from textual.screen import ModalScreen
-from textual.widgets import Button, Input, Label
+from textual.widgets import Button, Input, Label, OptionList
+from textual.widgets.option_list import Option
 
 
-class SearchModal(ModalScreen[str | None]):
+class SearchModal(ModalScreen[str | tuple[str, int] | None]):
+    """Highlight a regex in the current record, or find the records in the corpus that match it.
+
+    Dismisses with the pattern (highlight only), (pattern, rowid) when a result is chosen, or None.
+    """
     BINDINGS = [('escape', 'dismiss', 'Close')]
 
-    def __init__(self):
+    def __init__(self, search=None, pattern: str = '', start: int = 0):
+        """
+
+        Args:
+            search: function (pattern, start) returning [(rowid, matched text)]; if None, only highlighting is offered
+            pattern: initial pattern (e.g., the previous search)
+            start: row from which results are listed
+        """
         super().__init__()
-        self._pattern = ''
+        self._pattern = pattern
+        self._search = search
+        self._start = start
 
     def compose(self) -> ComposeResult:
-        yield Label('Search (Ctrl+F) — highlights matches temporarily until next change')
+        yield Label('Search (Ctrl+F) — highlight matches temporarily, or find matching records')
         with Vertical():
-            self.input = Input(placeholder='Enter regex...', id='search-pattern')
+            self.input = Input(value=self._pattern, placeholder='Enter regex...', id='search-pattern')
             yield self.input
+            if self._search is not None:
+                yield Label('', id='search-status')
+                yield OptionList(id='search-results')
         with Horizontal():
             yield Button('Search', id='ok', variant='success')
+            if self._search is not None:
+                yield Button('Find in Corpus', id='find', variant='primary')
             yield Button('Cancel', id='cancel', variant='error')
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == 'ok':
             self.dismiss(self.input.value)
+        elif event.button.id == 'find':
+            self.find(self.input.value)
         elif event.button.id == 'cancel':
             self.dismiss(None)
 
+    @on(Input.Submitted, '#search-pattern')
+    def on_pattern_submitted(self):
+        if self._search is not None:
+            self.find(self.input.value)
+        else:
+            self.dismiss(self.input.value)
+
+    def find(self, pattern: str):
+        if not pattern:
+            return
+        self._pattern = pattern
+        self.query_one('#search-status', Label).update('Searching...')
+        self.query_one('#search-results', OptionList).clear_options()
+        self._run_search(pattern)
+
+    @work(thread=True, exclusive=True)
+    def _run_search(self, pattern: str):
+        # the index may need to be built on first use; keep the UI responsive
+        try:
+            results = self._search(pattern, self._start)
+        except Exception as exc:
+            self.app.call_from_thread(self._show_error, f'Invalid search: {exc}')
+            return
+        self.app.call_from_thread(self._show_results, pattern, results)
+
+    def _show_error(self, message: str):
+        self.query_one('#search-status', Label).update(message)
+
+    def _show_results(self, pattern: str, results: list[tuple[int, str]]):
+        if pattern != self._pattern:
+            return  # superseded
+        self.query_one('#search-status', Label).update(
+            f'{len(results)} matching records' if results else 'No matching records.'
+        )
+        self.query_one('#search-results', OptionList).add_options([
+            # 1-based label for humans
+            Option(f'#{rowid + 1}: {match[:60]!r}', id=str(rowid)) for rowid, match in results
+        ])
+
+    @on(OptionList.OptionSelected, '#search-results')
+    def on_result_selected(self, event: OptionList.OptionSelected):
+        self.dismiss((self._pattern, int(event.option.id)))
+
     def action_dismiss(self):
         self.dismiss(None)
@@ -6,9 +6,9 @@ from textual.widget import Widget
 from textual.widgets import Button, Static, TextArea, Label
 
 from textual_review_app.config import Config
+from textual_review_app.highlight_engine import HighlightEngine
+from textual_review_app.profiling import timed
 from textual_review_app.widgets.highlighter_widget import HighlighterWidget
-from textual_review_app.widgets.mark_modal import MarkModal
-from textual_review_app.widgets.canned_response_modal import CannedResponseModal
 
 
 class SnippetWidget(Widget):
@@ -31,6 +31,7 @@ class SnippetWidget(Widget):
         self.instructions = []
         self.marks = []
         self._temp_patterns = []
+        self.highlight_engine = HighlightEngine()
 
     def compose(self):
         with Horizontal():
@@ -47,6 +48,7 @@ class SnippetWidget(Widget):
             )
             yield self.scroll
 
+    @timed('snippet.update_entry')
     async def update_entry(self, entry=None, comment=None, marks=None):
         if entry is not None:
             self.show_full_text_pre = False
@@ -55,19 +57,34 @@ class SnippetWidget(Widget):
 
         if marks is not None:
             self.marks = marks
-        await self.scroll.query_one('#textfield').remove()
         patterns = list(self.config.highlights) + list(self._temp_patterns)
-        await self.scroll.mount(
-            HighlighterWidget(
+        self.highlight_engine.set_patterns(
+            patterns,
+            key=(self.config.highlights_version, tuple((p['regex'], p['color']) for p in self._temp_patterns)),
+        )
+        textfield = self.scroll.query_one('#textfield')
+        if self.entry is not None and isinstance(textfield, HighlighterWidget):
+            # reuse the mounted text area rather than rebuilding the widget tree
+            textfield.set_entry(
                 self.entry[self.PRETEXT if self.show_full_text_pre else self.PRE],
                 self.entry[self.MATCH],
                 self.entry[self.POSTTEXT if self.show_full_text_post else self.POST],
-                patterns,
                 self.marks,
-                self.config.mark_colors,
-                id='textfield',
-            ) if self.entry is not None else Static(Text('Press next to continue.'), id='textfield'),
-        )
+            )
+        else:
+            await textfield.remove()
+            await self.scroll.mount(
+                HighlighterWidget(
+                    self.entry[self.PRETEXT if self.show_full_text_pre else self.PRE],
+                    self.entry[self.MATCH],
+                    self.entry[self.POSTTEXT if self.show_full_text_post else self.POST],
+                    patterns,
+                    self.marks,
+                    self.config.mark_colors,
+                    engine=self.highlight_engine,
+                    id='textfield',
+                ) if self.entry is not None else Static(Text('Press next to continue.'), id='textfield'),
+            )
         if comment is not None:
             self.comment = comment
             self.comment_area.text = comment
@@ -153,6 +170,7 @@ class SnippetWidget(Widget):
             event.stop()
             return
         if event.key == 'ctrl+l':
+            from textual_review_app.widgets.canned_response_modal import CannedResponseModal
             await self.app.push_screen(
                 CannedResponseModal(self.config.canned_responses),
                 self._handle_canned_response
@@ -161,6 +179,7 @@ class SnippetWidget(Widget):
             return
 
         if event.key == 'enter':  # enter
+            from textual_review_app.widgets.mark_modal import MarkModal
             widget = self.scroll.query_one('#textfield')
             await self.app.push_screen(
                 MarkModal(widget.selection_start, widget.selection_end, widget.selection),
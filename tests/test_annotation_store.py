@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from textual_review_app.annotation_store import Annotation, AnnotationStore
+
+
+def _db_rows(db_path: Path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {rowid for rowid, in conn.execute('SELECT rowid FROM annotations')}
+    finally:
+        conn.close()
+
+
+def _annotation(rowid, comment):
+    annot = Annotation(rowid)
+    annot.comment = comment
+    return annot
+
+
+def test_write_behind_pending_saves_are_visible(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    store = AnnotationStore(db_path, write_behind=True, flush_interval_ms=60_000, flush_max_records=100)
+    store.save(3, _annotation(3, 'pending'))
+    assert store.pending == 1
+    assert store.exists(3)
+    assert store.get(3).comment == 'pending'
+    assert _db_rows(db_path) == set()
+
+    store.flush()
+    assert store.pending == 0
+    assert _db_rows(db_path) == {3}
+    store.close()
+
+
+def test_write_behind_saves_during_flush(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    store = AnnotationStore(db_path, write_behind=True, flush_interval_ms=60_000, flush_max_records=100)
+    store.save(0, _annotation(0, 'in flight'))
+    writing, release = threading.Event(), threading.Event()
+    write = store._write
+
+    def slow_write(records, conn=None):
+        writing.set()
+        release.wait(5)
+        write(records, conn)
+
+    store._write = slow_write
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert writing.wait(5)
+    # the commit is still running: saves and reads don't wait for it
+    start = time.monotonic()
+    store.save(1, _annotation(1, 'next'))
+    assert store.get(0).comment == 'in flight'
+    assert store.get(1).comment == 'next'
+    assert store.pending == 2
+    assert time.monotonic() - start < 1
+    release.set()
+    flusher.join(5)
+    assert _db_rows(db_path) == {0}
+    assert store.pending == 1
+    store._write = write
+    store.close()
+    assert _db_rows(db_path) == {0, 1}
+
+
+def test_write_behind_flushes_after_max_records(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    store = AnnotationStore(db_path, write_behind=True, flush_interval_ms=60_000, flush_max_records=5)
+    for i in range(5):
+        store.save(i, _annotation(i, f'comment {i}'))
+    deadline = time.monotonic() + 5
+    while store.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _db_rows(db_path) == set(range(5))
+    store.close()
+
+
+def test_write_behind_flushes_on_export_and_close(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    store = AnnotationStore(db_path, write_behind=True, flush_interval_ms=60_000, flush_max_records=100)
+    store.save(0, _annotation(0, 'first'))
+    store.export()
+    assert _db_rows(db_path) == {0}
+    assert len(list(tmp_path.glob('export_*.db.jsonl'))) == 1
+
+    store.save(1, _annotation(1, 'second'))
+    store.save(1, _annotation(1, 'second, edited'))
+    store.close()
+    reopened = AnnotationStore(db_path)
+    assert reopened.get(1).comment == 'second, edited'
+    reopened.close()
+
+
+def test_bitmap_next_missing_and_iteration():
+    from textual_review_app.annotation_store import Bitmap
+    values = set(range(0, 20)) | {21, 40, 41, 100}
+    bitmap = Bitmap(values)
+    assert len(bitmap) == len(values)
+    assert list(bitmap) == sorted(values)
+    assert bitmap.next_missing() == 20
+    assert Bitmap().next_missing(-2) == 0
+    assert bitmap.next_missing(20) == 22
+    assert bitmap.next_missing(39) == 42
+    assert bitmap.next_missing(100) == 101
+    bitmap.discard(5)
+    bitmap.discard(5)
+    assert 5 not in bitmap and len(bitmap) == len(values) - 1
+    assert bitmap.next_missing() == 5
+
+
+def test_bitmap_previous_across_chunks():
+    from textual_review_app.annotation_store import Bitmap
+    values = {3, 70, 5_000, 100_000}
+    bitmap = Bitmap(values)
+    end = 100_001
+    for before in [0, 3, 4, 71, 4_999, 5_001, 99_999, end, 10 * end]:
+        assert bitmap.previous_set(before) == max((v for v in values if v < before), default=None)
+    full = Bitmap(range(end))
+    for missing in [70, 5_000]:
+        full.discard(missing)
+        assert full.previous_missing(end) == missing
+        assert full.previous_missing(missing) == (70 if missing == 5_000 else None)
+    assert full.previous_missing(10 * end) == 10 * end - 1
+
+
+def test_reviewed_and_flagged_status(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    store = AnnotationStore(db_path)
+    for i in [0, 1, 2, 5]:
+        annot = _annotation(i, '')
+        annot.flagged = i in (1, 5)
+        store.save(i, annot)
+    assert store.count_reviewed() == 4
+    assert store.exists(5) and not store.exists(3)
+    assert store.next_unreviewed() == 3
+    assert store.next_unreviewed(3) == 4
+    assert store.next_unreviewed(5, total=6) is None
+    assert list(store.iter_flagged()) == [1, 5]
+
+    unflagged = store.get(1)
+    unflagged.flagged = False
+    store.save(1, unflagged)
+    assert list(store.iter_flagged()) == [5]
+    store.close()
+
+    # loaded from the database on startup
+    store = AnnotationStore(db_path)
+    assert store.count_reviewed() == 4
+    assert list(store.iter_flagged()) == [5]
+    assert store.next_unreviewed() == 3
+    store.close()
+
+
+def test_migrates_version_1_database(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA user_version=1;')
+    conn.execute('CREATE TABLE annotations (rowid INTEGER PRIMARY KEY, annotation TEXT NOT NULL,'
+                 ' last_update_utc TIMESTAMP NOT NULL)')
+    conn.executemany('INSERT INTO annotations VALUES (?, ?, ?)', [
+        (0, '{"selected": ["Relevant"], "comment": "", "marks": [], "flagged": true}', '2024-01-01'),
+        (1, '{"selected": ["Relevant", "Uncertain"], "comment": "", '
+            '"marks": [{"start": 1, "end": 4, "kind": "negated", "selection": "abc"}], "flagged": false}',
+         '2024-01-02'),
+    ])
+    conn.commit()
+    conn.close()
+
+    store = AnnotationStore(db_path)
+    assert store.conn.execute('PRAGMA user_version;').fetchone()[0] == AnnotationStore.SCHEMA_VERSION
+    assert store.flagged_ids() == [0]
+    assert list(store.iter_flagged()) == [0]
+    assert store.ids_with_option('Relevant') == [0, 1]
+    assert store.ids_with_mark('negated') == [1]
+    assert store.option_counts() == {'Relevant': 2, 'Uncertain': 1}
+    assert store.get(1).marks[0]['selection'] == 'abc'
+    store.close()
+
+
+def test_concurrent_sessions_migrate_once(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    barrier = threading.Barrier(8)
+    stores, errors = [], []
+
+    def open_store():
+        barrier.wait()
+        try:
+            stores.append(AnnotationStore(db_path))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=open_store) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    for store in stores:
+        assert store.conn.execute('PRAGMA user_version;').fetchone()[0] == AnnotationStore.SCHEMA_VERSION
+        store.close()
+
+
+def test_saves_update_normalized_tables(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.db', write_behind=True, flush_interval_ms=60_000)
+    annot = _annotation(4, '')
+    annot.selected = ['Relevant']
+    annot.add_mark(0, 3, 'abc', 'mark')
+    store.save(4, annot)
+    assert store.ids_with_option('Relevant') == [4]  # pending writes are flushed first
+
+    annot.selected = ['Not Relevant']
+    annot.marks = []
+    annot.flagged = True
+    store.save(4, annot)
+    assert store.ids_with_option('Relevant') == []
+    assert store.ids_with_option('Not Relevant') == [4]
+    assert store.ids_with_mark('mark') == []
+    assert store.flagged_ids() == [4]
+    plan = ' '.join(row[-1] for row in store.conn.execute(
+        'EXPLAIN QUERY PLAN SELECT rowid FROM annotations ORDER BY last_update_utc DESC'))
+    assert 'idx_annotations_last_update' in plan
+    store.close()
+
+
+def test_save_many_and_restore(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    for write_behind in (False, True):
+        store = AnnotationStore(db_path, write_behind=write_behind, flush_interval_ms=60_000, flush_max_records=100)
+        store.save(0, _annotation(0, 'before'))
+        store.save(1, _annotation(1, 'pending'))
+        flagged = _annotation(2, 'bulk')
+        flagged.flagged = True
+        previous = store.save_many({rowid: Annotation(rowid, flagged.to_json_str()) for rowid in (0, 2, 5)})
+        assert previous[0].comment == 'before'
+        assert previous[2] is None and previous[5] is None
+        # written in one transaction along with any pending saves
+        assert store.pending == 0
+        assert _db_rows(db_path) == {0, 1, 2, 5}
+        assert store.flagged.next_set() == 0
+        assert store.count_flagged() == 3
+
+        store.restore(previous)
+        assert _db_rows(db_path) == {0, 1}
+        assert store.get(0).comment == 'before'
+        assert store.get(5).comment == ''
+        assert not store.exists(2) and not store.exists(5)
+        assert store.count_flagged() == 0
+        store.close()
+        db_path.unlink()
@@ -4,9 +4,7 @@ from pathlib import Path
 import pytest
 
 
-pytestmark = pytest.mark.asyncio
-
-
+@pytest.mark.asyncio
 async def test_ui_elements_present(app):
     async with app.run_test() as pilot:
         # header buttons and labels
@@ -29,6 +27,7 @@ async def test_ui_elements_present(app):
         assert app.query_one('#next')
 
 
+@pytest.mark.asyncio
 async def test_instructions_modal_and_metadata_modal(app):
     async with app.run_test() as pilot:
         await pilot.click('#ok')
@@ -41,3 +40,109 @@ async def test_instructions_modal_and_metadata_modal(app):
         await pilot.click('#metadata-btn')
         # metadata modal also has an OK, close it
         await pilot.click('#ok')
+
+
+@pytest.mark.asyncio
+async def test_corpus_opened_after_first_frame(app):
+    assert app.corpus is None and app.annotations is None
+    async with app.run_test() as pilot:
+        await pilot.click('#ok')
+        assert len(app.corpus) > 0
+        assert not app.snippet_widget.loading
+        assert app.current_entry == app.corpus[0]
+        assert app.current_annot is not None
+
+
+def test_modals_imported_on_first_use():
+    import os
+    import subprocess
+    import sys
+
+    src = Path(__file__).resolve().parents[1] / 'src'
+    code = 'import sys, textual_review_app.app; print([m for m in sys.modules if m.endswith("_modal")])'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            env={**os.environ, 'PYTHONPATH': str(src)})
+    assert result.stdout.strip() == '[]'
+
+
+@pytest.mark.asyncio
+async def test_apply_to_identical_and_undo(make_workspace):
+    from textual_review_app.app import ReviewApp
+
+    corpus_path = make_workspace.parent / 'corpus.pattern.jsonl'
+    first_line = corpus_path.read_text(encoding='utf8').splitlines()[0]
+    with open(corpus_path, 'a', encoding='utf8') as out:
+        out.write(first_line + '\n')
+    app = ReviewApp(make_workspace)
+    async with app.run_test() as pilot:
+        await pilot.click('#ok')
+        while app.dedup_index is None:
+            await pilot.pause(0.01)
+        duplicate = len(app.corpus) - 1
+        assert list(app.dedup_index.group(0)) == [0, duplicate]
+        assert not app.query_one('#apply-identical').disabled
+
+        await pilot.click('#button-0')
+        await pilot.press('ctrl+g')
+        assert app.annotations.get(duplicate).selected == ['Relevant']
+        assert app.annotations.exists(0) and app.annotations.exists(duplicate)
+
+        await pilot.press('ctrl+b')
+        assert not app.annotations.exists(0) and not app.annotations.exists(duplicate)
+        assert app.current_annot.selected == []
+
+        # records without copies can't be applied
+        await pilot.press('ctrl+right')
+        assert app.query_one('#apply-identical').disabled
+
+
+@pytest.mark.asyncio
+async def test_category_queues_indexed_in_background(app):
+    async with app.run_test() as pilot:
+        await pilot.click('#ok')
+        await pilot.click('#queue-btn')
+        await pilot.pause()
+        options = app.screen.query_one('#queues').options
+        assert not any(option.id.startswith('category:') for option in options)
+        await pilot.click('#cancel')
+
+        await app.workers.wait_for_complete()
+        await pilot.pause()
+        assert app.category_index is not None
+        await pilot.click('#queue-btn')
+        await pilot.pause()
+        options = app.screen.query_one('#queues').options
+        assert [option.id for option in options if option.id.startswith('category:')] == [
+            f'category:{category}' for category in app.category_index.categories
+        ]
+        await pilot.click('#cancel')
+    app.category_index.close()
+
+
+@pytest.mark.asyncio
+async def test_navigation_stays_within_leases(make_workspace):
+    import tomlkit
+
+    from textual_review_app.annotation_store import AnnotationStore
+    from textual_review_app.app import ReviewApp
+
+    doc = tomlkit.parse(make_workspace.read_text(encoding='utf8'))
+    doc['user'] = 'alice'
+    doc['lease_size'] = 2
+    make_workspace.write_text(tomlkit.dumps(doc), encoding='utf8')
+    bob = AnnotationStore(make_workspace.parent / 'annotations.db', user='bob')
+    assert bob.acquire_leases(2, total=10) == [0, 1]
+    app = ReviewApp(make_workspace)
+    async with app.run_test() as pilot:
+        await pilot.click('#ok')
+        while app.queue is None:
+            await pilot.pause(0.01)
+        await pilot.pause()
+        assert app.curr_idx == 2
+        await pilot.press('ctrl+left')
+        assert app.curr_idx == 2  # records 0 and 1 are leased to bob
+        await pilot.press('ctrl+right')
+        assert app.curr_idx == 3
+        await pilot.press('ctrl+left')
+        assert app.curr_idx == 3  # record 2 was reviewed, so it is no longer in the queue
+    bob.close()
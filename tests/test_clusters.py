@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from textual_review_app import clusters
+from textual_review_app.clusters import (ClusterIndex, build_clusters, minhash, open_clusters, shingle_hashes,
+                                         similarity)
+from textual_review_app.corpus import Corpus
+
+EXAMPLE_WKSP = Path(__file__).resolve().parents[1] / 'example' / 'wksp'
+NOTE = ('Patient {name} was seen in clinic on {date} for follow up of chest pain. She reports no shortness of'
+        ' breath, and her medications were reviewed and continued without changes. Return in three months.')
+
+
+def _record(text, category='CHEST_PAIN'):
+    precontext, match, postcontext = text.partition('chest pain')
+    return {'category': category, 'precontext': precontext, 'match': match, 'postcontext': postcontext}
+
+
+@pytest.fixture()
+def corpus_path(tmp_path: Path):
+    """Example corpus with a templated note (differing in names and dates) at rows 5, 20, and the last two."""
+    records = [json.loads(line) for line in (EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_text(encoding='utf8').splitlines()]
+    templated = [_record(NOTE.format(name=name, date=date)) for name, date in [
+        ('Jones', '2021-03-04'), ('Smith', '2022-11-30'), ('Garcia', '2019-01-15'), ('Lee', '2020-07-07'),
+    ]]
+    records[5:5] = templated[:1]
+    records[20:20] = templated[1:2]
+    records += templated[2:]
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    with open(corpus_path, 'w', encoding='utf8') as out:
+        for record in records:
+            out.write(json.dumps(record) + '\n')
+    return corpus_path
+
+
+def test_minhash_estimates_similarity():
+    a = shingle_hashes(_record(NOTE.format(name='Jones', date='2021-03-04')))
+    b = shingle_hashes(_record(NOTE.format(name='Smith', date='2022-11-30')))
+    jaccard = len(a & b) / len(a | b)
+    estimate = similarity(minhash(a), minhash(b))
+    assert jaccard > 0.8
+    assert abs(estimate - jaccard) < 0.15
+    assert similarity(minhash(a, 32), minhash(a, 32)) == 1.0
+    assert similarity(minhash(a), minhash(shingle_hashes(_record('Unrelated text about a broken arm.')))) < 0.2
+    assert minhash(set(), 8) == [clusters.EMPTY] * 8
+    # empty bins are filled, distinctly from the bins they borrow from
+    signature = minhash({3}, 8)
+    assert len(set(signature)) == 8
+
+
+def test_build_clusters(corpus_path, monkeypatch):
+    # several partitions of band keys
+    monkeypatch.setattr(clusters, 'PARTITION_PAIRS', 1000)
+    corpus = Corpus(corpus_path, prefetch=0)
+    index = build_clusters(corpus)
+    n_rows = len(corpus)
+    templated = [5, 20, n_rows - 2, n_rows - 1]
+    assert list(index.cluster(20)) == templated
+    assert index.cluster_size(n_rows - 1) == 4
+    assert 0 < index.n_multi < len(index) and index.n_clustered == index.starts[index.n_multi]
+    assert sorted(index.members) == list(range(n_rows))
+    for rowid in range(n_rows):
+        assert rowid in index.cluster(rowid)
+    # clusters of several records come first, ordered by their first row
+    first_rows = [index.members[index.starts[i]] for i in range(index.n_multi)]
+    assert first_rows == sorted(first_rows)
+    assert all(index.starts[i + 1] - index.starts[i] == 1 for i in range(index.n_multi, len(index)))
+    assert [path.name for path in corpus_path.parent.glob('*.clusters*')] == [f'{corpus_path.name}.clusters.idx']
+    index.close()
+    corpus.close()
+
+
+def test_chains_of_near_duplicates(tmp_path, monkeypatch):
+    # every record shares a band with the others, but is only similar to the records next to it
+    texts = [f'note number {word}' for word in ('one', 'two', 'three', 'four', 'five')]
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    corpus_path.write_text(''.join(json.dumps(_record(text)) + '\n' for text in texts), encoding='utf8')
+    positions = {frozenset(shingle_hashes(_record(text))): i for i, text in enumerate(texts)}
+    monkeypatch.setattr(clusters, 'minhash',
+                        lambda hashes, num_perm: [0] * 4 + [positions[frozenset(hashes)]] * (num_perm - 4))
+    monkeypatch.setattr(clusters, 'similarity', lambda a, b: float(abs(a[-1] - b[-1]) == 1))
+    corpus = Corpus(corpus_path, prefetch=0)
+    index = build_clusters(corpus)
+    assert list(index.cluster(0)) == list(range(len(texts)))
+    index.close()
+    corpus.close()
+
+
+def test_cluster_queue(corpus_path):
+    corpus = Corpus(corpus_path, prefetch=0)
+    build_clusters(corpus).close()
+    index = open_clusters(corpus_path)
+    queue = index.queue()
+    order = []
+    rowid = queue.next(-1)
+    while rowid is not None:
+        order.append(rowid)
+        rowid = queue.next(rowid)
+    assert order == list(index.members[:index.n_clustered])
+    assert len(queue) == len(order)
+    assert order[order.index(5):order.index(5) + 4] == [5, 20, len(corpus) - 2, len(corpus) - 1]
+    rowid = queue.previous(len(corpus))
+    backwards = []
+    while rowid is not None:
+        backwards.append(rowid)
+        rowid = queue.previous(rowid)
+    assert backwards[::-1] == order
+    # from a record outside of the clusters: the next cluster by first row
+    outside = next(rowid for rowid in range(len(corpus)) if index.cluster_size(rowid) == 1 and rowid > order[0])
+    following = [i for i in range(index.n_multi) if index.members[index.starts[i]] > outside]
+    assert queue.next(outside) == (index.members[index.starts[following[0]]] if following else None)
+    index.close()
+    corpus.close()
+
+
+def test_stale_or_missing_clusters(corpus_path):
+    assert open_clusters(corpus_path) is None
+    corpus = Corpus(corpus_path, prefetch=0)
+    build_clusters(corpus).close()
+    corpus.close()
+    with open(corpus_path, 'a', encoding='utf8') as out:
+        out.write(json.dumps(_record('chest pain')) + '\n')
+    assert open_clusters(corpus_path) is None
+    with pytest.raises(ValueError):
+        ClusterIndex(corpus_path)
+
+
+@pytest.mark.asyncio
+async def test_review_by_cluster(make_workspace):
+    from textual_review_app.app import ReviewApp
+
+    corpus_path = make_workspace.parent / 'corpus.pattern.jsonl'
+    corpus = Corpus(corpus_path, prefetch=0)
+    index = build_clusters(corpus)
+    corpus.close()
+    app = ReviewApp(make_workspace)
+    async with app.run_test() as pilot:
+        await pilot.click('#ok')
+        await pilot.click('#queue-btn')
+        await pilot.pause()
+        assert 'Clusters' in str(app.screen.query_one('#queues').get_option('clusters').prompt)
+        await pilot.click('#cancel')
+        app.queue = app.get_queue('clusters')
+        app.queue_key = 'clusters'
+        expected = index.queue().next(app.curr_idx)
+        await pilot.press('ctrl+down')
+        assert app.curr_idx == expected
+        await pilot.press('ctrl+down')
+        assert app.curr_idx == index.queue().next(expected)
+    app.cluster_index.close()
+    index.close()
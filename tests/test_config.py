@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+import tomlkit
+
+from textual_review_app.config import Config
+
+
+def _write_config(tmp_path: Path) -> Path:
+    config_path = tmp_path / 'config.toml'
+    doc = tomlkit.document()
+    doc['title'] = 'Test Review App'
+    doc['offset'] = 2
+    doc['corpus'] = 'corpus.pattern.jsonl'
+    doc['user'] = 'tester'
+    config_path.write_text(tomlkit.dumps(doc), encoding='utf8')
+    return config_path
+
+
+def test_offset_is_saved_to_session_state_not_toml(tmp_path):
+    config_path = _write_config(tmp_path)
+    toml_text = config_path.read_text(encoding='utf8')
+    config = Config(config_path)
+    config.state.delay = 0.05
+    assert config.offset == 2  # falls back to the toml value
+    for i in range(100):
+        config.offset = i
+    assert config_path.read_text(encoding='utf8') == toml_text
+
+    deadline = time.monotonic() + 5
+    while config.state._dirty and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert Config(config_path).offset == 99
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_batch_saves_once(tmp_path, monkeypatch):
+    config_path = _write_config(tmp_path)
+    config = Config(config_path)
+    dumps = []
+    dump = tomlkit.dump
+    monkeypatch.setattr(tomlkit, 'dump', lambda data, fh: dumps.append(1) or dump(data, fh))
+    with config.batch():
+        config.user = 'tapio'
+        config.title = 'New Title'
+        config.font_scale = 1.5
+        with config.batch():
+            config.canned_responses = ['ok']
+    assert len(dumps) == 1
+    reloaded = Config(config_path)
+    assert (reloaded.user, reloaded.title, reloaded.canned_responses) == ('tapio', 'New Title', ['ok'])
+    assert reloaded.font_scale == 1.5
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+import search
+from textual_review_app.corpus import Corpus, OffsetIndex
+
+EXAMPLE_WKSP = Path(__file__).resolve().parents[1] / 'example' / 'wksp'
+
+
+@pytest.fixture()
+def source_corpus(tmp_path: Path) -> Path:
+    for name in ['corpus.jsonl', 'patterns.txt']:
+        (tmp_path / name).write_bytes((EXAMPLE_WKSP / name).read_bytes())
+    return tmp_path / 'corpus.jsonl'
+
+
+def test_pointer_corpus_rebuilds_full_records(source_corpus):
+    expected = [
+        json.loads(line)
+        for line in (EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_text(encoding='utf8').splitlines()
+    ]
+    out_path = search.search(source_corpus.with_name('patterns.txt'), source_corpus, output_format='pointer')
+    assert out_path.stat().st_size < (EXAMPLE_WKSP / 'corpus.pattern.jsonl').stat().st_size / 10
+
+    corpus = Corpus(out_path, source_path=source_corpus)
+    assert len(corpus) == len(expected)
+    for i in [0, 1, len(expected) // 2, len(expected) - 1]:
+        assert corpus[i] == expected[i]
+
+
+def test_pointer_corpus_uses_configured_windows(source_corpus):
+    out_path = search.search(source_corpus.with_name('patterns.txt'), source_corpus, output_format='pointer')
+    corpus = Corpus(out_path, source_path=source_corpus, context_length=20, max_window=40)
+    record = corpus[0]
+    assert len(record['precontext']) <= 20
+    assert len(record['postcontext']) <= 20
+    assert len(record['pretext']) <= 40
+    assert record['pretext'].endswith(record['precontext'])
+
+
+def test_offset_index_is_persisted_and_revalidated(tmp_path):
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    corpus_path.write_bytes((EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_bytes())
+    corpus = Corpus(corpus_path)
+    n_records = len(corpus)
+    last = corpus[n_records - 1]
+    corpus.close()
+    index_path = tmp_path / 'corpus.pattern.jsonl.idx'
+    assert index_path.exists()
+
+    # reopened from the memory-mapped sidecar
+    mtime = index_path.stat().st_mtime_ns
+    corpus = Corpus(corpus_path)
+    assert corpus.idx._mmap is not None
+    assert len(corpus) == n_records
+    assert corpus[n_records - 1] == last
+    assert index_path.stat().st_mtime_ns == mtime
+    corpus.close()
+
+    # appending to the corpus invalidates the sidecar
+    with open(corpus_path, 'a', encoding='utf8') as out:
+        out.write(json.dumps({'match': 'new'}) + '\n')
+    corpus = Corpus(corpus_path)
+    assert len(corpus) == n_records + 1
+    assert corpus[n_records]['match'] == 'new'
+    corpus.close()
+
+
+def test_record_cache_and_prefetch(tmp_path):
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    corpus_path.write_bytes((EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_bytes())
+    expected = [json.loads(line) for line in corpus_path.read_text(encoding='utf8').splitlines()]
+    corpus = Corpus(corpus_path, cache_size=8, prefetch=2)
+    assert corpus[5] == expected[5]
+    assert corpus[5] == expected[5]
+    assert corpus.cache_info()[:2] == (1, 1)
+
+    # returned records are copies; mutating one does not corrupt the cache
+    corpus[5]['match'] = 'changed'
+    assert corpus[5] == expected[5]
+
+    corpus.prefetch(5)
+    corpus._executor.shutdown(wait=True)  # wait for the background loads
+    corpus._executor = None
+    assert corpus.cache_info().prefetched == 4
+    hits = corpus.cache_info().hits
+    for i in [3, 4, 6, 7]:
+        assert corpus[i] == expected[i]
+    assert corpus.cache_info().hits == hits + 4
+
+    # bounded
+    for i in range(20):
+        assert corpus[i] == expected[i]
+    assert corpus.cache_info().currsize == 8
+    assert corpus[-1] == expected[-1]
+    corpus.close()
+
+
+def test_prefetch_with_full_cache(tmp_path):
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    corpus_path.write_bytes((EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_bytes())
+    corpus = Corpus(corpus_path, cache_size=5, prefetch=2)
+    for i in range(20):
+        corpus[i]  # navigate: the cache stays full
+        corpus.prefetch(i)
+        corpus._executor.shutdown(wait=True)  # wait for the background loads
+        corpus._executor = None
+        if i >= 2:
+            assert corpus.cache_info().currsize == 5
+            hits = corpus.cache_info().hits
+            corpus[i + 1]
+            corpus[i]
+            assert corpus.cache_info().hits == hits + 2
+    assert corpus.cache_info().prefetched >= 20
+    corpus.close()
+
+
+def test_shared_offset_index(tmp_path):
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    corpus_path.write_bytes((EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_bytes())
+    expected = [json.loads(line) for line in corpus_path.read_text(encoding='utf8').splitlines()]
+    index = OffsetIndex(corpus_path)
+    corpus = Corpus(corpus_path, index=index)
+    assert corpus.idx is index
+    assert len(corpus) == len(expected)
+    assert corpus[10] == expected[10]
+    corpus.close()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from textual_review_app.corpus import Corpus
+from textual_review_app.dedup import DedupIndex, context_hash
+
+EXAMPLE_WKSP = Path(__file__).resolve().parents[1] / 'example' / 'wksp'
+
+
+def _record(category, precontext, match='died', postcontext=' of a fever.'):
+    return {'category': category, 'precontext': precontext, 'match': match, 'postcontext': postcontext}
+
+
+@pytest.fixture()
+def corpus_path(tmp_path: Path):
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    records = [json.loads(line) for line in (EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_text(encoding='utf8').splitlines()]
+    # copies of the first record (e.g., templated text), differing only in whitespace/case or metadata
+    records.insert(3, dict(records[0], chapter='copy'))
+    records.append(dict(records[0], precontext=' '.join(records[0]['precontext'].upper().split())))
+    with open(corpus_path, 'w', encoding='utf8') as out:
+        for record in records:
+            out.write(json.dumps(record) + '\n')
+    return corpus_path
+
+
+def test_context_hash():
+    assert context_hash(_record('A', 'He  \n')) == context_hash(_record('A', 'he '))
+    assert context_hash(_record('A', 'He')) != context_hash(_record('B', 'He'))
+    assert context_hash(_record('A', 'He')) != context_hash(_record('A', 'He', match='lived'))
+    # field boundaries matter
+    assert context_hash(_record('A', 'He died', match='')) != context_hash(_record('A', 'He', match='died'))
+
+
+def test_dedup_index(corpus_path):
+    corpus = Corpus(corpus_path, prefetch=0)
+    hashes = [context_hash(corpus[i]) for i in range(len(corpus))]
+    index = DedupIndex(corpus)
+    for rowid in range(len(corpus)):
+        expected = [i for i, h in enumerate(hashes) if h == hashes[rowid]]
+        assert list(index.group(rowid)) == expected
+        assert index.group_size(rowid) == len(expected)
+    assert list(index.group(0)) == [0, 3, len(corpus) - 1]
+    assert len(index) == len(set(hashes))
+    index.close()
+
+    # reused until the corpus changes
+    index = DedupIndex(corpus)
+    assert index._mmap is not None
+    assert list(index.group(3)) == [0, 3, len(corpus) - 1]
+    index.close()
+    corpus.close()
+
+    first_line = corpus_path.read_text(encoding='utf8').splitlines()[0]
+    with open(corpus_path, 'a', encoding='utf8') as out:
+        out.write(first_line + '\n')
+    corpus = Corpus(corpus_path, prefetch=0)
+    index = DedupIndex(corpus)
+    assert index._mmap is None
+    assert index.group_size(0) == 4
+    index.close()
+    corpus.close()
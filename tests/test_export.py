@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import csv
+import json
+from pathlib import Path
+
+from textual_review_app.annotation_store import Annotation, AnnotationStore
+from textual_review_app.corpus import Corpus
+
+EXAMPLE_WKSP = Path(__file__).resolve().parents[1] / 'example' / 'wksp'
+
+
+def _save(store, rowid, comment, selected=(), flagged=False):
+    annot = Annotation(rowid)
+    annot.comment = comment
+    annot.selected = list(selected)
+    annot.flagged = flagged
+    store.save(rowid, annot)
+    return annot
+
+
+def _read_jsonl(path: Path):
+    return [json.loads(line) for line in path.read_text(encoding='utf8').splitlines()]
+
+
+def test_jsonl_export_matches_annotations(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.db', user='tester')
+    expected = [_save(store, i, f'comment "{i}"', ['Relevant']) for i in [2, 0, 1]]
+    out_path = store.export(out_path=tmp_path / 'out.jsonl', fmt='jsonl')
+    rows = _read_jsonl(out_path)
+    assert rows == [
+        a.to_json() | {'row': a.rowid, 'user': 'tester'} for a in sorted(expected, key=lambda a: a.rowid)
+    ]
+    store.close()
+
+
+def test_incremental_export_only_includes_changed_rows(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.db')
+    for i in range(5):
+        _save(store, i, 'first pass')
+    first = store.export(out_path=tmp_path / 'first.jsonl', incremental=True)
+    assert [r['row'] for r in _read_jsonl(first)] == list(range(5))
+
+    # nothing changed: no new file
+    assert store.export(out_path=tmp_path / 'none.jsonl', incremental=True) is None
+    assert not (tmp_path / 'none.jsonl').exists()
+
+    _save(store, 3, 'second pass')
+    _save(store, 7, 'second pass')
+    second = store.export(out_path=tmp_path / 'second.jsonl', incremental=True)
+    assert [(r['row'], r['comment']) for r in _read_jsonl(second)] == [(3, 'second pass'), (7, 'second pass')]
+
+    # watermarks are per format
+    csv_path = store.export(out_path=tmp_path / 'all.csv', fmt='csv', incremental=True)
+    with open(csv_path, encoding='utf8', newline='') as fh:
+        rows = list(csv.DictReader(fh))
+    assert [int(r['row']) for r in rows] == [0, 1, 2, 3, 4, 7]
+    store.close()
+
+
+def test_incremental_export_includes_late_commits(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    late = AnnotationStore(db_path, write_behind=True, flush_interval_ms=60_000, flush_max_records=100)
+    store = AnnotationStore(db_path)
+    _save(late, 1, 'saved first, committed last')
+    _save(store, 2, 'saved last, committed first')
+    first = store.export(out_path=tmp_path / 'first.jsonl', incremental=True)
+    assert [r['row'] for r in _read_jsonl(first)] == [2]
+
+    # row 1 is older than the watermark's last_update_utc, but was committed after it
+    late.flush()
+    second = store.export(out_path=tmp_path / 'second.jsonl', incremental=True)
+    assert [r['row'] for r in _read_jsonl(second)] == [1]
+    assert store.export(out_path=tmp_path / 'none.jsonl', incremental=True) is None
+    late.close()
+    store.close()
+
+
+def test_csv_and_joined_exports(tmp_path):
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    corpus_path.write_bytes((EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_bytes())
+    corpus = Corpus(corpus_path, prefetch=0)
+    store = AnnotationStore(tmp_path / 'annotations.db', user='tester')
+    _save(store, 1, 'a, "quoted"\ncomment', ['Relevant', 'Uncertain'], flagged=True)
+
+    csv_path = store.export(out_path=tmp_path / 'out.csv', fmt='csv')
+    with open(csv_path, encoding='utf8', newline='') as fh:
+        [row] = list(csv.DictReader(fh))
+    assert row['row'] == '1'
+    assert row['flagged'] == '1'
+    assert row['selected'] == 'Relevant; Uncertain'
+    assert row['comment'] == 'a, "quoted"\ncomment'
+
+    joined_path = store.export(out_path=tmp_path / 'out.joined.jsonl', fmt='joined', corpus=corpus)
+    [record] = _read_jsonl(joined_path)
+    assert record['match'] == corpus[1]['match']
+    assert record['annotation']['selected'] == ['Relevant', 'Uncertain']
+    store.close()
+    corpus.close()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+
+import pytest
+
+from textual_review_app import fork_server
+from textual_review_app.fork_server import ForkServer, fork_session
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork') or not hasattr(socket, 'send_fds'),
+                                reason='fork server is only available on Linux/macOS')
+
+
+def test_preload_skips_missing_modules(make_workspace, tmp_path, monkeypatch):
+    monkeypatch.setattr(fork_server, 'PRELOAD', fork_server.PRELOAD + ('textual_review_app.widgets.no_such_modal',))
+    server = ForkServer(make_workspace, tmp_path / 'fork.sock')
+    try:
+        server.preload()
+    finally:
+        gc.unfreeze()
+    assert 'textual_review_app.app' in sys.modules
+    assert len(server.index) > 0
+    server.index.close()
+
+
+def test_fork_session(make_workspace, tmp_path):
+    import serve
+    from textual_serve.server import Server
+
+    socket_path = tmp_path / 'fork.sock'
+    process = serve.start_fork_server(Server('unused'), make_workspace, socket_path)
+    stdin_r, stdin_w = os.pipe()
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    pid = None
+    try:
+        pid = fork_session(socket_path, {'COLUMNS': '80', 'ROWS': '24'}, (stdin_r, stdout_w, stderr_w))
+        assert pid > 0
+        for fd in (stdin_r, stdout_w, stderr_w):
+            os.close(fd)
+        # the session's web driver starts writing to its stdout
+        ready, _, _ = select.select([stdout_r], [], [], 30)
+        assert ready and os.read(stdout_r, 1024)
+    finally:
+        if pid is not None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        for fd in (stdin_w, stdout_r, stderr_r):
+            os.close(fd)
+        process.terminate()
+        process.wait()
+
+
+@pytest.mark.asyncio
+async def test_max_sessions_refused():
+    import aiohttp
+    from aiohttp import web
+    import serve
+
+    server = serve.ReviewServer('unused', max_sessions=1)
+    server.sessions = 1  # all in use
+    app = web.Application()
+    app.router.add_get('/ws', server.handle_websocket)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, 'localhost', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f'http://localhost:{port}/ws') as websocket:
+                message = await asyncio.wait_for(websocket.receive(), 5)
+                assert message.type == aiohttp.WSMsgType.CLOSE
+                assert websocket.close_code == 1013
+        assert server.sessions == 1
+    finally:
+        await runner.cleanup()
+
+
+def test_session_environment_matches_textual_serve():
+    # `ForkAppService` sets up sessions itself: catch changes in textual-serve's environment on upgrade
+    import serve
+    from textual_serve.app_service import AppService
+
+    service = AppService('unused', write_bytes=None, write_str=None, close=None, download_manager=None, debug=True)
+    assert serve.session_environment(100, 30, debug=True) == service._build_environment(100, 30)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import re
+
+from textual_review_app.highlight_engine import HighlightEngine
+
+TEXT = 'The heart attack\nwas THE worst.\nAnother heart.\n'
+PATTERNS = [{'regex': 'the', 'color': 'yellow'}, {'regex': r'heart\s*\w*', 'color': 'green'}]
+
+
+def test_spans_match_finditer_over_full_text():
+    engine = HighlightEngine()
+    engine.set_patterns(PATTERNS)
+    expected = [
+        (m.start(), m.end(), pat['color'])
+        for pat in PATTERNS
+        for m in re.finditer(pat['regex'], TEXT, re.I)
+    ]
+    assert engine.spans(TEXT) == expected
+
+
+def test_matches_cross_lines():
+    engine = HighlightEngine()
+    engine.set_patterns([{'regex': r'attack\s+was', 'color': 'red'}])
+    assert [TEXT[s:e] for s, e, _ in engine.spans(TEXT)] == ['attack\nwas']
+
+
+def test_anchors_match_at_line_boundaries():
+    engine = HighlightEngine()
+    engine.set_patterns([{'regex': '^was', 'color': 'red'}, {'regex': 'attack$', 'color': 'red'}])
+    assert [TEXT[s:e] for s, e, _ in engine.spans(TEXT)] == ['was', 'attack']
+
+
+def test_spans_are_cached_until_patterns_change():
+    engine = HighlightEngine(cache_size=2)
+    engine.set_patterns(PATTERNS, key=0)
+    spans = engine.spans(TEXT)
+    assert engine.spans(TEXT) is spans
+
+    compiled = engine.compiled
+    engine.set_patterns(PATTERNS, key=0)
+    assert engine.compiled is compiled
+    assert engine.spans(TEXT) is spans
+
+    engine.set_patterns(PATTERNS[:1], key=1)
+    assert engine.spans(TEXT) is not spans
+    assert {color for *_, color in engine.spans(TEXT)} == {'yellow'}
+
+
+def test_invalid_patterns_are_skipped():
+    engine = HighlightEngine()
+    engine.set_patterns([{'regex': '(unclosed', 'color': 'red'}] + PATTERNS)
+    assert len(engine.compiled) == 2
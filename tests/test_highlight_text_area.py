@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from textual_review_app.widgets.highlighter_widget import HighlightTextArea
+
+
+def _text_area(seed=0):
+    rng = random.Random(seed)
+    text = ''.join(rng.choice('abc \n') for _ in range(500))
+    return HighlightTextArea(text, read_only=True)
+
+
+def test_offset_location_round_trip():
+    area = _text_area()
+    for offset in range(len(area.text)):
+        row, column = area.offset_to_location(offset)
+        assert area.lines[row][column] == area.text[offset]
+        assert area.get_char_offset(row, column) == offset
+
+
+def test_stylize_many_matches_stylize():
+    rng = random.Random(1)
+    area = _text_area()
+    spans = []
+    for _ in range(200):
+        start = rng.randrange(len(area.text))
+        spans.append((start, min(start + rng.randint(1, 30), len(area.text)), rng.choice(['red', 'blue'])))
+    spans.sort()
+    for start, end, color in spans:
+        area.stylize(color, start, end)
+    expected = {row: list(h) for row, h in area._highlights.items() if h}
+    area._highlights.clear()
+    area.stylize_many(spans)
+    assert {row: list(h) for row, h in area._highlights.items() if h} == expected
+
+    # every styled range covers exactly the requested characters
+    covered = {}
+    for row, highlights in expected.items():
+        for start, end, color in highlights:
+            for offset in range(area.line_starts[row] + start, area.line_starts[row] + end):
+                covered.setdefault(color, set()).add(offset)
+    for color in ['red', 'blue']:
+        assert covered.get(color, set()) == {i for s, e, c in spans if c == color for i in range(s, e)}
+
+
+def test_stylize_many_accepts_sorted_runs():
+    area = HighlightTextArea('one two\nthree four\nfive', read_only=True)
+    # one run per pattern: drawing order is kept, so 'green' is applied after 'red'
+    area.stylize_many([(4, 7, 'red'), (8, 13, 'red'), (0, 3, 'green'), (6, 12, 'green')])
+    assert area._highlights[0] == [(4, 7, 'red'), (0, 3, 'green'), (6, 8, 'green')]
+    assert area._highlights[1] == [(0, 5, 'red'), (0, 4, 'green')]
+
+
+@pytest.mark.asyncio
+async def test_windowed_highlighting_is_computed_as_scrolled():
+    from textual.app import App
+
+    from textual_review_app.highlight_engine import HighlightEngine
+    from textual_review_app.widgets.highlighter_widget import HighlighterWidget
+
+    line = 'the quick brown fox jumps over the lazy dog\n'
+    pretext = line * 5000  # ~220k characters
+    engine = HighlightEngine()
+    engine.set_patterns([{'regex': r'\bfox\b', 'color': 'yellow'}])
+
+    class WindowedApp(App):
+        def compose(self):
+            yield HighlighterWidget(pretext, 'MATCH', ' after', [], [], {}, engine=engine, id='textfield')
+
+    app = WindowedApp()
+    async with app.run_test() as pilot:
+        textbox = app.query_one('#textfield').textbox
+        await pilot.pause()
+        n_chunks = len(textbox.text) // textbox.CHUNK_SIZE + 1
+        assert 0 < len(textbox._highlighted_chunks) < n_chunks / 10
+        top_rows = {row for row, hl in textbox._highlights.items() if any(c == 'yellow' for *_, c in hl)}
+        assert 0 in top_rows and len(textbox.lines) - 1 not in top_rows
+        # the target is still drawn on top
+        last_row = len(textbox.lines) - 1
+        assert textbox._highlights[last_row][-1][2] == 'target'
+
+        textbox.scroll_end(animate=False)
+        await pilot.pause()
+        assert last_row - 1 in {row for row, hl in textbox._highlights.items() if any(c == 'yellow' for *_, c in hl)}
+        assert textbox._highlights[last_row][-1][2] == 'target'
+        expected = {(line.index('fox'), line.index('fox') + 3, 'yellow')}
+        assert set(textbox._highlights[last_row - 1]) == expected
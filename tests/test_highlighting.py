@@ -53,3 +53,17 @@ async def test_mark_offsets_are_applied_after_update(app):
         # there should be highlight spans added by marks (in addition to target)
         total_spans = sum(len(r) for r in hl._highlights.values())
         assert total_spans > 0
+
+
+async def test_navigation_reuses_text_area(app):
+    async with app.run_test() as pilot:
+        await pilot.click('#ok')
+        textbox = app.snippet_widget.scroll.query_one('#textfield').textbox
+
+        await pilot.press('ctrl+right')
+        await pilot.pause()
+        textfield = app.snippet_widget.scroll.query_one('#textfield')
+        assert textfield.textbox is textbox
+        assert textbox.text == textfield.text
+        assert app.current_entry['match'] in textbox.text
+        assert any(name == 'target' for row in textbox._highlights.values() for *_, name in row)
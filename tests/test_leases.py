@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import json
+import threading
+
+from textual_review_app.annotation_store import Annotation, AnnotationStore
+from textual_review_app.queues import LeaseQueue
+
+
+def _save(store, rowid, comment=''):
+    annot = Annotation(rowid)
+    annot.comment = comment
+    store.save(rowid, annot)
+
+
+def test_per_user_annotations(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    shared = AnnotationStore(db_path, user='shared')
+    _save(shared, 0, 'shared')
+    alice = AnnotationStore(db_path, user='alice', per_user=True)
+    bob = AnnotationStore(db_path, user='bob', per_user=True)
+    _save(alice, 1, 'alice')
+    _save(bob, 1, 'bob')
+    assert alice.get(1).comment == 'alice'
+    assert bob.get(1).comment == 'bob'
+    assert not alice.exists(0)
+    assert alice.count_reviewed() == 1
+    assert alice.count_reviewed_all() == 2
+    assert shared.get(1).comment == ''
+    assert {user: counts['reviewed'] for user, counts in alice.progress().items()} == {'': 1, 'alice': 1, 'bob': 1}
+
+    export_path = alice.export(out_path=tmp_path / 'export.jsonl')
+    users = sorted((row['row'], row['user']) for row in map(json.loads, export_path.read_text().splitlines()))
+    assert users == [(0, 'shared'), (1, 'alice'), (1, 'bob')]  # shared annotations are attributed to who saved them
+
+    alice.user = 'bob'
+    assert alice.get(1).comment == 'bob'
+    for store in (shared, alice, bob):
+        store.close()
+
+
+def test_leases_do_not_overlap_and_expire(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    alice = AnnotationStore(db_path, user='alice', per_user=True)
+    bob = AnnotationStore(db_path, user='bob', per_user=True, lease_minutes=0)
+    _save(alice, 1)  # reviewed records are never leased
+    assert alice.acquire_leases(3, total=10) == [0, 2, 3]
+    assert alice.acquire_leases(3, total=10) == [0, 2, 3]  # already holds 3
+    assert bob.acquire_leases(3, total=10) == [4, 5, 6]
+
+    # bob's leases expired immediately, so alice's next batch reclaims them before new records
+    _save(alice, 0)
+    _save(alice, 2)
+    assert alice.leased_ids() == [3]
+    assert alice.acquire_leases(4, total=10) == [3, 4, 5, 6]
+    assert bob.next_leased() is None
+
+    assert alice.acquire_leases(8, total=10) == [3, 4, 5, 6, 7, 8, 9]  # runs out of records
+    assert alice.progress()['alice'] == {'reviewed': 3, 'leased': 7}
+    alice.close()
+    bob.close()
+
+
+def test_lease_queue(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.db', user='alice', write_behind=True, flush_interval_ms=60_000)
+    queue = LeaseQueue(store, total=5, size=2)
+    assert queue.next(-1) == 0
+    assert len(queue) == 2
+    assert queue.next(0) == 1
+    _save(store, 0)
+    _save(store, 1)
+    assert queue.previous(2) is None
+    assert queue.next(1) == 2  # next batch
+    assert queue.next(3) == 2  # wraps to the earlier lease
+    _save(store, 2)
+    _save(store, 3)
+    assert queue.next(3) == 4
+    _save(store, 4)
+    assert queue.next(4) is None
+    store.close()
+
+
+def test_lease_queue_refills_in_background(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.db', user='alice', write_behind=True, flush_interval_ms=60_000)
+    queue = LeaseQueue(store, total=20, size=4, refill_at=2)
+    threads = []
+    acquire_leases = store.acquire_leases
+
+    def record_thread(n, total):
+        threads.append(threading.current_thread().name)
+        return acquire_leases(n, total)
+
+    store.acquire_leases = record_thread
+    assert queue.next(-1) == 0  # the first batch is leased on the spot
+    _save(store, 0)
+    assert queue.next(0) == 1
+    assert queue._refill is None
+    _save(store, 1)
+    assert queue.next(1) == 2  # 2 left: the next batch is leased in the background
+    queue._refill.result()
+    assert store.leased_ids() == [2, 3, 4, 5]
+    assert threads[0] == threading.current_thread().name
+    assert threads[1].startswith('lease-refill')
+    for rowid in range(2, 6):
+        _save(store, rowid)
+        assert queue.next(rowid) == rowid + 1
+    assert len(threads) == 3  # the batches after the first were all leased in the background
+    assert all(name.startswith('lease-refill') for name in threads[1:])
+    store.close()
+
+
+def test_lease_reads_do_not_wait_for_writes(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.db', user='alice', write_behind=True, flush_interval_ms=60_000)
+    queue = LeaseQueue(store, total=10, size=4)
+    assert queue.next(-1) == 0
+    _save(store, 0)  # pending: skipped, though not yet written
+    results = []
+    with store._flush_lock:  # held by a flush or a background `acquire_leases`
+        reader = threading.Thread(target=lambda: results.extend(
+            [store.next_leased(-1), store.previous_leased(3), len(queue), store.leased_ids()]))
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+    assert results == [1, 2, 3, [1, 2, 3]]
+    store.close()
+
+
+def test_restore_leases_records_again(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.db', user='alice')
+    _save(store, 1)
+    assert store.acquire_leases(3, total=10) == [0, 2, 3]
+    previous = store.save_many({rowid: Annotation(rowid) for rowid in (0, 1, 2)})
+    assert store.leased_ids() == [3]
+    store.restore(previous)
+    assert store.leased_ids() == [0, 2, 3]  # behind the lease cursor, so they wouldn't be leased again
+    assert store.acquire_leases(3, total=10) == [0, 2, 3]
+    store.close()
+
+
+def test_concurrent_leases(tmp_path):
+    db_path = tmp_path / 'annotations.db'
+    AnnotationStore(db_path).close()  # create the schema once
+    leased = {}
+
+    def work(user):
+        store = AnnotationStore(db_path, user=user, per_user=True)
+        rows = []
+        for _ in range(10):
+            batch = store.acquire_leases(5, total=1000)
+            rows.extend(batch)
+            for rowid in batch:
+                _save(store, rowid)
+        leased[user] = rows
+        store.close()
+
+    threads = [threading.Thread(target=work, args=(f'user{i}',)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    rows = [rowid for user_rows in leased.values() for rowid in user_rows]
+    assert len(rows) == 8 * 50
+    assert len(set(rows)) == len(rows)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from textual.app import App
+from textual.widgets import DataTable
+
+from textual_review_app.corpus import CacheInfo
+from textual_review_app.profiling import PROFILER, Profiler, percentile, timed
+from textual_review_app.widgets.diagnostics_modal import DiagnosticsModal
+
+
+@pytest.fixture
+def profiler():
+    enabled = PROFILER.enabled
+    PROFILER.reset()
+    PROFILER.enable()
+    yield PROFILER
+    PROFILER.enabled = enabled
+    PROFILER.reset()
+
+
+def test_percentiles_over_window():
+    profiler = Profiler(window=100)
+    for ms in range(1, 201):
+        profiler.record('stage', 0.0, ms / 1000)
+    stats = profiler.summary()['stage']
+    assert stats['count'] == 200
+    assert stats['max'] == pytest.approx(200)
+    assert stats['mean'] == pytest.approx(100.5)
+    # only the last 100 durations (101..200 ms)
+    assert stats['p50'] == pytest.approx(151)
+    assert stats['p99'] == pytest.approx(200)
+    assert percentile([], 0.5) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_timed_functions(profiler):
+    @timed('sync')
+    def add(a, b):
+        return a + b
+
+    @timed('async')
+    async def double(a):
+        return a * 2
+
+    @timed('generator')
+    def compose():
+        yield 1
+        yield 2
+
+    assert add(1, 2) == 3
+    assert await double(2) == 4
+    assert list(compose()) == [1, 2]
+    assert {stage: stats['count'] for stage, stats in profiler.summary().items()} == {
+        'async': 1, 'generator': 1, 'sync': 1,
+    }
+
+    profiler.enabled = False
+    assert add(1, 2) == 3
+    assert profiler.summary()['sync']['count'] == 1
+
+
+def test_dump_trace(profiler, tmp_path):
+    profiler.record('corpus.get', 1.0, 0.002)
+    profiler.record('corpus.get', 2.0, 0.004)
+    path = profiler.dump(tmp_path / 'trace.jsonl')
+    lines = [json.loads(line) for line in path.read_text(encoding='utf8').splitlines()]
+    assert [line['type'] for line in lines] == ['span', 'span', 'summary']
+    assert lines[1]['ms'] == pytest.approx(4)
+    assert lines[2]['count'] == 2
+
+
+@pytest.mark.asyncio
+async def test_diagnostics_modal(profiler):
+    profiler.record('app.save', 0.0, 0.003)
+    app = App()
+    async with app.run_test() as pilot:
+        await app.push_screen(DiagnosticsModal(CacheInfo(3, 1, 2, 4, 128), pending=5))
+        await pilot.pause()
+        table = app.screen.query_one('#profile-table', DataTable)
+        assert table.row_count == 1
+        assert table.get_row_at(0)[:2] == ['app.save', '1']
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from textual_review_app.annotation_store import Annotation, AnnotationStore
+from textual_review_app.queues import CategoryIndex, FlaggedQueue, OptionQueue, UnreviewedQueue
+
+EXAMPLE_WKSP = Path(__file__).resolve().parents[1] / 'example' / 'wksp'
+
+
+def _save(store, rowid, selected=(), flagged=False):
+    annot = Annotation(rowid)
+    annot.selected = list(selected)
+    annot.flagged = flagged
+    store.save(rowid, annot)
+
+
+def test_annotation_queues(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.db')
+    for rowid in [0, 1, 2, 4, 9]:
+        _save(store, rowid, selected=['Relevant'] if rowid % 2 == 0 else [], flagged=rowid in (1, 9))
+
+    unreviewed = UnreviewedQueue(store, total=10)
+    assert len(unreviewed) == 5
+    assert unreviewed.next(-1) == 3
+    assert unreviewed.next(3) == 5
+    assert unreviewed.next(8) is None
+    assert unreviewed.previous(3) is None
+    assert unreviewed.previous(9) == 8
+
+    flagged = FlaggedQueue(store)
+    assert (flagged.next(-1), flagged.next(1), flagged.next(9)) == (1, 9, None)
+    assert (flagged.previous(9), flagged.previous(1)) == (1, None)
+
+    relevant = OptionQueue(store, 'Relevant')
+    assert len(relevant) == 3
+    assert (relevant.next(-1), relevant.next(2), relevant.next(4)) == (0, 4, None)
+    assert relevant.previous(4) == 2
+
+    # queues reflect new saves
+    _save(store, 3, selected=['Relevant'], flagged=True)
+    assert unreviewed.next(-1) == 5
+    assert flagged.next(1) == 3
+    assert relevant.next(2) == 3
+    store.close()
+
+
+def test_category_index(tmp_path):
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    corpus_path.write_bytes((EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_bytes())
+    categories = [json.loads(line)['category'] for line in corpus_path.read_text(encoding='utf8').splitlines()]
+    index = CategoryIndex(corpus_path)
+    assert set(index.categories) == set(categories)
+    for category in index.categories:
+        assert list(index.rows(category)) == [i for i, c in enumerate(categories) if c == category]
+    index.close()
+
+    index = CategoryIndex(corpus_path)
+    assert index._mmap is not None
+    category = categories[10]
+    queue = index.queue(category)
+    expected = [i for i, c in enumerate(categories) if c == category]
+    assert queue.next(-1) == expected[0]
+    assert queue.next(expected[0]) == expected[1]
+    assert queue.previous(expected[1]) == expected[0]
+    assert queue.next(expected[-1]) is None
+    del queue
+    index.close()
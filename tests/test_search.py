@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+import search
+
+EXAMPLE_WKSP = Path(__file__).resolve().parents[1] / 'example' / 'wksp'
+
+
+@pytest.fixture()
+def search_workspace(tmp_path: Path) -> Path:
+    for name in ['corpus.jsonl', 'patterns.txt']:
+        (tmp_path / name).write_bytes((EXAMPLE_WKSP / name).read_bytes())
+    return tmp_path
+
+
+def test_shard_offsets_align_to_lines(search_workspace):
+    corpus_file = search_workspace / 'corpus.jsonl'
+    shards = search.shard_offsets(corpus_file, 7)
+    assert shards[0][0] == 0
+    assert shards[-1][1] == corpus_file.stat().st_size
+    data = corpus_file.read_bytes()
+    for start, end in shards:
+        assert start < end
+        assert start == 0 or data[start - 1:start] == b'\n'
+
+
+@pytest.mark.parametrize('workers', [2, 5])
+def test_parallel_search_matches_serial(search_workspace, workers):
+    corpus_file = search_workspace / 'corpus.jsonl'
+    pattern_file = search_workspace / 'patterns.txt'
+    out_path = search.search(pattern_file, corpus_file)
+    expected = out_path.read_bytes()
+    assert expected
+
+    out_path = search.search(pattern_file, corpus_file, workers=workers)
+    assert out_path.read_bytes() == expected
+    # temporary shard outputs are removed
+    assert not list(search_workspace.glob('*.part*'))
+
+
+@pytest.mark.parametrize('regex, expected', [
+    (r'\b(?:jealous|env[yi])\w*\b', {'jealous', 'env'}),
+    (r'heart\s+attack', {'attack'}),
+    (r'(?i)Death', {'death'}),
+    (r'\d{3}', None),
+    (r'a*', None),
+])
+def test_required_literals(regex, expected):
+    from textual_review_app.regex_utils import required_literals
+    assert required_literals(regex) == expected
+
+
+def test_prefiltered_matcher_matches_pattern_loop(search_workspace):
+    patterns = search.read_patterns(search_workspace / 'patterns.txt') + [
+        ('DIGITS', r'\d{2,}'),
+        ('BACKREF', r'\b(\w)\w*\1\b'),
+        ('ABSENT', r'\bxylophone\b'),
+    ]
+    matcher = search.PatternMatcher(patterns)
+    loop = search.PatternMatcher(patterns, prefilter=False)
+    with open(search_workspace / 'corpus.jsonl', encoding='utf8') as fh:
+        for line in fh:
+            text = json.loads(line)['text']
+            assert list(matcher.finditer(text)) == list(loop.finditer(text))
+
+
+def _rows(path: Path):
+    return [json.loads(line) for line in path.read_text(encoding='utf8').splitlines()]
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_incremental_search_appends_new_patterns_and_documents(search_workspace, workers):
+    corpus_file = search_workspace / 'corpus.jsonl'
+    pattern_file = search_workspace / 'patterns.txt'
+    lines = corpus_file.read_text(encoding='utf8').splitlines(keepends=True)
+    corpus_file.write_text(''.join(lines[:80]), encoding='utf8')
+    out_path = search.search(pattern_file, corpus_file, workers=workers)
+    original = _rows(out_path)
+
+    # nothing changed: nothing appended
+    search.search(pattern_file, corpus_file, workers=workers, incremental=True)
+    assert _rows(out_path) == original
+
+    # add a category and more documents
+    with open(pattern_file, 'a', encoding='utf8') as out:
+        out.write('\nPRISON==\\bprison\\w*\\b\n')
+    corpus_file.write_text(''.join(lines), encoding='utf8')
+    search.search(pattern_file, corpus_file, workers=workers, incremental=True)
+    rows = _rows(out_path)
+    assert rows[:len(original)] == original  # existing row numbers are stable
+
+    expected = _rows(search.search(pattern_file, corpus_file))
+    key = lambda r: (r['chapter'], r['category'], r['start_index'])
+    assert sorted(rows, key=key) == sorted(expected, key=key)
+    assert json.loads(search.manifest_path(out_path).read_text())['rows'] == len(expected)
+
+
+def test_incremental_search_without_trailing_newline(search_workspace):
+    corpus_file = search_workspace / 'corpus.jsonl'
+    pattern_file = search_workspace / 'patterns.txt'
+    lines = corpus_file.read_text(encoding='utf8').splitlines(keepends=True)
+    corpus_file.write_text(''.join(lines[:80]).rstrip('\n'), encoding='utf8')
+    out_path = search.search(pattern_file, corpus_file)
+    corpus_file.write_text(''.join(lines), encoding='utf8')  # the appended text starts with the newline
+    search.search(pattern_file, corpus_file, incremental=True)
+    assert _rows(out_path) == _rows(search.search(pattern_file, corpus_file))
+
+    corpus_file.write_text(''.join(lines).rstrip('\n'), encoding='utf8')
+    search.search(pattern_file, corpus_file)
+    with open(corpus_file, 'a', encoding='utf8') as out:
+        out.write(lines[0])  # joined onto the last document
+    with pytest.raises(ValueError, match='has changed'):
+        search.search(pattern_file, corpus_file, incremental=True)
+
+
+def test_incremental_search_rebuilds_after_pattern_change(search_workspace):
+    corpus_file = search_workspace / 'corpus.jsonl'
+    pattern_file = search_workspace / 'patterns.txt'
+    out_path = search.search(pattern_file, corpus_file)
+    patterns = pattern_file.read_text(encoding='utf8').splitlines()
+    pattern_file.write_text('\n'.join(patterns[1:] + ['PRISON==\\bprison\\w*\\b']) + '\n', encoding='utf8')
+    search.search(pattern_file, corpus_file, incremental=True)
+    assert _rows(out_path) == _rows(search.search(pattern_file, corpus_file))
+
+
+def test_incremental_search_rejects_modified_corpus(search_workspace):
+    corpus_file = search_workspace / 'corpus.jsonl'
+    pattern_file = search_workspace / 'patterns.txt'
+    search.search(pattern_file, corpus_file)
+    lines = corpus_file.read_text(encoding='utf8').splitlines(keepends=True)
+    corpus_file.write_text(''.join(lines[1:]), encoding='utf8')
+    with pytest.raises(ValueError, match='has changed'):
+        search.search(pattern_file, corpus_file, incremental=True)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+
+import pytest
+
+from textual_review_app.corpus import Corpus
+from textual_review_app.search_index import SearchIndex, record_text
+
+EXAMPLE_WKSP = Path(__file__).resolve().parents[1] / 'example' / 'wksp'
+
+
+@pytest.fixture()
+def corpus(tmp_path: Path):
+    corpus_path = tmp_path / 'corpus.pattern.jsonl'
+    corpus_path.write_bytes((EXAMPLE_WKSP / 'corpus.pattern.jsonl').read_bytes())
+    corpus = Corpus(corpus_path, prefetch=0)
+    yield corpus
+    corpus.close()
+
+
+@pytest.mark.parametrize('regex', [
+    r'\bjealous\w*', r'heart\s+attack', r'env(?:y|ious)', r'\d{2,}', r'prison', r'xylophone', r'the\b',
+])
+def test_search_matches_full_scan(corpus, regex):
+    index = SearchIndex(corpus)
+    expected = [i for i in range(len(corpus)) if re.search(regex, record_text(corpus[i]), re.I | re.M)]
+    assert [rowid for rowid, _ in index.search(regex, limit=len(corpus))] == expected
+    candidates = index.candidates(regex)
+    assert candidates is None or set(expected) <= set(candidates)
+    index.close()
+
+
+def test_search_starts_at_row_and_wraps(corpus):
+    index = SearchIndex(corpus)
+    rows = [rowid for rowid, _ in index.search('jealous', limit=len(corpus))]
+    start = rows[3] + 1
+    assert [rowid for rowid, _ in index.search('jealous', start=start, limit=len(corpus))] == rows[4:] + rows[:4]
+    assert len(index.search('jealous', limit=2)) == 2
+    with pytest.raises(re.error):
+        index.search('(unclosed')
+    index.close()
+
+
+def test_search_index_is_persisted_and_rebuilt(corpus):
+    index = SearchIndex(corpus)
+    expected = index.search('prison', limit=len(corpus))
+    index.close()
+    assert index.index_path.exists()
+
+    index = SearchIndex(corpus)
+    assert index._mmap is not None
+    assert index.search('prison', limit=len(corpus)) == expected
+    index.close()
+    corpus.close()
+
+    with open(corpus.corpus_path, 'a', encoding='utf8') as out:
+        out.write(json.dumps({'precontext': '', 'match': 'xylophone', 'postcontext': ''}) + '\n')
+    corpus = Corpus(corpus.corpus_path, prefetch=0)
+    index = SearchIndex(corpus)
+    assert index.search('xylophone') == [(len(corpus) - 1, 'xylophone')]
+    index.close()
+    corpus.close()
+
+
+@pytest.mark.parametrize('end', ['offsets', 'postings'])
+def test_truncated_search_index_is_rebuilt(corpus, end):
+    index = SearchIndex(corpus)
+    expected = index.search('prison', limit=len(corpus))
+    index.close()
+    data = index.index_path.read_bytes()
+    _, _, _, n_tokens, n_postings = SearchIndex.HEADER.unpack_from(data)
+    postings_pos = SearchIndex.HEADER.size + (n_tokens + 1) * 8
+    # cut mid-element, so the truncated array can't be cast
+    index.index_path.write_bytes(data[:postings_pos - 3 if end == 'offsets' else postings_pos + n_postings * 4 - 1])
+
+    index = SearchIndex(corpus)
+    assert index.search('prison', limit=len(corpus)) == expected
+    index.close()
+    assert index.index_path.read_bytes() == data